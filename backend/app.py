@@ -1,18 +1,27 @@
 import os
+import click
 from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from datetime import timedelta
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from models.user import db
+from models.rollup import SalesRollup
 from routes.auth import auth_bp
 from routes.products import products_bp
-from routes.cart import cart_bp
+from routes.cart import cart_bp, release_discarded_carts
 from routes.checkout import checkout_bp
 from routes.reports import reports_bp
 from routes.refunds import refund_bp
 from routes.settings import settings_bp
 from utils.db import init_db, seed_database
+from utils.cart_store import init_cart_store
+from utils.product_cache import init_product_cache
+from utils.receipt_queue import init_receipt_queue
+from utils.payment_gateway import init_payment_gateway
+from utils.id_generator import init_id_generator
+from utils.metrics import init_metrics
+from utils.audit_sink import init_audit_sink
 
 # Load environment variables
 load_dotenv()
@@ -47,12 +56,78 @@ else:
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Cart storage: 'memory' (single worker), 'sqlite' (workers on one host) or 'redis' (any number of nodes)
+app.config['CART_STORE'] = os.environ.get('CART_STORE', 'memory')
+app.config['CART_STORE_URL'] = os.environ.get('CART_STORE_URL')
+if app.config['CART_STORE'] == 'sqlite' and not app.config['CART_STORE_URL']:
+    app.config['CART_STORE_URL'] = os.path.join(database_dir, 'carts.db')
+
+# Abandoned carts: expire after CART_IDLE_TTL seconds without changes or CART_MAX_AGE seconds in total,
+# and keep at most CART_MAX_COUNT carts (least recently changed are evicted first)
+app.config['CART_IDLE_TTL'] = int(os.environ.get('CART_IDLE_TTL', 4 * 60 * 60))
+app.config['CART_MAX_AGE'] = int(os.environ.get('CART_MAX_AGE', 24 * 60 * 60))
+app.config['CART_MAX_COUNT'] = int(os.environ.get('CART_MAX_COUNT', 10000))
+
+# Write-ahead journal so in-memory carts survive a worker restart (memory backend only)
+app.config['CART_JOURNAL'] = os.environ.get('CART_JOURNAL')
+
+# Directory receipt PDFs are written to (relative to the working directory)
+app.config['RECEIPT_DIR'] = os.environ.get('RECEIPT_DIR', 'receipts')
+
+# Receipt PDF worker threads (0 renders inline) and how many receipts may wait before checkout stops queueing
+app.config['RECEIPT_WORKERS'] = int(os.environ.get('RECEIPT_WORKERS', 2))
+app.config['RECEIPT_QUEUE_SIZE'] = int(os.environ.get('RECEIPT_QUEUE_SIZE', 100))
+
+# Multiplier on the simulated card/UPI/refund processing times (0 for instant answers in development)
+app.config['PAYMENT_LATENCY_SCALE'] = float(os.environ.get('PAYMENT_LATENCY_SCALE', 1.0))
+
+# Terminal/process id (0-1023) embedded in transaction and refund numbers; give every worker on every
+# host its own id. Unset derives one from the process id, which is only unique on a single host.
+app.config['WORKER_ID'] = int(os.environ['WORKER_ID']) if os.environ.get('WORKER_ID') else None
+
+# Most offline sales a terminal may send in one POST /api/checkout/sync request
+app.config['SYNC_MAX_SALES'] = int(os.environ.get('SYNC_MAX_SALES', 500))
+
+# Audit log writes: 'async' buffers entries and inserts them in batches from a background thread
+# (every AUDIT_FLUSH_INTERVAL seconds or AUDIT_BATCH_SIZE entries); 'sync' commits each entry as it is logged
+app.config['AUDIT_LOG_MODE'] = os.environ.get('AUDIT_LOG_MODE', 'async')
+app.config['AUDIT_BATCH_SIZE'] = int(os.environ.get('AUDIT_BATCH_SIZE', 100))
+app.config['AUDIT_FLUSH_INTERVAL'] = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0))
+
+# Send per-stage checkout/refund/void timings in a Server-Timing response header (browser dev tools show them)
+app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING', 'False').lower() == 'true'
+
+# Answer sales reports covering whole hours from the hourly rollup table instead of scanning transactions
+app.config['REPORTS_FROM_ROLLUPS'] = os.environ.get('REPORTS_FROM_ROLLUPS', 'True').lower() == 'true'
+
+# Seconds a checkout/refund/void Idempotency-Key and its stored response are kept for retries
+app.config['IDEMPOTENCY_TTL'] = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+# Seconds that stock stays held for a cart line after its last change (0 disables reservations).
+# Off by default: each scan then costs a locked DB write transaction instead of a cache read.
+# While off, add-to-cart checks the cached stock level only; checkout's locked check decides.
+app.config['STOCK_RESERVATION_TTL'] = int(os.environ.get('STOCK_RESERVATION_TTL', 0))
+
+# Product lookup cache for the scan path (products kept, seconds before a cached stock level is re-read)
+app.config['PRODUCT_CACHE_SIZE'] = int(os.environ.get('PRODUCT_CACHE_SIZE', 5000))
+app.config['PRODUCT_CACHE_TTL'] = int(os.environ.get('PRODUCT_CACHE_TTL', 60))
+
+# Cross-check running cart totals against a full recompute on every read (tests/debugging)
+app.config['CART_VERIFY_TOTALS'] = os.environ.get('CART_VERIFY_TOTALS', 'False').lower() == 'true'
+
 # Initialize extensions
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 jwt = JWTManager(app)
 
 # Initialize database
 init_db(app)
+init_cart_store(app, on_discard=release_discarded_carts)
+init_product_cache(app)
+init_metrics(app)
+init_audit_sink(app)
+init_receipt_queue(app)
+init_payment_gateway(app)
+init_id_generator(app)
 
 # Seed database if empty
 with app.app_context():
@@ -70,6 +145,18 @@ app.register_blueprint(refund_bp)
 app.register_blueprint(settings_bp)
 
 
+# Rebuild sales rollups: flask --app app backfill-rollups [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+@app.cli.command('backfill-rollups')
+@click.option('--since', help='First day to rebuild (default: oldest transaction)')
+@click.option('--until', help='Last day to rebuild (default: newest transaction)')
+def backfill_rollups(since, until):
+    """Recompute the hourly sales rollups from transactions"""
+    start = datetime.strptime(since, '%Y-%m-%d') if since else None
+    end = datetime.strptime(until, '%Y-%m-%d') + timedelta(days=1) if until else None
+    counted = SalesRollup.rebuild(start, end)
+    print(f"✓ Rolled up {counted} transactions")
+
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
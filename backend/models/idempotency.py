@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models.user import db
+
+
+class IdempotencyKey(db.Model):
+    """Client-supplied Idempotency-Key of a write request and the response it produced"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'endpoint', 'key', name='uq_idempotency_user_endpoint_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    endpoint = db.Column(db.String(255), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, done
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    @staticmethod
+    def claim(user_id, endpoint, key, request_hash, ttl_seconds):
+        """
+        Record that a keyed request has started, unless the key is already known
+
+        The in-progress row is committed before the request runs so a
+        concurrent retry on another worker finds it (or loses the insert race
+        on the unique constraint).
+
+        Returns:
+            tuple: (record, is_new) where record is the stored key row
+        """
+        now = datetime.utcnow()
+        IdempotencyKey.query.filter(IdempotencyKey.expires_at <= now).delete(synchronize_session=False)
+
+        record = IdempotencyKey.query.filter_by(user_id=user_id, endpoint=endpoint, key=key).first()
+        if record:
+            db.session.commit()
+            return record, False
+
+        record = IdempotencyKey(
+            user_id=user_id,
+            endpoint=endpoint,
+            key=key,
+            request_hash=request_hash,
+            expires_at=now + timedelta(seconds=ttl_seconds)
+        )
+        db.session.add(record)
+        try:
+            db.session.commit()
+            return record, True
+        except IntegrityError:
+            db.session.rollback()
+            record = IdempotencyKey.query.filter_by(user_id=user_id, endpoint=endpoint, key=key).first()
+            return record, False
+
+    def to_dict(self):
+        """Convert key record to dictionary"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'endpoint': self.endpoint,
+            'key': self.key,
+            'status': self.status,
+            'status_code': self.status_code,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy.orm.attributes import set_committed_value
 from models.user import db
 
 
@@ -23,6 +24,61 @@ class Product(db.Model):
     # Relationships
     transaction_items = db.relationship('TransactionItem', back_populates='product', lazy='dynamic')
     
+    @staticmethod
+    def lock_many(product_ids):
+        """
+        Load several products in one IN query, row-locked until commit
+        
+        Rows are locked in id order so concurrent checkouts cannot deadlock.
+        SELECT ... FOR UPDATE is used on PostgreSQL/MySQL; SQLite ignores it
+        and serializes writers on its own.
+        
+        Returns:
+            dict: product_id -> Product (unknown ids are left out)
+        """
+        ids = sorted(set(product_ids))
+        if not ids:
+            return {}
+        products = Product.query.filter(Product.id.in_(ids)).order_by(Product.id).with_for_update().all()
+        return {product.id: product for product in products}
+    
+    @staticmethod
+    def change_stock(product_id, quantity_change, product=None):
+        """
+        Apply a stock change in one conditional UPDATE
+        
+        A decrement only matches while enough stock is left
+        (stock_quantity >= quantity), so two lanes selling the last units
+        cannot both succeed and no read-modify-write round trip is needed.
+        
+        Args:
+            product_id: Product to change
+            quantity_change: Units to add (positive) or take (negative)
+            product: Loaded Product to keep in step with the new value (optional)
+        
+        Returns:
+            int: Stock quantity after the change, or None if stock was insufficient
+        """
+        stmt = db.update(Product).where(Product.id == product_id).values(
+            stock_quantity=Product.stock_quantity + quantity_change
+        )
+        if quantity_change < 0:
+            stmt = stmt.where(Product.stock_quantity >= -quantity_change)
+        options = {'synchronize_session': False}
+        
+        if db.engine.dialect.update_returning:
+            new_quantity = db.session.execute(stmt.returning(Product.stock_quantity), execution_options=options).scalar()
+        else:
+            if db.session.execute(stmt, execution_options=options).rowcount == 0:
+                return None
+            new_quantity = db.session.execute(
+                db.select(Product.stock_quantity).where(Product.id == product_id)
+            ).scalar()
+        
+        if product is not None and new_quantity is not None:
+            set_committed_value(product, 'stock_quantity', new_quantity)
+        return new_quantity
+    
     def update_stock(self, quantity_change):
         """Update stock quantity"""
         self.stock_quantity += quantity_change
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from models.user import db
+from models.product import Product
+
+
+class StockReservation(db.Model):
+    """Soft hold on product stock for an open cart, released on checkout, clear or timeout"""
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        db.UniqueConstraint('cart_key', 'product_id', name='uq_reservation_cart_product'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    cart_key = db.Column(db.String(100), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    product = db.relationship('Product')
+
+    @staticmethod
+    def reserved_quantity(product_id, exclude_cart_key=None, now=None):
+        """Total unexpired quantity of a product held by carts (optionally excluding one)"""
+        query = db.session.query(db.func.coalesce(db.func.sum(StockReservation.quantity), 0)).filter(
+            StockReservation.product_id == product_id,
+            StockReservation.expires_at > (now or datetime.utcnow())
+        )
+        if exclude_cart_key:
+            query = query.filter(StockReservation.cart_key != exclude_cart_key)
+        return query.scalar()
+
+    @staticmethod
+    def available_quantity(product, cart_key=None, now=None):
+        """Stock of product not held by other carts"""
+        return product.stock_quantity - StockReservation.reserved_quantity(product.id, cart_key, now)
+
+    @staticmethod
+    def reserve(cart_key, product_id, quantity, ttl_seconds):
+        """
+        Hold quantity of a product for a cart, replacing its previous hold
+
+        Locks the product row (PostgreSQL/MySQL) so two lanes cannot both
+        reserve the last units. Only this line's hold gets a new expiry;
+        checkout re-checks stock for lines whose hold has lapsed. The caller
+        commits (or rolls back on failure).
+
+        Returns:
+            tuple: (reserved, available) where available excludes other carts' holds
+        """
+        now = datetime.utcnow()
+        product = Product.query.filter_by(id=product_id).with_for_update().first()
+        if not product:
+            return False, 0
+
+        # Expired holds on this product no longer count; drop them while the row is locked
+        StockReservation.query.filter(
+            StockReservation.product_id == product_id,
+            StockReservation.expires_at <= now
+        ).delete(synchronize_session=False)
+
+        available = StockReservation.available_quantity(product, cart_key, now)
+        if quantity > available:
+            return False, available
+
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        reservation = StockReservation.query.filter_by(cart_key=cart_key, product_id=product_id).first()
+        if reservation is None:
+            reservation = StockReservation(cart_key=cart_key, product_id=product_id)
+            db.session.add(reservation)
+        reservation.quantity = quantity
+        reservation.expires_at = expires_at
+
+        return True, available
+
+    @staticmethod
+    def release(cart_key, product_id=None):
+        """Drop the holds of a cart (all of them, or one product). The caller commits."""
+        query = StockReservation.query.filter_by(cart_key=cart_key)
+        if product_id is not None:
+            query = query.filter_by(product_id=product_id)
+        return query.delete(synchronize_session=False)
+
+    @staticmethod
+    def active_for_cart(cart_key, now=None):
+        """Map of product_id -> quantity currently held by a cart"""
+        rows = StockReservation.query.filter(
+            StockReservation.cart_key == cart_key,
+            StockReservation.expires_at > (now or datetime.utcnow())
+        ).with_entities(StockReservation.product_id, StockReservation.quantity).all()
+        return {product_id: quantity for product_id, quantity in rows}
+
+    def to_dict(self):
+        """Convert reservation to dictionary"""
+        return {
+            'id': self.id,
+            'cart_key': self.cart_key,
+            'product_id': self.product_id,
+            'quantity': self.quantity,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
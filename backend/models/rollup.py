@@ -0,0 +1,318 @@
+from datetime import datetime, timedelta
+from models.user import db
+from models.product import Product
+from models.transaction import Transaction, TransactionItem
+
+# Counters of a rollup row; every one is a sum, so rows combine by adding
+MEASURES = (
+    'transaction_count', 'completed_count', 'sales_count', 'refunds_count',
+    'sales_cents', 'refunds_cents', 'tax_cents', 'discount_cents',
+    'quantity', 'revenue_cents'
+)
+KEY = ('grain', 'bucket', 'user_id', 'payment_method', 'category', 'product_id')
+
+# Bucket sizes every transaction is counted in, finest first
+GRAINS = ('hour', 'day', 'month')
+# Product id (and category) of rows counting whole transactions rather than one product
+NO_PRODUCT = 0
+NO_CATEGORY = ''
+# Payment method of product rows, which are not split by it
+ANY_PAYMENT = ''
+
+
+def _field(row, name):
+    """Read a column from a model instance or a bulk_insert row dict"""
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def hour_of(moment):
+    """Start of the hourly bucket a timestamp falls in"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_of(moment):
+    """Start of the daily bucket (UTC day) a timestamp falls in"""
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def month_of(moment):
+    """Start of the monthly bucket (UTC month) a timestamp falls in"""
+    return day_of(moment).replace(day=1)
+
+
+def next_month(moment):
+    """Start of the month after the one a timestamp falls in"""
+    start = month_of(moment)
+    return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+
+# Grain -> (start of the bucket a timestamp falls in, first boundary at or after it)
+BUCKETS = {
+    'hour': (hour_of, lambda moment: moment if moment == hour_of(moment) else hour_of(moment) + timedelta(hours=1)),
+    'day': (day_of, lambda moment: moment if moment == day_of(moment) else day_of(moment) + timedelta(days=1)),
+    'month': (month_of, lambda moment: moment if moment == month_of(moment) else next_month(moment))
+}
+
+
+def bucket_ranges(start, end):
+    """
+    Fewest rollup buckets exactly covering [start, end), which must be hour boundaries
+
+    Whole months are taken as monthly buckets, whole days around them as
+    daily buckets and the remaining hours as hourly buckets.
+
+    Returns:
+        list: (grain, from, to) ranges of bucket starts, to exclusive
+    """
+    def cover(lo, hi, level):
+        grain = GRAINS[level]
+        if level == 0:
+            return [(grain, lo, hi)] if lo < hi else []
+        floor, ceil = BUCKETS[grain]
+        inner_lo, inner_hi = ceil(lo), floor(hi)
+        if inner_lo >= inner_hi:
+            return cover(lo, hi, level - 1)
+        return cover(lo, inner_lo, level - 1) + [(grain, inner_lo, inner_hi)] + cover(inner_hi, hi, level - 1)
+    return cover(start, end, len(GRAINS) - 1)
+
+
+class SalesRollup(db.Model):
+    """
+    Hourly, daily and monthly sales totals by cashier, payment method, category and product
+
+    Maintained in the same database transaction as the sales, refunds and
+    voids it counts, so GET /api/reports/sales can sum a few rows per month
+    or day instead of scanning transactions and their items. Every
+    transaction is counted once in each grain.
+
+    Two kinds of row share the table:
+      - product_id 0: whole-transaction counters (counts, sales, refunds,
+        tax, discounts) of the transactions in the bucket, by payment method
+      - product_id > 0: quantity and revenue of one product, under the
+        product's category, in completed sales (sales_count is then the
+        number of item lines). Not split by payment method, which would
+        multiply these rows for no report.
+
+    Categories are taken when the sale is recorded; run
+    `flask backfill-rollups` after recategorising products to restate
+    history.
+    """
+    __tablename__ = 'sales_rollups'
+    __table_args__ = (
+        db.UniqueConstraint(*KEY, name='uq_sales_rollups_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    grain = db.Column(db.String(5), nullable=False)  # 'hour', 'day' or 'month'
+    bucket = db.Column(db.DateTime, nullable=False)  # Start of the hour/day/month (UTC)
+    user_id = db.Column(db.Integer, nullable=False)
+    payment_method = db.Column(db.String(20), nullable=False)  # 'unknown' when not set, '' on product rows
+    category = db.Column(db.String(100), nullable=False, default=NO_CATEGORY)
+    product_id = db.Column(db.Integer, nullable=False, default=NO_PRODUCT)
+
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)  # Any status
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    refunds_count = db.Column(db.Integer, nullable=False, default=0)
+    sales_cents = db.Column(db.Integer, nullable=False, default=0)
+    refunds_cents = db.Column(db.Integer, nullable=False, default=0)  # Positive amounts
+    tax_cents = db.Column(db.Integer, nullable=False, default=0)  # Of completed sales
+    discount_cents = db.Column(db.Integer, nullable=False, default=0)  # Of completed sales
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue_cents = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def contributions(transaction, items, categories, sign=1, status=None):
+        """
+        Counters a transaction adds to its rollup rows
+
+        Args:
+            transaction: Transaction or transaction row dict
+            items: Its TransactionItems or item row dicts
+            categories: Dict of product_id -> category
+            sign: 1 to add the transaction, -1 to take it out
+            status: Status to count it under (defaults to its current one)
+
+        Returns:
+            dict: Rollup key -> {measure: delta}
+        """
+        status = status or _field(transaction, 'status')
+        completed = status == 'completed'
+        is_sale = completed and _field(transaction, 'transaction_type') == 'sale'
+        is_refund = completed and _field(transaction, 'transaction_type') == 'refund'
+        total = _field(transaction, 'total_cents') or 0
+        totals = {
+            'transaction_count': 1,
+            'completed_count': int(completed),
+            'sales_count': int(is_sale),
+            'refunds_count': int(is_refund),
+            'sales_cents': total if is_sale else 0,
+            'refunds_cents': abs(total) if is_refund else 0,
+            'tax_cents': (_field(transaction, 'tax_cents') or 0) if is_sale else 0,
+            'discount_cents': (_field(transaction, 'discount_cents') or 0) if is_sale else 0
+        }
+        created_at = _field(transaction, 'created_at')
+        buckets = {grain: floor(created_at) for grain, (floor, _) in BUCKETS.items()}
+        user_id = _field(transaction, 'user_id')
+
+        rows = {}
+
+        def add(payment_method, category, product_id, measures):
+            for grain in GRAINS:
+                row = rows.setdefault((grain, buckets[grain], user_id, payment_method, category, product_id), {})
+                for measure, value in measures.items():
+                    row[measure] = row.get(measure, 0) + sign * value
+
+        add(_field(transaction, 'payment_method') or 'unknown', NO_CATEGORY, NO_PRODUCT, totals)
+        if is_sale:
+            for item in items:
+                product_id = _field(item, 'product_id')
+                add(ANY_PAYMENT, categories.get(product_id) or NO_CATEGORY, product_id, {
+                    'sales_count': 1,
+                    'quantity': _field(item, 'quantity'),
+                    'revenue_cents': _field(item, 'line_total_cents')
+                })
+        return rows
+
+    @staticmethod
+    def categories_of(items, products=None):
+        """Categories of the products of some items, reusing already loaded products"""
+        products = products or {}
+        product_ids = {_field(item, 'product_id') for item in items}
+        categories = {product_id: products[product_id].category for product_id in product_ids if product_id in products}
+        missing = product_ids - set(categories)
+        if missing:
+            categories.update(db.session.query(Product.id, Product.category).filter(Product.id.in_(missing)).all())
+        return categories
+
+    @staticmethod
+    def merge(total, rows):
+        """Add one contributions() result into another"""
+        for key, measures in rows.items():
+            row = total.setdefault(key, {})
+            for measure, value in measures.items():
+                row[measure] = row.get(measure, 0) + value
+        return total
+
+    @staticmethod
+    def apply(rows):
+        """
+        Add counters to their rollup rows, creating missing rows
+
+        One INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE for all rows, in
+        key order so concurrent checkouts lock shared rows in the same order.
+        Runs in the caller's transaction.
+        """
+        params = []
+        for key in sorted(rows):
+            measures = rows[key]
+            if not any(measures.values()):
+                continue
+            params.append({**dict(zip(KEY, key)), **{measure: measures.get(measure, 0) for measure in MEASURES}})
+        if not params:
+            return 0
+
+        dialect = db.session.get_bind().dialect.name
+        table = SalesRollup.__table__
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(table)
+            stmt = stmt.on_duplicate_key_update({
+                measure: table.c[measure] + stmt.inserted[measure] for measure in MEASURES
+            })
+        else:
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(KEY),
+                set_={measure: table.c[measure] + stmt.excluded[measure] for measure in MEASURES}
+            )
+        db.session.execute(stmt, params)
+        return len(params)
+
+    @staticmethod
+    def record(entries, products=None):
+        """
+        Count new transactions in the rollups (caller commits)
+
+        Args:
+            entries: List of (transaction, items) with transactions already flushed
+                or bulk-inserted, so created_at is set
+            products: Optional dict of product_id -> Product already loaded
+        """
+        categories = SalesRollup.categories_of([item for _, items in entries for item in items], products)
+        rows = {}
+        for transaction, items in entries:
+            SalesRollup.merge(rows, SalesRollup.contributions(transaction, items, categories))
+        return SalesRollup.apply(rows)
+
+    @staticmethod
+    def change_status(transaction, items, status, products=None):
+        """
+        Set a transaction's status and move its counters accordingly (caller commits)
+
+        E.g. a voided or refunded sale leaves the sales totals but is still
+        counted in transaction_count.
+        """
+        categories = SalesRollup.categories_of(items, products)
+        rows = SalesRollup.contributions(transaction, items, categories, sign=-1)
+        SalesRollup.merge(rows, SalesRollup.contributions(transaction, items, categories, status=status))
+        transaction.status = status
+        return SalesRollup.apply(rows)
+
+    @staticmethod
+    def rebuild(start=None, end=None):
+        """
+        Recompute the rollups of a period from transactions and their items
+
+        Existing rows of the period are replaced, so it can be rerun at any
+        time. Whole months are rebuilt, one at a time to bound memory,
+        committing each month.
+
+        Args:
+            start: Rebuild from the month of this time (defaults to the oldest transaction)
+            end: Rebuild up to the end of the month of this time (defaults to the newest transaction)
+
+        Returns:
+            int: Transactions counted
+        """
+        first, last = db.session.query(db.func.min(Transaction.created_at), db.func.max(Transaction.created_at)).one()
+        start = month_of(start or first or datetime.utcnow())
+        end = BUCKETS['month'][1](end) if end else (next_month(last) if last else start)
+        categories = dict(db.session.query(Product.id, Product.category).all())
+
+        counted = 0
+        batch_start = start
+        while batch_start < end:
+            batch_end = next_month(batch_start)
+            in_batch = (Transaction.created_at >= batch_start, Transaction.created_at < batch_end)
+            for grain in GRAINS:
+                SalesRollup.query.filter(
+                    SalesRollup.grain == grain, SalesRollup.bucket >= batch_start, SalesRollup.bucket < batch_end
+                ).delete(synchronize_session=False)
+
+            # Plain rows rather than ORM objects: a batch can hold many thousands of items
+            transactions = db.session.query(
+                Transaction.id, Transaction.created_at, Transaction.user_id, Transaction.payment_method,
+                Transaction.transaction_type, Transaction.status, Transaction.total_cents,
+                Transaction.tax_cents, Transaction.discount_cents
+            ).filter(*in_batch).all()
+            items = {}
+            if transactions:
+                for item in db.session.query(
+                    TransactionItem.transaction_id, TransactionItem.product_id,
+                    TransactionItem.quantity, TransactionItem.line_total_cents
+                ).join(Transaction, Transaction.id == TransactionItem.transaction_id).filter(*in_batch):
+                    items.setdefault(item.transaction_id, []).append(item)
+
+            rows = {}
+            for transaction in transactions:
+                SalesRollup.merge(rows, SalesRollup.contributions(transaction, items.get(transaction.id, []), categories))
+            SalesRollup.apply(rows)
+            db.session.commit()
+            counted += len(transactions)
+            batch_start = batch_end
+        return counted
@@ -1,5 +1,6 @@
 from datetime import datetime
 from models.user import db
+from utils.money import to_amount, apply_percentage, line_amounts, dollars_of
 
 
 class Transaction(db.Model):
@@ -12,55 +13,71 @@ class Transaction(db.Model):
     transaction_type = db.Column(db.String(20), nullable=False)  # 'sale', 'refund', 'void'
     status = db.Column(db.String(20), default='pending')  # 'pending', 'completed', 'failed', 'voided'
     
-    # Amounts
-    subtotal = db.Column(db.Float, default=0.0)
-    discount_amount = db.Column(db.Float, default=0.0)
+    # Amounts (stored in cents)
+    subtotal_cents = db.Column(db.Integer, default=0)
+    discount_cents = db.Column(db.Integer, default=0)
     discount_type = db.Column(db.String(20), nullable=True)  # 'percentage', 'fixed'
-    tax_amount = db.Column(db.Float, default=0.0)
-    total_amount = db.Column(db.Float, default=0.0)
+    tax_cents = db.Column(db.Integer, default=0)
+    total_cents = db.Column(db.Integer, default=0)
     
     # Payment details
     payment_method = db.Column(db.String(20), nullable=True)  # 'cash', 'card', 'upi'
     payment_reference = db.Column(db.String(100), nullable=True)
-    amount_paid = db.Column(db.Float, default=0.0)
-    change_given = db.Column(db.Float, default=0.0)
+    amount_paid_cents = db.Column(db.Integer, default=0)
+    change_cents = db.Column(db.Integer, default=0)
     
     # Metadata
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     completed_at = db.Column(db.DateTime, nullable=True)
     refund_reason = db.Column(db.Text, nullable=True)
     authorized_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # For refunds/voids
+    client_id = db.Column(db.String(64), unique=True, nullable=True, index=True)  # Terminal-generated id of an offline sale
     
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id], back_populates='transactions', overlaps='authorizer')
     authorizer = db.relationship('User', foreign_keys=[authorized_by], overlaps='user')
     items = db.relationship('TransactionItem', back_populates='transaction', lazy='dynamic', cascade='all, delete-orphan')
     
+    # Dollar views of the cent columns
+    subtotal = dollars_of('subtotal_cents')
+    discount_amount = dollars_of('discount_cents')
+    tax_amount = dollars_of('tax_cents')
+    total_amount = dollars_of('total_cents')
+    amount_paid = dollars_of('amount_paid_cents')
+    change_given = dollars_of('change_cents')
+    
     def calculate_totals(self):
         """Calculate transaction totals from items"""
-        self.subtotal = sum(item.line_total for item in self.items)
+        items = list(self.items)
+        self.subtotal_cents = sum(item.line_total_cents for item in items)
         
-        # Apply discount
+        # Apply discount (a percentage discount holds the percent until resolved here)
         if self.discount_type == 'percentage':
-            self.discount_amount = self.subtotal * (self.discount_amount / 100)
+            self.discount_cents = apply_percentage(self.subtotal_cents, self.discount_amount)
         
-        amount_after_discount = self.subtotal - self.discount_amount
+        amount_after_discount = self.subtotal_cents - self.discount_cents
         
         # Calculate tax
-        self.tax_amount = sum(item.tax_amount for item in self.items)
+        self.tax_cents = sum(item.tax_cents for item in items)
         
         # Calculate total
-        self.total_amount = amount_after_discount + self.tax_amount
+        self.total_cents = amount_after_discount + self.tax_cents
         
         return {
-            'subtotal': round(self.subtotal, 2),
-            'discount': round(self.discount_amount, 2),
-            'tax': round(self.tax_amount, 2),
-            'total': round(self.total_amount, 2)
+            'subtotal': to_amount(self.subtotal_cents),
+            'discount': to_amount(self.discount_cents),
+            'tax': to_amount(self.tax_cents),
+            'total': to_amount(self.total_cents)
         }
     
-    def to_dict(self, include_items=True):
-        """Convert transaction to dictionary"""
+    def to_dict(self, include_items=True, items=None):
+        """
+        Convert transaction to dictionary
+        
+        Args:
+            include_items: Add the transaction's items
+            items: Items already loaded for it (skips the items query)
+        """
         data = {
             'id': self.id,
             'transaction_number': self.transaction_number,
@@ -73,6 +90,7 @@ class Transaction(db.Model):
             'discount_type': self.discount_type,
             'tax_amount': self.tax_amount,
             'total_amount': self.total_amount,
+            'total_cents': self.total_cents,
             'payment_method': self.payment_method,
             'payment_reference': self.payment_reference,
             'amount_paid': self.amount_paid,
@@ -80,11 +98,12 @@ class Transaction(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
             'refund_reason': self.refund_reason,
-            'authorized_by': self.authorized_by
+            'authorized_by': self.authorized_by,
+            'client_id': self.client_id
         }
         
         if include_items:
-            data['items'] = [item.to_dict() for item in self.items]
+            data['items'] = [item.to_dict() for item in (self.items if items is None else items)]
         
         return data
 
@@ -94,26 +113,31 @@ class TransactionItem(db.Model):
     __tablename__ = 'transaction_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     
     quantity = db.Column(db.Integer, nullable=False)
-    unit_price = db.Column(db.Float, nullable=False)
-    discount_amount = db.Column(db.Float, default=0.0)
+    unit_price_cents = db.Column(db.Integer, nullable=False)
+    discount_cents = db.Column(db.Integer, default=0)
     tax_rate = db.Column(db.Float, default=0.0)
-    tax_amount = db.Column(db.Float, default=0.0)
-    line_total = db.Column(db.Float, nullable=False)
+    tax_cents = db.Column(db.Integer, default=0)
+    line_total_cents = db.Column(db.Integer, nullable=False)
     
     # Relationships
     transaction = db.relationship('Transaction', back_populates='items')
     product = db.relationship('Product', back_populates='transaction_items')
     
+    # Dollar views of the cent columns
+    unit_price = dollars_of('unit_price_cents')
+    discount_amount = dollars_of('discount_cents')
+    tax_amount = dollars_of('tax_cents')
+    line_total = dollars_of('line_total_cents')
+    
     def calculate_line_total(self):
         """Calculate line total including tax"""
-        subtotal = self.unit_price * self.quantity
-        subtotal_after_discount = subtotal - self.discount_amount
-        self.tax_amount = subtotal_after_discount * self.tax_rate
-        self.line_total = subtotal_after_discount + self.tax_amount
+        _, self.tax_cents, self.line_total_cents = line_amounts(
+            self.unit_price_cents, self.quantity, self.tax_rate, self.discount_cents or 0
+        )
         return self.line_total
     
     def to_dict(self):
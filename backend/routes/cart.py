@@ -1,14 +1,15 @@
-from flask import Blueprint, request, jsonify, session
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, session, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from models.user import db
 from models.product import Product
-from datetime import datetime
+from models.reservation import StockReservation
+from utils.cart_store import get_cart_store
+from utils.product_cache import get_product_cache
+from utils.money import to_cents, to_amount, line_amounts, discount_cents
+from datetime import datetime, timedelta
 
 cart_bp = Blueprint('cart', __name__, url_prefix='/api/cart')
 
-# In-memory cart storage (in production, use Redis or database)
-carts = {}
-
 
 def get_cart_key(user_id):
     """Generate cart key for user"""
@@ -16,46 +17,230 @@ def get_cart_key(user_id):
 
 
 def get_user_cart(user_id):
-    """Get or create user cart"""
-    cart_key = get_cart_key(user_id)
-    if cart_key not in carts:
-        carts[cart_key] = {
-            'items': [],
-            'discount': {'type': None, 'amount': 0},
-            'created_at': datetime.utcnow().isoformat()
-        }
-    return carts[cart_key]
+    """Get or create user cart (call save_user_cart after changing it)"""
+    cart = get_cart_store().get(get_cart_key(user_id))
+    
+    # Carts left open longer than CART_MAX_AGE are abandoned, even if recently touched
+    max_age = current_app.config.get('CART_MAX_AGE')
+    if cart is not None and max_age:
+        created_at = datetime.fromisoformat(cart['created_at'])
+        if datetime.utcnow() - created_at > timedelta(seconds=max_age):
+            delete_user_cart(user_id)
+            release_stock(user_id)
+            cart = None
+    
+    if cart is None:
+        cart = new_cart()
+    return cart
 
 
-def calculate_cart_totals(cart):
-    """Calculate cart totals including tax and discounts"""
-    items = cart['items']
-    discount = cart['discount']
+def new_cart():
+    """Build an empty cart"""
+    return {
+        'lines': {},  # cart_item_id -> item, in insertion order
+        'product_index': {},  # product_id -> cart_item_id
+        'next_item_id': 1,
+        'running_totals': {'line_total_cents': 0, 'tax_amount_cents': 0},
+        'version': 0,  # bumped on every save, lets lanes apply deltas in order
+        'discount': {'type': None, 'amount': 0},
+        'created_at': datetime.utcnow().isoformat()
+    }
+
+
+def save_user_cart(user_id, cart):
+    """Write user cart back to the cart store, bumping its version"""
+    cart['version'] += 1
+    get_cart_store().set(get_cart_key(user_id), cart)
+
+
+def delete_user_cart(user_id):
+    """Remove user cart from the cart store"""
+    get_cart_store().delete(get_cart_key(user_id))
+
+
+def reserve_stock(user_id, product, quantity):
+    """
+    Hold stock for a cart line for STOCK_RESERVATION_TTL seconds
     
-    subtotal = sum(item['line_total'] for item in items)
+    Without reservations configured this is a plain stock check. The caller
+    commits on success and rolls back on failure.
+    
+    Returns:
+        tuple: (ok, available)
+    """
+    ttl = current_app.config.get('STOCK_RESERVATION_TTL')
+    if not ttl:
+        return product.is_in_stock(quantity), product.stock_quantity
+    return StockReservation.reserve(get_cart_key(user_id), product.id, quantity, ttl)
+
+
+def release_stock(user_id, product_id=None):
+    """Release the stock held by a user's cart (one product or all)"""
+    if current_app.config.get('STOCK_RESERVATION_TTL'):
+        StockReservation.release(get_cart_key(user_id), product_id)
+        db.session.commit()
+
+
+def release_discarded_carts(cart_keys):
+    """Release the stock held by carts the cart store expired or evicted"""
+    if current_app.config.get('STOCK_RESERVATION_TTL'):
+        StockReservation.query.filter(StockReservation.cart_key.in_(list(cart_keys))).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def get_cart_items(cart):
+    """List cart items in the order they were added"""
+    return list(cart['lines'].values())
+
+
+def find_cart_item(cart, cart_item_id):
+    """Look up a cart line by cart_item_id"""
+    return cart['lines'].get(str(cart_item_id))
+
+
+def find_product_item(cart, product_id):
+    """Look up the cart line holding product_id"""
+    cart_item_id = cart['product_index'].get(str(product_id))
+    return cart['lines'].get(str(cart_item_id)) if cart_item_id else None
+
+
+def price_cart_item(item, quantity):
+    """Set item quantity and recompute its line amounts"""
+    line_subtotal, tax_amount, line_total = line_amounts(to_cents(item['unit_price']), quantity, item['tax_rate'])
+    
+    item['quantity'] = quantity
+    item['line_subtotal'] = to_amount(line_subtotal)
+    item['tax_amount'] = to_amount(tax_amount)
+    item['line_total'] = to_amount(line_total)
+    return item
+
+
+def _track_item(cart, item, sign):
+    """Add (sign=1) or subtract (sign=-1) a line from the running totals"""
+    # Sums are kept in whole cents so they never drift from a full recompute
+    running = cart['running_totals']
+    running['line_total_cents'] += sign * to_cents(item['line_total'])
+    running['tax_amount_cents'] += sign * to_cents(item['tax_amount'])
+
+
+def add_cart_item(cart, item):
+    """Append a new line, assigning it a cart_item_id that is never reused"""
+    item['cart_item_id'] = cart['next_item_id']
+    cart['next_item_id'] += 1
+    cart['lines'][str(item['cart_item_id'])] = item
+    cart['product_index'][str(item['product_id'])] = item['cart_item_id']
+    _track_item(cart, item, 1)
+    return item
+
+
+def set_cart_item_quantity(cart, item, quantity):
+    """Change the quantity of a line already in the cart"""
+    _track_item(cart, item, -1)
+    price_cart_item(item, quantity)
+    _track_item(cart, item, 1)
+    return item
+
+
+def remove_cart_item(cart, cart_item_id):
+    """Remove a line by cart_item_id, returning it (or None if missing)"""
+    item = cart['lines'].pop(str(cart_item_id), None)
+    if item:
+        cart['product_index'].pop(str(item['product_id']), None)
+        _track_item(cart, item, -1)
+    return item
+
+
+def put_product_in_cart(cart, product, quantity):
+    """Set the cart line for product to quantity at the current price, adding it if needed"""
+    existing_item = find_product_item(cart, product.id)
+    if existing_item:
+        existing_item['unit_price'] = product.price
+        existing_item['tax_rate'] = product.tax_rate
+        return set_cart_item_quantity(cart, existing_item, quantity)
+    
+    cart_item = {
+        'product_id': product.id,
+        'barcode': product.barcode,
+        'name': product.name,
+        'unit_price': product.price,
+        'tax_rate': product.tax_rate,
+        'item_discount': 0
+    }
+    return add_cart_item(cart, price_cart_item(cart_item, quantity))
+
+
+def _summarize_cart(cart, subtotal, tax_amount):
+    """Build the totals dict from line sums given in cents"""
+    discount = cart['discount']
     
     # Apply discount
-    discount_amount = 0
-    if discount['type'] == 'percentage':
-        discount_amount = subtotal * (discount['amount'] / 100)
-    elif discount['type'] == 'fixed':
-        discount_amount = min(discount['amount'], subtotal)
+    discount_amount = discount_cents(subtotal, discount['type'], discount['amount'])
     
     amount_after_discount = subtotal - discount_amount
     
-    # Calculate tax
-    tax_amount = sum(item['tax_amount'] for item in items)
-    
     # Calculate total
     total = amount_after_discount + tax_amount
     
     return {
-        'subtotal': round(subtotal, 2),
-        'discount_amount': round(discount_amount, 2),
+        'subtotal': to_amount(subtotal),
+        'discount_amount': to_amount(discount_amount),
         'discount_type': discount['type'],
-        'tax_amount': round(tax_amount, 2),
-        'total': round(total, 2),
-        'item_count': len(items)
+        'tax_amount': to_amount(tax_amount),
+        'total': to_amount(total),
+        'total_cents': total,
+        'item_count': len(cart['lines'])
+    }
+
+
+def recalculate_cart_totals(cart):
+    """Calculate cart totals by summing every line (reference implementation)"""
+    items = get_cart_items(cart)
+    subtotal = sum(to_cents(item['line_total']) for item in items)
+    tax_amount = sum(to_cents(item['tax_amount']) for item in items)
+    return _summarize_cart(cart, subtotal, tax_amount)
+
+
+def calculate_cart_totals(cart):
+    """
+    Calculate cart totals including tax and discounts
+    
+    Uses the running line sums kept up to date by add/set/remove, so the cost
+    does not grow with the number of lines. With CART_VERIFY_TOTALS enabled
+    the result is cross-checked against a full recompute.
+    """
+    running = cart['running_totals']
+    totals = _summarize_cart(cart, running['line_total_cents'], running['tax_amount_cents'])
+    
+    if current_app.config.get('CART_VERIFY_TOTALS'):
+        expected = recalculate_cart_totals(cart)
+        if totals != expected:
+            raise AssertionError(f'Running cart totals {totals} differ from recompute {expected}')
+    
+    return totals
+
+
+def wants_cart_delta():
+    """Check whether the client asked for delta responses (X-Cart-Delta header or ?delta=true)"""
+    flag = request.headers.get('X-Cart-Delta') or request.args.get('delta', '')
+    return flag.lower() in ('1', 'true', 'yes')
+
+
+def build_cart_delta(cart, totals, changed=(), removed=()):
+    """
+    Build a delta response body for a cart mutation
+    
+    Args:
+        cart: Cart after the mutation
+        totals: Result of calculate_cart_totals(cart)
+        changed: Lines added or modified by the mutation
+        removed: cart_item_ids removed by the mutation
+    """
+    return {
+        'version': cart['version'],
+        'changed': list(changed),
+        'removed': list(removed),
+        'discount': cart['discount'],
+        **totals
     }
 
 
@@ -70,8 +255,9 @@ def get_cart():
         
         return jsonify({
             'cart': {
-                'items': cart['items'],
+                'items': get_cart_items(cart),
                 'discount': cart['discount'],
+                'version': cart['version'],
                 **totals
             }
         }), 200
@@ -101,73 +287,165 @@ def add_to_cart():
         if quantity <= 0:
             return jsonify({'error': 'Quantity must be positive'}), 400
         
-        # Find product
+        # Find product (read-through cache, no DB round trip on repeat scans)
         if barcode:
-            product = Product.query.filter_by(barcode=barcode, is_active=True).first()
+            product = get_product_cache().get_by_barcode(barcode)
         elif product_id:
-            product = Product.query.filter_by(id=product_id, is_active=True).first()
+            product = get_product_cache().get_by_id(product_id)
         else:
             return jsonify({'error': 'Barcode or product_id is required'}), 400
         
-        if not product:
+        if not product or not product.is_active:
             return jsonify({'error': 'Product not found'}), 404
         
-        # Check stock
-        if not product.is_in_stock(quantity):
-            return jsonify({
-                'error': 'Insufficient stock',
-                'available': product.stock_quantity
-            }), 400
-        
         # Get cart
         cart = get_user_cart(user_id)
         
         # Check if item already in cart
-        existing_item = next((item for item in cart['items'] if item['product_id'] == product.id), None)
-        
-        if existing_item:
-            # Update quantity
-            new_quantity = existing_item['quantity'] + quantity
-            if not product.is_in_stock(new_quantity):
+        existing_item = find_product_item(cart, product.id)
+        in_cart = existing_item['quantity'] if existing_item else 0
+        
+        # Hold stock for the whole line; this is the only stock check, so with
+        # reservations on a stale cached stock level cannot turn the scan away
+        reserved, available = reserve_stock(user_id, product, in_cart + quantity)
+        if not reserved:
+            db.session.rollback()
+            if existing_item:
                 return jsonify({
                     'error': 'Insufficient stock for requested quantity',
-                    'available': product.stock_quantity,
-                    'in_cart': existing_item['quantity']
+                    'available': available,
+                    'in_cart': in_cart
                 }), 400
-            
-            existing_item['quantity'] = new_quantity
-            existing_item['line_subtotal'] = product.price * new_quantity
-            existing_item['tax_amount'] = existing_item['line_subtotal'] * product.tax_rate
-            existing_item['line_total'] = existing_item['line_subtotal'] + existing_item['tax_amount']
-        else:
-            # Add new item
-            line_subtotal = product.price * quantity
-            tax_amount = line_subtotal * product.tax_rate
-            line_total = line_subtotal + tax_amount
-            
-            cart_item = {
-                'cart_item_id': len(cart['items']) + 1,
-                'product_id': product.id,
-                'barcode': product.barcode,
-                'name': product.name,
-                'unit_price': product.price,
-                'quantity': quantity,
-                'tax_rate': product.tax_rate,
-                'item_discount': 0,
-                'line_subtotal': round(line_subtotal, 2),
-                'tax_amount': round(tax_amount, 2),
-                'line_total': round(line_total, 2)
-            }
-            
-            cart['items'].append(cart_item)
+            return jsonify({
+                'error': 'Insufficient stock',
+                'available': available
+            }), 400
+        db.session.commit()
         
+        cart_item = put_product_in_cart(cart, product, in_cart + quantity)
+        
+        save_user_cart(user_id, cart)
         totals = calculate_cart_totals(cart)
         
+        if wants_cart_delta():
+            return jsonify({
+                'message': 'Item added to cart',
+                'cart_delta': build_cart_delta(cart, totals, changed=[cart_item])
+            }), 200
+        
         return jsonify({
             'message': 'Item added to cart',
             'cart': {
-                'items': cart['items'],
+                'items': get_cart_items(cart),
+                'discount': cart['discount'],
+                'version': cart['version'],
+                **totals
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@cart_bp.route('/add-batch', methods=['POST'])
+@jwt_required()
+def add_batch_to_cart():
+    """
+    Add several items to cart in one request (pallet scans, suspended orders)
+    
+    Request body:
+        items: list of {barcode or product_id: str/int, quantity: int (default 1)}
+    
+    All products are resolved with a single query and stock is checked
+    against the aggregated quantity per product (including what is already
+    in the cart). Nothing is added unless every entry is valid.
+    """
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json()
+        entries = data.get('items') or []
+        
+        if not entries:
+            return jsonify({'error': 'items is required'}), 400
+        
+        barcodes = set()
+        product_ids = set()
+        for entry in entries:
+            if int(entry.get('quantity', 1)) <= 0:
+                return jsonify({'error': 'Quantity must be positive', 'entry': entry}), 400
+            if entry.get('barcode'):
+                barcodes.add(entry['barcode'])
+            elif entry.get('product_id'):
+                product_ids.add(int(entry['product_id']))
+            else:
+                return jsonify({'error': 'Barcode or product_id is required', 'entry': entry}), 400
+        
+        # Resolve every product in one query
+        products = Product.query.filter(
+            Product.is_active.is_(True),
+            db.or_(Product.barcode.in_(barcodes), Product.id.in_(product_ids))
+        ).all()
+        by_barcode = {p.barcode: p for p in products}
+        by_id = {p.id: p for p in products}
+        
+        # Aggregate requested quantities per product
+        requested = {}
+        not_found = []
+        for entry in entries:
+            product = by_barcode.get(entry['barcode']) if entry.get('barcode') else by_id.get(int(entry['product_id']))
+            if not product:
+                not_found.append(entry.get('barcode') or entry.get('product_id'))
+                continue
+            requested[product.id] = requested.get(product.id, 0) + int(entry.get('quantity', 1))
+        
+        if not_found:
+            return jsonify({'error': 'Product not found', 'not_found': not_found}), 404
+        
+        cart = get_user_cart(user_id)
+        
+        # Check and hold stock for the final quantity of each line
+        insufficient = []
+        for product_id, quantity in requested.items():
+            product = by_id[product_id]
+            existing_item = find_product_item(cart, product_id)
+            in_cart = existing_item['quantity'] if existing_item else 0
+            reserved, available = reserve_stock(user_id, product, in_cart + quantity)
+            if not reserved:
+                insufficient.append({
+                    'product_id': product_id,
+                    'name': product.name,
+                    'requested': quantity,
+                    'in_cart': in_cart,
+                    'available': available
+                })
+        
+        if insufficient:
+            db.session.rollback()
+            return jsonify({'error': 'Insufficient stock', 'items': insufficient}), 400
+        db.session.commit()
+        
+        # Apply everything as one cart mutation
+        changed = []
+        for product_id, quantity in requested.items():
+            existing_item = find_product_item(cart, product_id)
+            in_cart = existing_item['quantity'] if existing_item else 0
+            changed.append(put_product_in_cart(cart, by_id[product_id], in_cart + quantity))
+        
+        save_user_cart(user_id, cart)
+        totals = calculate_cart_totals(cart)
+        
+        if wants_cart_delta():
+            return jsonify({
+                'message': f'{len(changed)} items added to cart',
+                'cart_delta': build_cart_delta(cart, totals, changed=changed)
+            }), 200
+        
+        return jsonify({
+            'message': f'{len(changed)} items added to cart',
+            'cart': {
+                'items': get_cart_items(cart),
                 'discount': cart['discount'],
+                'version': cart['version'],
                 **totals
             }
         }), 200
@@ -202,36 +480,49 @@ def update_cart_item():
         cart = get_user_cart(user_id)
         
         # Find item
-        item = next((item for item in cart['items'] if item['cart_item_id'] == cart_item_id), None)
+        item = find_cart_item(cart, cart_item_id)
         
         if not item:
             return jsonify({'error': 'Item not found in cart'}), 404
         
         # If quantity is 0, remove item
         if quantity == 0:
-            cart['items'] = [i for i in cart['items'] if i['cart_item_id'] != cart_item_id]
+            remove_cart_item(cart, cart_item_id)
+            release_stock(user_id, item['product_id'])
         else:
-            # Check stock
-            product = Product.query.get(item['product_id'])
-            if not product.is_in_stock(quantity):
+            # Check and hold stock
+            product = get_product_cache().get_by_id(item['product_id'])
+            reserved, available = reserve_stock(user_id, product, quantity)
+            if not reserved:
+                db.session.rollback()
                 return jsonify({
                     'error': 'Insufficient stock',
-                    'available': product.stock_quantity
+                    'available': available
                 }), 400
+            db.session.commit()
             
             # Update quantity
-            item['quantity'] = quantity
-            item['line_subtotal'] = item['unit_price'] * quantity
-            item['tax_amount'] = item['line_subtotal'] * item['tax_rate']
-            item['line_total'] = item['line_subtotal'] + item['tax_amount']
+            set_cart_item_quantity(cart, item, quantity)
         
+        save_user_cart(user_id, cart)
         totals = calculate_cart_totals(cart)
         
+        if wants_cart_delta():
+            return jsonify({
+                'message': 'Cart updated',
+                'cart_delta': build_cart_delta(
+                    cart, totals,
+                    changed=[item] if quantity else [],
+                    removed=[] if quantity else [item['cart_item_id']]
+                )
+            }), 200
+        
         return jsonify({
             'message': 'Cart updated',
             'cart': {
-                'items': cart['items'],
+                'items': get_cart_items(cart),
                 'discount': cart['discount'],
+                'version': cart['version'],
                 **totals
             }
         }), 200
@@ -249,15 +540,25 @@ def remove_from_cart(cart_item_id):
         cart = get_user_cart(user_id)
         
         # Remove item
-        cart['items'] = [item for item in cart['items'] if item['cart_item_id'] != cart_item_id]
+        removed_item = remove_cart_item(cart, cart_item_id)
+        save_user_cart(user_id, cart)
+        if removed_item:
+            release_stock(user_id, removed_item['product_id'])
         
         totals = calculate_cart_totals(cart)
         
+        if wants_cart_delta():
+            return jsonify({
+                'message': 'Item removed from cart',
+                'cart_delta': build_cart_delta(cart, totals, removed=[cart_item_id] if removed_item else [])
+            }), 200
+        
         return jsonify({
             'message': 'Item removed from cart',
             'cart': {
-                'items': cart['items'],
+                'items': get_cart_items(cart),
                 'discount': cart['discount'],
+                'version': cart['version'],
                 **totals
             }
         }), 200
@@ -304,13 +605,15 @@ def apply_discount():
         else:
             cart['discount'] = {'type': discount_type, 'amount': amount}
         
+        save_user_cart(user_id, cart)
         totals = calculate_cart_totals(cart)
         
         return jsonify({
             'message': 'Discount applied',
             'cart': {
-                'items': cart['items'],
+                'items': get_cart_items(cart),
                 'discount': cart['discount'],
+                'version': cart['version'],
                 **totals
             }
         }), 200
@@ -319,16 +622,28 @@ def apply_discount():
         return jsonify({'error': str(e)}), 500
 
 
+@cart_bp.route('/stats', methods=['GET'])
+@jwt_required()
+def get_cart_stats():
+    """Get live cart count and approximate memory use (Admin/Manager only)"""
+    try:
+        if get_jwt().get('role') not in ['manager', 'administrator']:
+            return jsonify({'error': 'Insufficient privileges'}), 403
+        
+        return jsonify({'stats': get_cart_store().stats()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @cart_bp.route('/clear', methods=['DELETE'])
 @jwt_required()
 def clear_cart():
     """Clear all items from cart"""
     try:
         user_id = int(get_jwt_identity())
-        cart_key = get_cart_key(user_id)
-        
-        if cart_key in carts:
-            del carts[cart_key]
+        delete_user_cart(user_id)
+        release_stock(user_id)
         
         return jsonify({'message': 'Cart cleared'}), 200
         
@@ -1,36 +1,221 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from datetime import datetime
+from datetime import datetime, timezone
+import os
 from models.user import db, User
 from models.product import Product
 from models.transaction import Transaction, TransactionItem
 from models.inventory import InventoryLog
+from models.refund import Refund
+from models.reservation import StockReservation
+from models.rollup import SalesRollup
 from utils.payment_simulator import PaymentSimulator
-from utils.pdf_generator import PDFGenerator
+from utils.payment_gateway import get_payment_gateway
+from utils.idempotency import idempotent
+from utils.id_generator import next_number
+from utils.metrics import StageTimer
+from utils.receipt_queue import get_receipt_queue, ReceiptQueueFull
 from utils.logger import AuditLogger
-from routes.cart import get_user_cart, get_cart_key, carts, calculate_cart_totals
+from utils.product_cache import invalidate_products
+from utils.money import to_cents
+from utils.db import bulk_insert
+from routes.cart import (
+    get_user_cart, get_cart_key, get_cart_items, delete_user_cart, calculate_cart_totals,
+    new_cart, add_cart_item, price_cart_item, recalculate_cart_totals
+)
 
 checkout_bp = Blueprint('checkout', __name__, url_prefix='/api/checkout')
 
 
 def generate_transaction_number():
     """Generate unique transaction number"""
-    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-    return f"TXN-{timestamp}"
+    return next_number('TXN')
+
+
+def queue_receipt(transaction_id):
+    """
+    Queue a receipt PDF for a committed transaction
+    
+    Returns:
+        dict: Receipt job (status 'rejected' with job_id None when the queue is full)
+    """
+    try:
+        return get_receipt_queue().submit(transaction_id)
+    except ReceiptQueueFull as e:
+        return {'job_id': None, 'transaction_id': transaction_id, 'status': 'rejected', 'path': None, 'error': str(e)}
+
+
+def void_authorization(payment_method, payment_result):
+    """
+    Release an approved card/UPI authorization or refund that could not be recorded
+    
+    Returns:
+        dict: Void result, None for cash, or False when the void itself failed
+            (the payment then has to be reversed by hand)
+    """
+    if payment_method == 'cash':
+        return None  # Nothing was charged; the cashier hands the cash back
+    try:
+        return get_payment_gateway().process_void(
+            payment_method, payment_result['amount'], payment_result['reference']
+        )
+    except Exception as e:
+        print(f"Error voiding {payment_method} payment {payment_result['reference']}: {str(e)}")
+        return False
+
+
+def stock_shortfall(cart_items, products, held, cart_key, reservations_enabled):
+    """
+    Check every cart line against current stock
+    
+    Lines covered by a live reservation for this cart are not checked.
+    
+    Args:
+        products: dict of product_id -> Product for the cart lines
+        held: dict of product_id -> quantity reserved for this cart
+    
+    Returns:
+        tuple: (error dict, status code) for the first short line, or None
+    """
+    for cart_item in cart_items:
+        product = products.get(cart_item['product_id'])
+        if not product:
+            return {'error': f"Product {cart_item['name']} no longer exists"}, 400
+        if held.get(product.id, 0) >= cart_item['quantity']:
+            continue
+        if reservations_enabled:
+            available = StockReservation.available_quantity(product, cart_key)
+        else:
+            available = product.stock_quantity
+        if available < cart_item['quantity']:
+            return {
+                'error': f'Insufficient stock for {product.name}',
+                'available': available
+            }, 400
+    return None
+
+
+def sale_lines(cart_items):
+    """
+    Transaction item rows for a cart, without their transaction_id
+    
+    Needs no database access, so checkout builds them while the payment
+    authorization is in flight.
+    """
+    return [{
+        'product_id': cart_item['product_id'],
+        'quantity': cart_item['quantity'],
+        'unit_price_cents': to_cents(cart_item['unit_price']),
+        'discount_cents': to_cents(cart_item.get('item_discount', 0)),
+        'tax_rate': cart_item['tax_rate'],
+        'tax_cents': to_cents(cart_item['tax_amount']),
+        'line_total_cents': to_cents(cart_item['line_total'])
+    } for cart_item in cart_items]
+
+
+def record_sale(user_id, cart_key, cart_items, lines, totals, payment_method, payment_result, held, timer):
+    """
+    Write an authorized sale: transaction, items, stock decrements and inventory logs
+
+    Runs as one short database transaction with no payment calls inside it.
+    Commits on success; on failure rolls back and returns the error response.
+
+    Args:
+        lines: Item rows from sale_lines()
+
+    Returns:
+        tuple: (transaction, None) or (None, (error dict, status code))
+    """
+    reservations_enabled = bool(current_app.config.get('STOCK_RESERVATION_TTL'))
+    
+    transaction = Transaction(
+        transaction_number=generate_transaction_number(),
+        user_id=user_id,
+        transaction_type='sale',
+        status='completed',
+        subtotal=totals['subtotal'],
+        discount_amount=totals['discount_amount'],
+        discount_type=totals['discount_type'],
+        tax_amount=totals['tax_amount'],
+        total_cents=totals['total_cents'],
+        payment_method=payment_method,
+        payment_reference=payment_result['reference'],
+        amount_paid=payment_result.get('amount_paid', totals['total']),
+        change_given=payment_result.get('change', 0),
+        completed_at=datetime.utcnow()
+    )
+    
+    db.session.add(transaction)
+    db.session.flush()  # Get transaction ID
+    
+    # Load and lock every cart product once for the checks and stock updates below
+    products = Product.lock_many(item['product_id'] for item in cart_items)
+    
+    # Final stock check, under the row locks
+    failure = stock_shortfall(cart_items, products, held, cart_key, reservations_enabled)
+    if failure:
+        db.session.rollback()
+        return None, failure
+    
+    # Add transaction items
+    item_rows = [{'transaction_id': transaction.id, **line} for line in lines]
+    bulk_insert(TransactionItem, item_rows)
+    timer.lap('stock_check')
+    
+    # Update inventory
+    log_rows = []
+    for cart_item in cart_items:
+        product = products[cart_item['product_id']]
+        new_quantity = Product.change_stock(product.id, -cart_item['quantity'], product)
+        if new_quantity is None:
+            db.session.rollback()
+            return None, ({'error': f'Insufficient stock for {product.name}'}, 400)
+        
+        # Log inventory change
+        log_rows.append({
+            'product_id': product.id,
+            'user_id': user_id,
+            'change_type': 'sale',
+            'quantity_before': new_quantity + cart_item['quantity'],
+            'quantity_change': -cart_item['quantity'],
+            'quantity_after': new_quantity,
+            'reference_type': 'transaction',
+            'reference_id': transaction.id
+        })
+    
+    bulk_insert(InventoryLog, log_rows)
+    SalesRollup.record([(transaction, item_rows)], products)
+    
+    # Reservations become the stock decrements above
+    if reservations_enabled:
+        StockReservation.release(cart_key)
+    timer.lap('inventory_update')
+    
+    # Commit all changes
+    db.session.commit()
+    invalidate_products(products)
+    timer.lap('commit')
+    return transaction, None
 
 
 @checkout_bp.route('/process', methods=['POST'])
 @jwt_required()
+@idempotent
 def process_checkout():
     """
     Process checkout and payment
     
+    Stock is checked without locks, then payment is authorized against the
+    cart totals outside any database transaction; the sale is then written
+    in one short transaction, and the authorization is voided if that fails.
+    
     Request body:
         payment_method: 'cash', 'card', or 'upi'
         amount_paid: float (for cash)
         payment_reference: str (optional, for card/upi)
     """
     try:
+        timer = StageTimer('checkout')
         user_id = int(get_jwt_identity())
         data = request.get_json()
         
@@ -43,129 +228,90 @@ def process_checkout():
         
         # Get cart
         cart = get_user_cart(user_id)
+        cart_items = get_cart_items(cart)
         
-        if not cart['items']:
+        if not cart_items:
             return jsonify({'error': 'Cart is empty'}), 400
         
         # Calculate totals
         totals = calculate_cart_totals(cart)
         total_amount = totals['total']
         
-        # Start transaction
-        transaction_number = generate_transaction_number()
-        
-        # Create transaction record
-        transaction = Transaction(
-            transaction_number=transaction_number,
-            user_id=user_id,
-            transaction_type='sale',
-            status='pending',
-            subtotal=totals['subtotal'],
-            discount_amount=totals['discount_amount'],
-            discount_type=totals['discount_type'],
-            tax_amount=totals['tax_amount'],
-            total_amount=total_amount,
-            payment_method=payment_method
-        )
-        
-        db.session.add(transaction)
-        db.session.flush()  # Get transaction ID
-        
-        # Add transaction items
-        for cart_item in cart['items']:
-            product = Product.query.get(cart_item['product_id'])
-            
-            # Final stock check
-            if not product.is_in_stock(cart_item['quantity']):
-                db.session.rollback()
-                return jsonify({
-                    'error': f'Insufficient stock for {product.name}',
-                    'available': product.stock_quantity
-                }), 400
-            
-            trans_item = TransactionItem(
-                transaction_id=transaction.id,
-                product_id=product.id,
-                quantity=cart_item['quantity'],
-                unit_price=cart_item['unit_price'],
-                discount_amount=cart_item.get('item_discount', 0),
-                tax_rate=cart_item['tax_rate'],
-                tax_amount=cart_item['tax_amount'],
-                line_total=cart_item['line_total']
-            )
-            
-            db.session.add(trans_item)
-        
-        # Process payment
-        payment_result = None
+        # Stock held for this cart at add-to-cart time
+        cart_key = get_cart_key(user_id)
+        reservations_enabled = bool(current_app.config.get('STOCK_RESERVATION_TTL'))
+        held = StockReservation.active_for_cart(cart_key) if reservations_enabled else {}
+        
+        # Unlocked availability check so a cart that cannot be filled is never
+        # authorized; record_sale checks again under the row locks
+        products = {
+            product.id: product
+            for product in Product.query.filter(Product.id.in_({item['product_id'] for item in cart_items}))
+        }
+        failure = stock_shortfall(cart_items, products, held, cart_key, reservations_enabled)
+        # These reads opened a transaction; end it so none is held while payment runs
+        db.session.rollback()
+        if failure:
+            error, status_code = failure
+            return jsonify(error), status_code
+        timer.lap('cart')
         
+        # Authorize payment; card/UPI run on the gateway's event loop while the
+        # sale lines are priced, and the request only blocks once they are needed
         if payment_method == 'cash':
             payment_result = PaymentSimulator.process_cash_payment(amount_paid, total_amount)
+            lines = sale_lines(cart_items)
         else:
-            payment_result = PaymentSimulator.process_payment(payment_method, total_amount, payment_reference)
+            authorization = get_payment_gateway().submit_payment(payment_method, total_amount, payment_reference)
+            lines = sale_lines(cart_items)
+            payment_result = authorization.result()
+        
+        timer.lap('payment')
         
         if not payment_result['success']:
-            db.session.rollback()
             return jsonify({
                 'error': 'Payment failed',
                 'payment_result': payment_result
             }), 402
         
-        # Payment successful - update transaction
-        transaction.status = 'completed'
-        transaction.payment_reference = payment_result['reference']
-        transaction.amount_paid = payment_result.get('amount_paid', total_amount)
-        transaction.change_given = payment_result.get('change', 0)
-        transaction.completed_at = datetime.utcnow()
-        
-        # Update inventory
-        for cart_item in cart['items']:
-            product = Product.query.get(cart_item['product_id'])
-            old_quantity = product.stock_quantity
-            product.update_stock(-cart_item['quantity'])
-            
-            # Log inventory change
-            inv_log = InventoryLog(
-                product_id=product.id,
-                user_id=user_id,
-                change_type='sale',
-                quantity_before=old_quantity,
-                quantity_change=-cart_item['quantity'],
-                quantity_after=product.stock_quantity,
-                reference_type='transaction',
-                reference_id=transaction.id
+        # Capture: record the sale, releasing the authorization if that fails
+        try:
+            transaction, failure = record_sale(
+                user_id, cart_key, cart_items, lines, totals, payment_method, payment_result, held, timer
             )
-            db.session.add(inv_log)
-        
-        # Commit all changes
-        db.session.commit()
+        except Exception:
+            db.session.rollback()
+            void_authorization(payment_method, payment_result)
+            raise
+        if failure:
+            error, status_code = failure
+            error['payment_voided'] = void_authorization(payment_method, payment_result)
+            return jsonify(error), status_code
         
         # Log transaction
         AuditLogger.log_transaction_action(
             user_id=user_id,
             action='process_sale',
             transaction_id=transaction.id,
-            details=f"Completed sale: {transaction_number}, Total: ${total_amount:.2f}",
+            details=f"Completed sale: {transaction.transaction_number}, Total: ${total_amount:.2f}",
             ip_address=request.remote_addr
         )
+        timer.lap('audit_log')
         
-        # Generate receipt PDF
-        try:
-            receipt_path = PDFGenerator.generate_receipt(transaction)
-        except Exception as e:
-            print(f"Error generating receipt: {str(e)}")
-            receipt_path = None
+        # Receipt PDF renders in the background; poll GET /receipts/<job_id>
+        receipt = queue_receipt(transaction.id)
+        timer.lap('receipt')
         
         # Clear cart
-        cart_key = get_cart_key(user_id)
-        if cart_key in carts:
-            del carts[cart_key]
+        delete_user_cart(user_id)
+        timer.finish()
         
         return jsonify({
             'message': 'Payment successful',
             'transaction': transaction.to_dict(),
             'payment_result': payment_result,
-            'receipt_path': receipt_path
+            'receipt': receipt,
+            'receipt_path': receipt['path']
         }), 200
         
     except ValueError as e:
@@ -176,18 +322,129 @@ def process_checkout():
         return jsonify({'error': str(e)}), 500
 
 
+def record_refund(user_id, original_id, reason, manager, refund_result, ip_address, timer):
+    """
+    Write a paid full refund: refund transaction, items, restocking, inventory and audit logs
+    
+    Runs as one short database transaction with no payment calls inside it.
+    The original sale is re-checked under a row lock, since another refund
+    or void may have landed while the payment was being refunded.
+    Commits on success; on failure rolls back and returns the error response.
+    
+    Returns:
+        tuple: (refund transaction, None) or (None, (error dict, status code))
+    """
+    original_transaction = Transaction.query.filter_by(id=original_id).with_for_update().first()
+    if (not original_transaction or original_transaction.status != 'completed'
+            or Refund.query.filter_by(transaction_id=original_id, status='completed').first()):
+        db.session.rollback()
+        return None, ({'error': 'Transaction was refunded or voided in the meantime'}, 409)
+    
+    refund_transaction = Transaction(
+        transaction_number=f"REF-{generate_transaction_number()}",
+        user_id=user_id,
+        transaction_type='refund',
+        status='completed',
+        subtotal_cents=-original_transaction.subtotal_cents,
+        discount_cents=-original_transaction.discount_cents,
+        discount_type=original_transaction.discount_type,
+        tax_cents=-original_transaction.tax_cents,
+        total_cents=-original_transaction.total_cents,
+        payment_method=original_transaction.payment_method,
+        payment_reference=refund_result['reference'],
+        refund_reason=reason,
+        authorized_by=manager.id,
+        completed_at=datetime.utcnow()
+    )
+    
+    db.session.add(refund_transaction)
+    db.session.flush()
+    
+    original_items = original_transaction.items.all()
+    products = Product.lock_many(item.product_id for item in original_items)
+    
+    # Create refund items and restore inventory
+    item_rows = []
+    log_rows = []
+    for original_item in original_items:
+        item_rows.append({
+            'transaction_id': refund_transaction.id,
+            'product_id': original_item.product_id,
+            'quantity': original_item.quantity,
+            'unit_price_cents': original_item.unit_price_cents,
+            'discount_cents': original_item.discount_cents,
+            'tax_rate': original_item.tax_rate,
+            'tax_cents': original_item.tax_cents,
+            'line_total_cents': original_item.line_total_cents
+        })
+        
+        # Restore stock (skipped for products deleted since the sale)
+        product = products.get(original_item.product_id)
+        new_quantity = Product.change_stock(product.id, original_item.quantity, product) if product else None
+        if new_quantity is None:
+            continue
+        
+        # Log inventory change
+        log_rows.append({
+            'product_id': product.id,
+            'user_id': user_id,
+            'change_type': 'refund',
+            'quantity_before': new_quantity - original_item.quantity,
+            'quantity_change': original_item.quantity,
+            'quantity_after': new_quantity,
+            'reference_type': 'transaction',
+            'reference_id': refund_transaction.id,
+            'notes': f"Refund for transaction {original_transaction.transaction_number}"
+        })
+    
+    bulk_insert(TransactionItem, item_rows)
+    bulk_insert(InventoryLog, log_rows)
+    SalesRollup.record([(refund_transaction, item_rows)], products)
+    SalesRollup.change_status(original_transaction, original_items, 'refunded', products)
+    timer.lap('inventory_update')
+    
+    # Log refund, committed together with it so an authorized refund always leaves a record
+    AuditLogger.log_transaction_action(
+        user_id=user_id,
+        action='process_refund',
+        transaction_id=refund_transaction.id,
+        details=f"Refund processed by manager {manager.username}: {reason}",
+        ip_address=ip_address,
+        in_transaction=True
+    )
+    
+    AuditLogger.log_manager_override(
+        manager_id=manager.id,
+        action='refund',
+        details=f"Authorized refund for transaction {original_transaction.transaction_number}",
+        ip_address=ip_address,
+        in_transaction=True
+    )
+    timer.lap('audit_log')
+    
+    db.session.commit()
+    invalidate_products(products)
+    timer.lap('commit')
+    return refund_transaction, None
+
+
 @checkout_bp.route('/refund', methods=['POST'])
 @jwt_required()
+@idempotent
 def process_refund():
     """
     Process refund (requires manager authorization)
     
+    The refund is paid out first, outside any database transaction; it is
+    then recorded in one short transaction, and voided if that fails.
+    
     Request body:
         transaction_id: int
         reason: str
         manager_pin: str
     """
     try:
+        timer = StageTimer('refund')
         user_id = int(get_jwt_identity())
         claims = get_jwt()
         data = request.get_json()
@@ -220,87 +477,40 @@ def process_refund():
         if original_transaction.transaction_type == 'refund':
             return jsonify({'error': 'Cannot refund a refund transaction'}), 400
         
-        # Create refund transaction
-        refund_number = f"REF-{generate_transaction_number()}"
+        # A full refund on top of partial ones would restock the refunded units twice
+        if Refund.query.filter_by(transaction_id=original_transaction.id, status='completed').first():
+            return jsonify({'error': 'Transaction already has partial refunds; refund the remainder through /api/refunds'}), 400
+        timer.lap('validate')
         
-        refund_transaction = Transaction(
-            transaction_number=refund_number,
-            user_id=user_id,
-            transaction_type='refund',
-            status='completed',
-            subtotal=-original_transaction.subtotal,
-            discount_amount=-original_transaction.discount_amount,
-            discount_type=original_transaction.discount_type,
-            tax_amount=-original_transaction.tax_amount,
-            total_amount=-original_transaction.total_amount,
-            payment_method=original_transaction.payment_method,
-            refund_reason=reason,
-            authorized_by=manager.id,
-            completed_at=datetime.utcnow()
-        )
-        
-        db.session.add(refund_transaction)
-        db.session.flush()
-        
-        # Create refund items and restore inventory
-        for original_item in original_transaction.items:
-            refund_item = TransactionItem(
-                transaction_id=refund_transaction.id,
-                product_id=original_item.product_id,
-                quantity=original_item.quantity,
-                unit_price=original_item.unit_price,
-                discount_amount=original_item.discount_amount,
-                tax_rate=original_item.tax_rate,
-                tax_amount=original_item.tax_amount,
-                line_total=original_item.line_total
-            )
-            db.session.add(refund_item)
-            
-            # Restore stock
-            product = Product.query.get(original_item.product_id)
-            old_quantity = product.stock_quantity
-            product.update_stock(original_item.quantity)
-            
-            # Log inventory change
-            inv_log = InventoryLog(
-                product_id=product.id,
-                user_id=user_id,
-                change_type='refund',
-                quantity_before=old_quantity,
-                quantity_change=original_item.quantity,
-                quantity_after=product.stock_quantity,
-                reference_type='transaction',
-                reference_id=refund_transaction.id,
-                notes=f"Refund for transaction {original_transaction.transaction_number}"
-            )
-            db.session.add(inv_log)
-        
-        # Process refund payment
-        refund_result = PaymentSimulator.process_refund(
-            original_transaction.payment_method,
-            original_transaction.total_amount,
-            original_transaction.payment_reference
-        )
-        
-        refund_transaction.payment_reference = refund_result['reference']
-        
-        db.session.commit()
+        # Pay the refund first, with no database transaction or row locks held
+        payment_method = original_transaction.payment_method
+        original_id = original_transaction.id
+        amount = original_transaction.total_amount
+        payment_reference = original_transaction.payment_reference
+        db.session.rollback()
+        refund_result = get_payment_gateway().process_refund(payment_method, amount, payment_reference)
+        timer.lap('payment')
         
-        # Log refund
-        AuditLogger.log_transaction_action(
-            user_id=user_id,
-            action='process_refund',
-            transaction_id=refund_transaction.id,
-            details=f"Refund processed by manager {manager.username}: {reason}",
-            ip_address=request.remote_addr
-        )
+        if not refund_result['success']:
+            return jsonify({
+                'error': 'Refund failed',
+                'refund_result': refund_result
+            }), 402
         
-        AuditLogger.log_manager_override(
-            manager_id=manager.id,
-            action='refund',
-            details=f"Authorized refund for transaction {original_transaction.transaction_number}",
-            ip_address=request.remote_addr
-        )
+        # Record it in one short locked write, reversing the refund if that fails
+        try:
+            refund_transaction, failure = record_refund(
+                user_id, original_id, reason, manager, refund_result, request.remote_addr, timer
+            )
+        except Exception:
+            db.session.rollback()
+            void_authorization(payment_method, refund_result)
+            raise
+        if failure:
+            error, status_code = failure
+            error['refund_voided'] = void_authorization(payment_method, refund_result)
+            return jsonify(error), status_code
+        timer.finish()
         
         return jsonify({
             'message': 'Refund processed successfully',
@@ -315,6 +525,7 @@ def process_refund():
 
 @checkout_bp.route('/void', methods=['POST'])
 @jwt_required()
+@idempotent
 def void_transaction():
     """
     Void a transaction (requires manager authorization)
@@ -325,6 +536,7 @@ def void_transaction():
         manager_pin: str
     """
     try:
+        timer = StageTimer('void')
         user_id = int(get_jwt_identity())
         data = request.get_json()
         
@@ -353,49 +565,67 @@ def void_transaction():
         if transaction.status == 'voided':
             return jsonify({'error': 'Transaction is already voided'}), 400
         
-        # Void transaction
-        transaction.status = 'voided'
-        transaction.refund_reason = reason
-        transaction.authorized_by = manager.id
-        
-        # Restore inventory if transaction was completed
-        if transaction.status == 'completed':
-            for item in transaction.items:
-                product = Product.query.get(item.product_id)
-                old_quantity = product.stock_quantity
-                product.update_stock(item.quantity)
+        # Refunded stock is already back on the shelf; voiding would restock it again
+        if transaction.status == 'refunded' or Refund.query.filter_by(transaction_id=transaction.id, status='completed').first():
+            return jsonify({'error': 'Cannot void a refunded transaction'}), 400
+        
+        items = transaction.items.all()
+        products = {}
+        timer.lap('validate')
+        
+        # Restore inventory if a sale was completed
+        if transaction.status == 'completed' and transaction.transaction_type == 'sale':
+            products = Product.lock_many(item.product_id for item in items)
+            log_rows = []
+            for item in items:
+                product = products.get(item.product_id)
+                new_quantity = Product.change_stock(product.id, item.quantity, product) if product else None
+                if new_quantity is None:
+                    continue
                 
                 # Log inventory change
-                inv_log = InventoryLog(
-                    product_id=product.id,
-                    user_id=user_id,
-                    change_type='void',
-                    quantity_before=old_quantity,
-                    quantity_change=item.quantity,
-                    quantity_after=product.stock_quantity,
-                    reference_type='transaction',
-                    reference_id=transaction.id,
-                    notes=f"Voided transaction: {reason}"
-                )
-                db.session.add(inv_log)
+                log_rows.append({
+                    'product_id': product.id,
+                    'user_id': user_id,
+                    'change_type': 'void',
+                    'quantity_before': new_quantity - item.quantity,
+                    'quantity_change': item.quantity,
+                    'quantity_after': new_quantity,
+                    'reference_type': 'transaction',
+                    'reference_id': transaction.id,
+                    'notes': f"Voided transaction: {reason}"
+                })
+            bulk_insert(InventoryLog, log_rows)
         
-        db.session.commit()
+        # Void transaction
+        SalesRollup.change_status(transaction, items, 'voided', products)
+        transaction.refund_reason = reason
+        transaction.authorized_by = manager.id
+        timer.lap('inventory_update')
         
-        # Log void
+        # Log void, committed together with it so an authorized void always leaves a record
         AuditLogger.log_transaction_action(
             user_id=user_id,
             action='void_transaction',
             transaction_id=transaction.id,
             details=f"Transaction voided by manager {manager.username}: {reason}",
-            ip_address=request.remote_addr
+            ip_address=request.remote_addr,
+            in_transaction=True
         )
         
         AuditLogger.log_manager_override(
             manager_id=manager.id,
             action='void',
             details=f"Authorized void for transaction {transaction.transaction_number}",
-            ip_address=request.remote_addr
+            ip_address=request.remote_addr,
+            in_transaction=True
         )
+        timer.lap('audit_log')
+        
+        db.session.commit()
+        invalidate_products(products)
+        timer.lap('commit')
+        timer.finish()
         
         return jsonify({
             'message': 'Transaction voided successfully',
@@ -405,3 +635,330 @@ def void_transaction():
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
+
+
+def price_offline_sale(sale, products):
+    """
+    Price a queued offline sale the way the terminal's cart did
+
+    Lines keep the unit price the terminal charged (falling back to the
+    current price) and are taxed at the product's rate.
+
+    Returns:
+        tuple: (cart lines, totals dict as from calculate_cart_totals)
+    """
+    cart = new_cart()
+    discount = sale.get('discount') or {}
+    cart['discount'] = {'type': discount.get('type'), 'amount': discount.get('amount', 0)}
+    for line in sale['items']:
+        product = products[line['product_id']]
+        add_cart_item(cart, price_cart_item({
+            'product_id': product.id,
+            'barcode': product.barcode,
+            'name': product.name,
+            'unit_price': product.price if line.get('unit_price') is None else line['unit_price'],
+            'tax_rate': product.tax_rate,
+            'item_discount': 0
+        }, line['quantity']))
+    return get_cart_items(cart), recalculate_cart_totals(cart)
+
+
+def is_amount(value):
+    """True for a non-negative int or float dollar amount"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+
+def parse_offline_sale(sale):
+    """Check the shape of a queued sale, returning an error message or None"""
+    if not isinstance(sale, dict):
+        return 'Sale must be an object'
+    client_id = sale.get('client_id')
+    if not client_id or not isinstance(client_id, str) or len(client_id) > 64:
+        return 'client_id is required (string, at most 64 characters)'
+    try:
+        sold_at = datetime.fromisoformat(sale.get('sold_at') or '')
+    except (TypeError, ValueError):
+        return 'sold_at must be an ISO timestamp'
+    # Stored like every other timestamp: naive UTC
+    if sold_at.tzinfo is not None:
+        sold_at = sold_at.astimezone(timezone.utc).replace(tzinfo=None)
+    sale['sold_at'] = sold_at
+    if sale.get('payment_method') not in PaymentSimulator.SUCCESS_RATES:
+        return f"Invalid payment method: {sale.get('payment_method')}"
+    if sale.get('amount_paid') is not None and not is_amount(sale['amount_paid']):
+        return 'amount_paid must be a non-negative number'
+    discount = sale.get('discount') or {}
+    if not isinstance(discount, dict) or (discount.get('amount') is not None and not is_amount(discount['amount'])):
+        return 'discount must be {type, amount} with a non-negative amount'
+    items = sale.get('items')
+    if not items or not isinstance(items, list):
+        return 'Sale has no items'
+    for line in items:
+        if not isinstance(line, dict) or not (line.get('barcode') or line.get('product_id')):
+            return 'Each item needs a barcode or product_id'
+        if not isinstance(line.get('quantity'), int) or isinstance(line['quantity'], bool) or line['quantity'] <= 0:
+            return 'Each item needs a positive integer quantity'
+        if line.get('unit_price') is not None and not is_amount(line['unit_price']):
+            return 'unit_price must be a non-negative number (omit it or send null for the current price)'
+    return None
+
+
+@checkout_bp.route('/sync', methods=['POST'])
+@jwt_required()
+def sync_offline_sales():
+    """
+    Ingest sales a terminal queued while it could not reach the backend
+    
+    Sales are replayed in sold_at order in one database transaction: stock
+    for the whole batch is locked once and decremented once per product.
+    Sales already synced (same client_id) are reported as duplicates, so a
+    terminal can resend a batch whose response it never received. Because
+    queued sales already happened at the till, a sale that oversells a
+    product is still recorded; stock stops at zero and the shortfall is
+    reported as a conflict for a manager to reconcile.
+    
+    Request body:
+        terminal_id: str (optional)
+        sales: list of {client_id, sold_at, payment_method, amount_paid,
+            payment_reference, discount: {type, amount},
+            items: [{barcode or product_id, quantity, unit_price}]}
+    """
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json() or {}
+        terminal_id = data.get('terminal_id')
+        sales = data.get('sales')
+        
+        if not isinstance(sales, list) or not sales:
+            return jsonify({'error': 'sales must be a non-empty list'}), 400
+        
+        max_sales = current_app.config.get('SYNC_MAX_SALES', 500)
+        if len(sales) > max_sales:
+            return jsonify({'error': f'At most {max_sales} sales per sync request'}), 413
+        
+        results = [{'client_id': sale.get('client_id') if isinstance(sale, dict) else None} for sale in sales]
+        
+        # Shape checks, then drop sales synced before or repeated within this batch
+        valid = []
+        for index, sale in enumerate(sales):
+            error = parse_offline_sale(sale)
+            if error:
+                results[index].update(status='rejected', error=error)
+            else:
+                valid.append(index)
+        
+        client_ids = [sales[index]['client_id'] for index in valid]
+        synced = dict(
+            db.session.query(Transaction.client_id, Transaction.id)
+            .filter(Transaction.client_id.in_(client_ids)).all()
+        ) if client_ids else {}
+        seen = set()
+        pending = []
+        for index in valid:
+            client_id = sales[index]['client_id']
+            if client_id in synced or client_id in seen:
+                results[index].update(status='duplicate', transaction_id=synced.get(client_id))
+                continue
+            seen.add(client_id)
+            pending.append(index)
+        
+        # Replay oldest first, keeping the queue order for equal timestamps
+        pending.sort(key=lambda index: sales[index]['sold_at'])
+        
+        # Resolve barcodes and lock every product of the batch once
+        barcodes = {line['barcode'] for index in pending for line in sales[index]['items'] if not line.get('product_id')}
+        barcode_ids = dict(
+            db.session.query(Product.barcode, Product.id).filter(Product.barcode.in_(barcodes)).all()
+        ) if barcodes else {}
+        for index in pending:
+            for line in sales[index]['items']:
+                if not line.get('product_id'):
+                    line['product_id'] = barcode_ids.get(line['barcode'])
+        products = Product.lock_many({
+            line['product_id'] for index in pending for line in sales[index]['items'] if line['product_id']
+        })
+        stock_levels = {product_id: product.stock_quantity for product_id, product in products.items()}
+        
+        transaction_rows = []
+        sale_lines = []
+        conflicts = []
+        for index in pending:
+            sale = sales[index]
+            missing = [line.get('barcode') or line['product_id'] for line in sale['items'] if line['product_id'] not in products]
+            if missing:
+                conflict = {'type': 'unknown_product', 'client_id': sale['client_id'], 'products': missing}
+                conflicts.append(conflict)
+                results[index].update(status='rejected', error='Unknown products', conflicts=[conflict])
+                continue
+            
+            lines, totals = price_offline_sale(sale, products)
+            total_cents = totals['total_cents']
+            paid_cents = to_cents(sale['amount_paid']) if sale.get('amount_paid') is not None else total_cents
+            
+            # Stock in sale order; an oversold line takes what is left
+            applied = []
+            sale_conflicts = []
+            for line in lines:
+                product_id = line['product_id']
+                before = stock_levels[product_id]
+                taken = min(line['quantity'], max(before, 0))
+                stock_levels[product_id] = before - taken
+                applied.append((line, before, taken))
+                if taken < line['quantity']:
+                    sale_conflicts.append({
+                        'type': 'oversold',
+                        'client_id': sale['client_id'],
+                        'product_id': product_id,
+                        'barcode': line['barcode'],
+                        'quantity': line['quantity'],
+                        'available': before,
+                        'shortfall': line['quantity'] - taken
+                    })
+            conflicts.extend(sale_conflicts)
+            
+            transaction_rows.append({
+                'transaction_number': generate_transaction_number(),
+                'user_id': user_id,
+                'transaction_type': 'sale',
+                'status': 'completed',
+                'subtotal_cents': to_cents(totals['subtotal']),
+                'discount_cents': to_cents(totals['discount_amount']),
+                'discount_type': totals['discount_type'],
+                'tax_cents': to_cents(totals['tax_amount']),
+                'total_cents': total_cents,
+                'payment_method': sale['payment_method'],
+                'payment_reference': sale.get('payment_reference') or f"OFFLINE-{sale['client_id']}",
+                'amount_paid_cents': paid_cents,
+                'change_cents': max(paid_cents - total_cents, 0),
+                'created_at': sale['sold_at'],
+                'completed_at': sale['sold_at'],
+                'client_id': sale['client_id']
+            })
+            sale_lines.append((index, applied))
+            results[index].update(status='created', conflicts=sale_conflicts)
+        
+        transaction_ids = bulk_insert(Transaction, transaction_rows, return_ids=True) if transaction_rows else []
+        
+        item_rows = []
+        log_rows = []
+        rollup_entries = []
+        for transaction_id, transaction_row, (index, applied) in zip(transaction_ids, transaction_rows, sale_lines):
+            results[index].update(transaction_id=transaction_id, transaction_number=transaction_row['transaction_number'])
+            first_item = len(item_rows)
+            for line, before, taken in applied:
+                item_rows.append({
+                    'transaction_id': transaction_id,
+                    'product_id': line['product_id'],
+                    'quantity': line['quantity'],
+                    'unit_price_cents': to_cents(line['unit_price']),
+                    'discount_cents': 0,
+                    'tax_rate': line['tax_rate'],
+                    'tax_cents': to_cents(line['tax_amount']),
+                    'line_total_cents': to_cents(line['line_total'])
+                })
+                if taken:
+                    log_rows.append({
+                        'product_id': line['product_id'],
+                        'user_id': user_id,
+                        'change_type': 'sale',
+                        'quantity_before': before,
+                        'quantity_change': -taken,
+                        'quantity_after': before - taken,
+                        'reference_type': 'transaction',
+                        'reference_id': transaction_id,
+                        'notes': f"Offline sale {sales[index]['client_id']}"
+                    })
+            rollup_entries.append((transaction_row, item_rows[first_item:]))
+        
+        bulk_insert(TransactionItem, item_rows)
+        bulk_insert(InventoryLog, log_rows)
+        SalesRollup.record(rollup_entries, products)
+        
+        # One stock update per product for the whole batch
+        for product_id, product in products.items():
+            sold = product.stock_quantity - stock_levels[product_id]
+            if sold and Product.change_stock(product_id, -sold, product) is None:
+                db.session.rollback()
+                return jsonify({'error': 'Stock changed during sync; retry the batch'}), 409
+        
+        db.session.commit()
+        invalidate_products(products)
+        
+        summary = {
+            status: sum(1 for result in results if result.get('status') == status)
+            for status in ('created', 'duplicate', 'rejected')
+        }
+        summary['conflicts'] = len(conflicts)
+        
+        AuditLogger.log(
+            user_id=user_id,
+            action='sync_offline_sales',
+            resource_type='transaction',
+            details=f"Synced offline sales from terminal {terminal_id or 'unknown'}: "
+                    f"{summary['created']} created, {summary['duplicate']} duplicates, "
+                    f"{summary['rejected']} rejected, {summary['conflicts']} conflicts",
+            ip_address=request.remote_addr
+        )
+        
+        return jsonify({
+            'message': 'Offline sales synced',
+            'results': results,
+            'conflicts': conflicts,
+            'summary': summary
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@checkout_bp.route('/receipts', methods=['POST'])
+@jwt_required()
+def request_receipt():
+    """
+    Queue a receipt for a transaction (e.g. after a rejected or lost job)
+    
+    Request body:
+        transaction_id: int
+    """
+    try:
+        data = request.get_json() or {}
+        transaction = db.session.get(Transaction, data.get('transaction_id') or 0)
+        
+        if not transaction:
+            return jsonify({'error': 'Transaction not found'}), 404
+        
+        try:
+            receipt = get_receipt_queue().submit(transaction.id)
+        except ReceiptQueueFull as e:
+            response = jsonify({'error': str(e)})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        
+        return jsonify({'receipt': receipt}), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@checkout_bp.route('/receipts/<job_id>', methods=['GET'])
+@jwt_required()
+def get_receipt(job_id):
+    """
+    Poll a receipt job, or download its PDF with ?download=true once done
+    """
+    try:
+        receipt = get_receipt_queue().get(job_id)
+        
+        if not receipt:
+            return jsonify({'error': 'Receipt job not found'}), 404
+        
+        if request.args.get('download', '').lower() in ('1', 'true', 'yes'):
+            if receipt['status'] != 'done':
+                return jsonify({'receipt': receipt}), 409
+            return send_file(os.path.abspath(receipt['path']), mimetype='application/pdf', as_attachment=True)
+        
+        return jsonify({'receipt': receipt}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
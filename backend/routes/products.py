@@ -4,6 +4,7 @@ from models.user import db, User
 from models.product import Product
 from models.inventory import InventoryLog
 from utils.logger import AuditLogger
+from utils.product_cache import get_product_cache
 
 products_bp = Blueprint('products', __name__, url_prefix='/api/products')
 
@@ -74,7 +75,7 @@ def get_products():
 def get_product_by_barcode(barcode):
     """Get product by barcode"""
     try:
-        product = Product.query.filter_by(barcode=barcode).first()
+        product = get_product_cache().get_by_barcode(barcode)
         
         if not product:
             return jsonify({'error': 'Product not found'}), 404
@@ -135,6 +136,7 @@ def create_product():
         
         db.session.add(product)
         db.session.commit()
+        get_product_cache().invalidate(product_id=product.id, barcode=product.barcode)
         
         # Log action
         AuditLogger.log_product_action(
@@ -205,6 +207,7 @@ def update_product(product_id):
             product.is_active = data['is_active']
         
         db.session.commit()
+        get_product_cache().invalidate(product_id=product.id)
         
         # Log action
         AuditLogger.log_product_action(
@@ -241,6 +244,7 @@ def delete_product(product_id):
         # Soft delete (just deactivate)
         product.is_active = False
         db.session.commit()
+        get_product_cache().invalidate(product_id=product.id)
         
         # Log action
         AuditLogger.log_product_action(
@@ -258,6 +262,17 @@ def delete_product(product_id):
         return jsonify({'error': str(e)}), 500
 
 
+@products_bp.route('/cache/stats', methods=['GET'])
+@require_role('administrator', 'manager')
+def get_product_cache_stats():
+    """Get product cache hit/miss counters (Admin/Manager only)"""
+    try:
+        return jsonify({'cache': get_product_cache().stats()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @products_bp.route('/categories', methods=['GET'])
 @jwt_required()
 def get_categories():
@@ -6,15 +6,20 @@ from models.product import Product
 from models.transaction import Transaction, TransactionItem
 from models.refund import Refund
 from models.inventory import InventoryLog
+from models.rollup import SalesRollup
 from utils.logger import AuditLogger
+from utils.product_cache import invalidate_products
+from utils.db import bulk_insert
+from utils.idempotency import idempotent
+from utils.id_generator import next_number
+from utils.metrics import StageTimer
 
 refund_bp = Blueprint('refund', __name__, url_prefix='/api/refunds')
 
 
 def generate_refund_number():
     """Generate unique refund number"""
-    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-    return f"REF-{timestamp}"
+    return next_number('REF')
 
 
 def has_permission(role, permission):
@@ -106,6 +111,7 @@ def get_refund(refund_id):
 
 @refund_bp.route('/transaction/<int:transaction_id>', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_refund(transaction_id):
     """
     Create a refund for a transaction (manager/admin only)
@@ -117,6 +123,8 @@ def create_refund(transaction_id):
         items: list of {item_id: int, quantity: int} (optional, for partial refunds)
     """
     try:
+        timer = StageTimer('refund_record')
+        
         # Get user info from JWT
         user_id = int(get_jwt_identity())
         jwt_data = get_jwt()
@@ -142,12 +150,15 @@ def create_refund(transaction_id):
         if transaction.status == 'voided':
             return jsonify({'error': 'Cannot refund a voided transaction'}), 400
         
+        if transaction.status == 'refunded':
+            return jsonify({'error': 'Transaction is already fully refunded'}), 400
+        
         # Check if transaction already fully refunded
         existing_refunds = Refund.query.filter_by(transaction_id=transaction_id, status='completed').all()
         total_refunded = sum(r.amount_cents for r in existing_refunds)
         
         # Calculate refund amount
-        transaction_total_cents = int(transaction.total_amount * 100)
+        transaction_total_cents = transaction.total_cents
         
         if amount_cents is None:
             # Full refund
@@ -162,6 +173,8 @@ def create_refund(transaction_id):
         if total_refunded + amount_cents > transaction_total_cents:
             return jsonify({'error': f'Refund amount exceeds transaction total. Already refunded: ${total_refunded/100:.2f}'}), 400
         
+        timer.lap('validate')
+        
         # Start database transaction
         try:
             # Create refund record
@@ -178,59 +191,56 @@ def create_refund(transaction_id):
             db.session.add(refund)
             db.session.flush()  # Get refund ID
             
-            # Restock inventory for refunded items
+            # Units going back on the shelf: (product_id, quantity)
             if items_to_refund:
                 # Partial refund - restock only specified items
+                item_ids = [item_data.get('item_id') for item_data in items_to_refund]
+                transaction_items = {
+                    item.id: item for item in
+                    TransactionItem.query.filter(TransactionItem.id.in_(item_ids)).all()
+                }
+                restock = []
                 for item_data in items_to_refund:
                     item_id = item_data.get('item_id')
                     quantity = item_data.get('quantity', 0)
                     
-                    transaction_item = TransactionItem.query.get(item_id)
+                    transaction_item = transaction_items.get(item_id)
                     if not transaction_item or transaction_item.transaction_id != transaction_id:
                         raise ValueError(f'Invalid transaction item: {item_id}')
                     
                     if quantity > transaction_item.quantity:
                         raise ValueError(f'Refund quantity exceeds original quantity for item {item_id}')
                     
-                    product = Product.query.get(transaction_item.product_id)
-                    if product:
-                        old_qty = product.stock_quantity
-                        product.stock_quantity += quantity
-                        
-                        # Log inventory change
-                        inventory_log = InventoryLog(
-                            product_id=product.id,
-                            user_id=user_id,
-                            change_type='refund',
-                            quantity_before=old_qty,
-                            quantity_change=quantity,
-                            quantity_after=product.stock_quantity,
-                            reference_type='refund',
-                            reference_id=refund.id,
-                            notes=f'Refund {refund.refund_number}: {reason}'
-                        )
-                        db.session.add(inventory_log)
+                    restock.append((transaction_item.product_id, quantity))
             else:
                 # Full refund - restock all items
-                for transaction_item in transaction.items:
-                    product = Product.query.get(transaction_item.product_id)
-                    if product:
-                        old_qty = product.stock_quantity
-                        product.stock_quantity += transaction_item.quantity
-                        
-                        # Log inventory change
-                        inventory_log = InventoryLog(
-                            product_id=product.id,
-                            user_id=user_id,
-                            change_type='refund',
-                            quantity_before=old_qty,
-                            quantity_change=transaction_item.quantity,
-                            quantity_after=product.stock_quantity,
-                            reference_type='refund',
-                            reference_id=refund.id,
-                            notes=f'Refund {refund.refund_number}: {reason}'
-                        )
-                        db.session.add(inventory_log)
+                restock = [(item.product_id, item.quantity) for item in transaction.items]
+            
+            timer.lap('refund_items')
+            
+            # Restock inventory for refunded items
+            products = Product.lock_many(product_id for product_id, _ in restock)
+            log_rows = []
+            for product_id, quantity in restock:
+                product = products.get(product_id)
+                new_quantity = Product.change_stock(product_id, quantity, product) if product else None
+                if new_quantity is None:
+                    continue
+                
+                # Log inventory change
+                log_rows.append({
+                    'product_id': product_id,
+                    'user_id': user_id,
+                    'change_type': 'refund',
+                    'quantity_before': new_quantity - quantity,
+                    'quantity_change': quantity,
+                    'quantity_after': new_quantity,
+                    'reference_type': 'refund',
+                    'reference_id': refund.id,
+                    'notes': f'Refund {refund.refund_number}: {reason}'
+                })
+            bulk_insert(InventoryLog, log_rows)
+            timer.lap('inventory_update')
             
             # Update refund status
             refund.status = 'completed'
@@ -238,20 +248,25 @@ def create_refund(transaction_id):
             
             # Update transaction status if fully refunded
             if total_refunded + amount_cents >= transaction_total_cents:
-                transaction.status = 'refunded'
+                SalesRollup.change_status(transaction, transaction.items.all(), 'refunded', products)
             
-            # Commit transaction
-            db.session.commit()
-            
-            # Log refund action
+            # Log refund action, committed together with the refund
             AuditLogger.log(
                 user_id=user_id,
                 action='create_refund',
                 resource_type='refund',
                 resource_id=refund.id,
                 details=f'Refund {refund.refund_number} for transaction {transaction.transaction_number}: ${refund.amount:.2f}. Reason: {reason}',
-                ip_address=request.remote_addr
+                ip_address=request.remote_addr,
+                in_transaction=True
             )
+            timer.lap('audit_log')
+            
+            # Commit transaction
+            db.session.commit()
+            invalidate_products(products)
+            timer.lap('commit')
+            timer.finish()
             
             return jsonify({
                 'message': 'Refund processed successfully',
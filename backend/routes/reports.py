@@ -1,35 +1,319 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
-from models.user import db
-from models.transaction import Transaction
+from models.user import db, User
+from models.transaction import Transaction, TransactionItem
 from models.product import Product
 from models.inventory import InventoryLog, AuditLog
+from models.rollup import SalesRollup, NO_PRODUCT, hour_of, bucket_ranges
 from utils.pdf_generator import PDFGenerator
+from utils.money import to_amount
+from utils.logger import AuditLogger
+from utils.audit_sink import get_audit_sink
+from utils.metrics import get_metrics
+from utils.receipt_queue import get_receipt_queue
+from utils.payment_gateway import get_payment_gateway
+import base64
 import csv
 import os
 
 reports_bp = Blueprint('reports', __name__, url_prefix='/api/reports')
 
 
+def parse_categories(args):
+    """Categories of a repeated and/or comma-separated category query parameter"""
+    categories = []
+    for value in args.getlist('category'):
+        for category in value.split(','):
+            category = category.strip()
+            if category and category not in categories:
+                categories.append(category)
+    return categories
+
+
+def sales_filters(start_date, end_date, cashier_id=None, categories=None):
+    """
+    WHERE conditions on transactions for a sales report
+    
+    Args:
+        categories: Keep transactions with at least one item in any of these
+            product categories (a single category may be given as a string)
+    """
+    conditions = [
+        Transaction.created_at >= start_date,
+        Transaction.created_at <= end_date
+    ]
+    if cashier_id:
+        conditions.append(Transaction.user_id == cashier_id)
+    if isinstance(categories, str):
+        categories = [categories]
+    if categories:
+        # Probes each transaction's items through the transaction_id index; aliased so the
+        # subquery stays independent of transaction_items/products in the outer query
+        item = db.aliased(TransactionItem)
+        product = db.aliased(Product)
+        conditions.append(
+            db.select(item.id)
+            .join(product, product.id == item.product_id)
+            .where(item.transaction_id == Transaction.id, product.category.in_(categories))
+            .correlate(Transaction)
+            .exists()
+        )
+    return conditions
+
+
+def aggregate_sales_report(conditions):
+    """
+    Compute the sales report with GROUP BY queries in the database
+    
+    Four queries whatever the size of the range: summary, payment methods,
+    top products and cashier performance. Sums are taken in cents.
+    
+    Args:
+        conditions: WHERE conditions on transactions (see sales_filters)
+    
+    Returns:
+        dict: summary, payment_methods, top_products and cashier_performance
+    """
+    completed = Transaction.status == 'completed'
+    is_sale = db.and_(completed, Transaction.transaction_type == 'sale')
+    is_refund = db.and_(completed, Transaction.transaction_type == 'refund')
+    
+    def count_if(condition):
+        return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
+    
+    def sum_if(condition, column):
+        return db.func.coalesce(db.func.sum(db.case((condition, column), else_=0)), 0)
+    
+    summary = db.session.execute(
+        db.select(
+            db.func.count(Transaction.id),
+            count_if(completed),
+            count_if(is_sale),
+            count_if(is_refund),
+            sum_if(is_sale, Transaction.total_cents),
+            sum_if(is_refund, db.func.abs(Transaction.total_cents)),
+            sum_if(is_sale, Transaction.tax_cents),
+            sum_if(is_sale, Transaction.discount_cents)
+        ).where(*conditions)
+    ).one()
+    (total_transactions, completed_count, sales_count, refunds_count,
+     total_sales, total_refunds, total_tax, total_discounts) = (int(value) for value in summary)
+    
+    sale_conditions = [*conditions, is_sale]
+    
+    # Payment method breakdown
+    method = db.func.coalesce(Transaction.payment_method, 'unknown')
+    payment_methods = {
+        name: {'count': count, 'total': to_amount(total)}
+        for name, count, total in db.session.execute(
+            db.select(method, db.func.count(Transaction.id), db.func.sum(Transaction.total_cents))
+            .where(*sale_conditions)
+            .group_by(method)
+        )
+    }
+    
+    # Top products
+    revenue = db.func.sum(TransactionItem.line_total_cents)
+    top_products = [
+        {
+            'product_id': product_id,
+            'name': name or 'Unknown',
+            'quantity': int(quantity),
+            'revenue': to_amount(product_revenue)
+        }
+        for product_id, name, quantity, product_revenue in db.session.execute(
+            db.select(TransactionItem.product_id, Product.name, db.func.sum(TransactionItem.quantity), revenue)
+            .join(Transaction, Transaction.id == TransactionItem.transaction_id)
+            .outerjoin(Product, Product.id == TransactionItem.product_id)
+            .where(*sale_conditions)
+            .group_by(TransactionItem.product_id, Product.name)
+            .order_by(revenue.desc(), TransactionItem.product_id)
+            .limit(10)
+        )
+    ]
+    
+    # Cashier performance
+    cashier_performance = [
+        {
+            'cashier_id': user_id,
+            'name': full_name or 'Unknown',
+            'transaction_count': count,
+            'total_sales': to_amount(total)
+        }
+        for user_id, full_name, count, total in db.session.execute(
+            db.select(Transaction.user_id, User.full_name, db.func.count(Transaction.id), db.func.sum(Transaction.total_cents))
+            .outerjoin(User, User.id == Transaction.user_id)
+            .where(*sale_conditions)
+            .group_by(Transaction.user_id, User.full_name)
+            .order_by(Transaction.user_id)
+        )
+    ]
+    
+    return {
+        'summary': {
+            'total_transactions': total_transactions,
+            'completed_transactions': completed_count,
+            'sales_count': sales_count,
+            'refunds_count': refunds_count,
+            'total_sales': to_amount(total_sales),
+            'total_refunds': to_amount(total_refunds),
+            'net_sales': to_amount(total_sales - total_refunds),
+            'total_tax': to_amount(total_tax),
+            'total_discounts': to_amount(total_discounts),
+            'average_transaction': to_amount(round(total_sales / sales_count)) if sales_count else 0
+        },
+        'payment_methods': payment_methods,
+        'top_products': top_products,
+        'cashier_performance': cashier_performance
+    }
+
+
+def rollup_range(start_date, end_date):
+    """
+    Report period as whole rollup hours
+    
+    Returns:
+        tuple: (start, end) hour boundaries, end exclusive, or None when the
+            period starts or ends inside an hour (e.g. "until now") and has
+            to be read from transactions. A period ending at hh:59:59 covers
+            that whole hour.
+    """
+    end = hour_of(end_date) + timedelta(hours=1)
+    if start_date != hour_of(start_date) or end_date != end - timedelta(seconds=1):
+        return None
+    return start_date, end
+
+
+def rollup_sales_report(start, end, cashier_id=None):
+    """
+    Compute the sales report from the rollups (see SalesRollup)
+    
+    Gives the same result as aggregate_sales_report over [start, end),
+    which must be hour boundaries. Category reports count whole transactions
+    with an item in the category, which the rollups cannot tell apart, so
+    they are always read from transactions.
+    
+    Returns:
+        dict: summary, payment_methods, top_products and cashier_performance
+    """
+    conditions = [db.or_(*(
+        db.and_(SalesRollup.grain == grain, SalesRollup.bucket >= first, SalesRollup.bucket < last)
+        for grain, first, last in bucket_ranges(start, end)
+    ))]
+    if cashier_id:
+        conditions.append(SalesRollup.user_id == cashier_id)
+    totals = [*conditions, SalesRollup.product_id == NO_PRODUCT]
+    has_sales = db.func.sum(SalesRollup.sales_count) > 0
+    
+    def total(column):
+        return db.func.coalesce(db.func.sum(column), 0)
+    
+    summary = db.session.execute(
+        db.select(
+            total(SalesRollup.transaction_count),
+            total(SalesRollup.completed_count),
+            total(SalesRollup.sales_count),
+            total(SalesRollup.refunds_count),
+            total(SalesRollup.sales_cents),
+            total(SalesRollup.refunds_cents),
+            total(SalesRollup.tax_cents),
+            total(SalesRollup.discount_cents)
+        ).where(*totals)
+    ).one()
+    (total_transactions, completed_count, sales_count, refunds_count,
+     total_sales, total_refunds, total_tax, total_discounts) = (int(value) for value in summary)
+    
+    # Payment method breakdown
+    payment_methods = {
+        name: {'count': int(count), 'total': to_amount(method_total)}
+        for name, count, method_total in db.session.execute(
+            db.select(SalesRollup.payment_method, db.func.sum(SalesRollup.sales_count), db.func.sum(SalesRollup.sales_cents))
+            .where(*totals)
+            .group_by(SalesRollup.payment_method)
+            .having(has_sales)
+        )
+    }
+    
+    # Top products
+    revenue = db.func.sum(SalesRollup.revenue_cents)
+    top_products = [
+        {
+            'product_id': product_id,
+            'name': name or 'Unknown',
+            'quantity': int(quantity),
+            'revenue': to_amount(product_revenue)
+        }
+        for product_id, name, quantity, product_revenue in db.session.execute(
+            db.select(SalesRollup.product_id, Product.name, db.func.sum(SalesRollup.quantity), revenue)
+            .outerjoin(Product, Product.id == SalesRollup.product_id)
+            .where(*conditions, SalesRollup.product_id != NO_PRODUCT)
+            .group_by(SalesRollup.product_id, Product.name)
+            .having(has_sales)
+            .order_by(revenue.desc(), SalesRollup.product_id)
+            .limit(10)
+        )
+    ]
+    
+    # Cashier performance
+    cashier_performance = [
+        {
+            'cashier_id': user_id,
+            'name': full_name or 'Unknown',
+            'transaction_count': int(count),
+            'total_sales': to_amount(cashier_total)
+        }
+        for user_id, full_name, count, cashier_total in db.session.execute(
+            db.select(SalesRollup.user_id, User.full_name, db.func.sum(SalesRollup.sales_count), db.func.sum(SalesRollup.sales_cents))
+            .outerjoin(User, User.id == SalesRollup.user_id)
+            .where(*totals)
+            .group_by(SalesRollup.user_id, User.full_name)
+            .having(has_sales)
+            .order_by(SalesRollup.user_id)
+        )
+    ]
+    
+    return {
+        'summary': {
+            'total_transactions': total_transactions,
+            'completed_transactions': completed_count,
+            'sales_count': sales_count,
+            'refunds_count': refunds_count,
+            'total_sales': to_amount(total_sales),
+            'total_refunds': to_amount(total_refunds),
+            'net_sales': to_amount(total_sales - total_refunds),
+            'total_tax': to_amount(total_tax),
+            'total_discounts': to_amount(total_discounts),
+            'average_transaction': to_amount(round(total_sales / sales_count)) if sales_count else 0
+        },
+        'payment_methods': payment_methods,
+        'top_products': top_products,
+        'cashier_performance': cashier_performance
+    }
+
+
 @reports_bp.route('/sales', methods=['GET'])
 @jwt_required()
 def get_sales_report():
     """
     Generate sales report
     
+    Read from the rollups when the period covers whole hours (any
+    start_date/end_date pair does) and no category is given, otherwise
+    from transactions.
+    
     Query params:
         start_date: YYYY-MM-DD
         end_date: YYYY-MM-DD
         cashier_id: int (optional)
-        category: str (optional)
+        category: str (optional) - repeat or comma-separate for several categories
     """
     try:
         # Parse query parameters
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
         cashier_id = request.args.get('cashier_id', type=int)
-        category = request.args.get('category')
+        categories = parse_categories(request.args)
         
         # Default to today if not provided
         if not start_date_str:
@@ -42,81 +326,13 @@ def get_sales_report():
         else:
             end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
         
-        # Build query
-        query = Transaction.query.filter(
-            Transaction.created_at >= start_date,
-            Transaction.created_at <= end_date
-        )
-        
-        if cashier_id:
-            query = query.filter_by(user_id=cashier_id)
-        
-        transactions = query.all()
-        
-        # Filter by category if specified
-        if category:
-            filtered_transactions = []
-            for trans in transactions:
-                has_category = any(
-                    item.product.category == category 
-                    for item in trans.items 
-                    if item.product
-                )
-                if has_category:
-                    filtered_transactions.append(trans)
-            transactions = filtered_transactions
-        
-        # Calculate statistics
-        total_transactions = len(transactions)
-        completed_transactions = [t for t in transactions if t.status == 'completed']
-        sales_transactions = [t for t in completed_transactions if t.transaction_type == 'sale']
-        refund_transactions = [t for t in completed_transactions if t.transaction_type == 'refund']
-        
-        total_sales = sum(t.total_amount for t in sales_transactions)
-        total_refunds = sum(abs(t.total_amount) for t in refund_transactions)
-        net_sales = total_sales - total_refunds
-        
-        total_tax = sum(t.tax_amount for t in sales_transactions)
-        total_discounts = sum(t.discount_amount for t in sales_transactions)
-        
-        # Payment method breakdown
-        payment_methods = {}
-        for trans in sales_transactions:
-            method = trans.payment_method or 'unknown'
-            if method not in payment_methods:
-                payment_methods[method] = {'count': 0, 'total': 0}
-            payment_methods[method]['count'] += 1
-            payment_methods[method]['total'] += trans.total_amount
-        
-        # Top products
-        product_sales = {}
-        for trans in sales_transactions:
-            for item in trans.items:
-                if item.product_id not in product_sales:
-                    product_sales[item.product_id] = {
-                        'product_id': item.product_id,
-                        'name': item.product.name if item.product else 'Unknown',
-                        'quantity': 0,
-                        'revenue': 0
-                    }
-                product_sales[item.product_id]['quantity'] += item.quantity
-                product_sales[item.product_id]['revenue'] += item.line_total
-        
-        top_products = sorted(product_sales.values(), key=lambda x: x['revenue'], reverse=True)[:10]
-        
-        # Cashier performance
-        cashier_sales = {}
-        for trans in sales_transactions:
-            cashier_id = trans.user_id
-            if cashier_id not in cashier_sales:
-                cashier_sales[cashier_id] = {
-                    'cashier_id': cashier_id,
-                    'name': trans.user.full_name if trans.user else 'Unknown',
-                    'transaction_count': 0,
-                    'total_sales': 0
-                }
-            cashier_sales[cashier_id]['transaction_count'] += 1
-            cashier_sales[cashier_id]['total_sales'] += trans.total_amount
+        buckets = None
+        if current_app.config.get('REPORTS_FROM_ROLLUPS', True) and not categories:
+            buckets = rollup_range(start_date, end_date)
+        if buckets:
+            report = rollup_sales_report(*buckets, cashier_id)
+        else:
+            report = aggregate_sales_report(sales_filters(start_date, end_date, cashier_id, categories))
         
         return jsonify({
             'report': {
@@ -124,21 +340,8 @@ def get_sales_report():
                     'start': start_date.isoformat(),
                     'end': end_date.isoformat()
                 },
-                'summary': {
-                    'total_transactions': total_transactions,
-                    'completed_transactions': len(completed_transactions),
-                    'sales_count': len(sales_transactions),
-                    'refunds_count': len(refund_transactions),
-                    'total_sales': round(total_sales, 2),
-                    'total_refunds': round(total_refunds, 2),
-                    'net_sales': round(net_sales, 2),
-                    'total_tax': round(total_tax, 2),
-                    'total_discounts': round(total_discounts, 2),
-                    'average_transaction': round(total_sales / len(sales_transactions), 2) if sales_transactions else 0
-                },
-                'payment_methods': payment_methods,
-                'top_products': top_products,
-                'cashier_performance': list(cashier_sales.values())
+                'source': 'rollups' if buckets else 'transactions',
+                **report
             }
         }), 200
         
@@ -208,27 +411,64 @@ def get_inventory_report():
         return jsonify({'error': str(e)}), 500
 
 
+# Largest page of /history and the most rows an estimated total counts
+HISTORY_MAX_LIMIT = 200
+HISTORY_COUNT_CAP = 10000
+
+
+def encode_cursor(transaction):
+    """Opaque /history cursor pointing just after a transaction"""
+    key = f'{transaction.created_at.isoformat()}|{transaction.id}'
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    (created_at, id) of a /history cursor
+    
+    Raises:
+        ValueError: If the cursor was not produced by encode_cursor
+    """
+    try:
+        created_at, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(transaction_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
 @reports_bp.route('/history', methods=['GET'])
 @jwt_required()
 def get_sales_history():
     """
     Get sales history with search and filtering
     
+    Newest first. Pages are taken by cursor: pass pagination.next_cursor of
+    one page as cursor for the next, which costs the same however deep the
+    page. Each page loads its items, products and cashiers in three queries.
+    
     Query params:
         search: str (transaction number, product name)
         start_date: YYYY-MM-DD
         end_date: YYYY-MM-DD
         status: str
-        limit: int
-        offset: int
+        limit: int (at most 200)
+        cursor: str (next_cursor of the previous page)
+        offset: int (deprecated; rows to skip when no cursor is given)
+        count: 'exact', 'estimate' (exact up to 10000 matches) or 'none';
+            defaults to 'exact' on the first page and 'none' after it
     """
     try:
         search = request.args.get('search')
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
         status = request.args.get('status')
-        limit = request.args.get('limit', default=50, type=int)
+        limit = min(max(request.args.get('limit', default=50, type=int), 1), HISTORY_MAX_LIMIT)
         offset = request.args.get('offset', default=0, type=int)
+        cursor = request.args.get('cursor')
+        count_mode = request.args.get('count', 'none' if cursor else 'exact')
+        
+        if count_mode not in ('exact', 'estimate', 'none'):
+            return jsonify({'error': "count must be 'exact', 'estimate' or 'none'"}), 400
         
         query = Transaction.query
         
@@ -248,19 +488,55 @@ def get_sales_history():
         if status:
             query = query.filter_by(status=status)
         
-        # Get total count
-        total_count = query.count()
-        
-        # Get paginated results
-        transactions = query.order_by(Transaction.created_at.desc()).limit(limit).offset(offset).all()
+        # Total matches, if asked for; an estimate stops counting at the cap
+        total_count = None
+        total_exact = True
+        if count_mode == 'exact':
+            total_count = query.count()
+        elif count_mode == 'estimate':
+            total_count = query.with_entities(Transaction.id).limit(HISTORY_COUNT_CAP + 1).count()
+            total_exact = total_count <= HISTORY_COUNT_CAP
+            total_count = min(total_count, HISTORY_COUNT_CAP)
+        
+        # Keyset page: rows after the cursor in (created_at, id) order, served by the
+        # created_at index (which also holds the primary key)
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(db.tuple_(Transaction.created_at, Transaction.id) < (cursor_created_at, cursor_id))
+        elif offset:
+            query = query.offset(offset)
+        
+        transactions = (
+            query.options(db.selectinload(Transaction.user))
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(transactions) > limit
+        transactions = transactions[:limit]
+        
+        # Items of the whole page with their products in one query
+        items = {}
+        if transactions:
+            for item in (
+                TransactionItem.query.options(db.joinedload(TransactionItem.product))
+                .filter(TransactionItem.transaction_id.in_([t.id for t in transactions]))
+                .order_by(TransactionItem.id)
+            ):
+                items.setdefault(item.transaction_id, []).append(item)
         
         return jsonify({
-            'transactions': [t.to_dict(include_items=True) for t in transactions],
+            'transactions': [t.to_dict(include_items=True, items=items.get(t.id, [])) for t in transactions],
             'pagination': {
                 'total': total_count,
+                'total_exact': total_exact if total_count is not None else None,
                 'limit': limit,
-                'offset': offset,
-                'has_more': (offset + limit) < total_count
+                'offset': 0 if cursor else offset,
+                'has_more': has_more,
+                'next_cursor': encode_cursor(transactions[-1]) if has_more else None
             }
         }), 200
         
@@ -347,6 +623,7 @@ def get_audit_log():
         user_id = request.args.get('user_id', type=int)
         action = request.args.get('action')
         
+        AuditLogger.flush()
         query = AuditLog.query
         
         if user_id:
@@ -364,3 +641,30 @@ def get_audit_log():
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@reports_bp.route('/metrics', methods=['GET'])
+@jwt_required()
+def get_pipeline_metrics():
+    """
+    Latency histograms of each checkout/refund/void stage since the worker started
+    
+    Query parameters:
+        stage: str (optional) - only stages starting with this prefix, e.g. 'checkout'
+    """
+    try:
+        prefix = request.args.get('stage')
+        stages = get_metrics().snapshot()
+        audit_sink = get_audit_sink()
+        if prefix:
+            stages = {name: histogram for name, histogram in stages.items() if name.startswith(prefix)}
+        
+        return jsonify({
+            'stages': stages,
+            'receipt_queue': get_receipt_queue().stats(),
+            'payment_gateway': get_payment_gateway().stats(),
+            'audit_sink': audit_sink.stats() if audit_sink else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
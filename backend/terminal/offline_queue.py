@@ -0,0 +1,134 @@
+"""
+Store-and-forward queue for sales made while a terminal is offline
+
+The queue is an append-only JSON Lines file. Each line is one record:
+
+    {"type": "sale", "sale": {"client_id": ..., "sold_at": ..., "payment_method": ...,
+                              "amount_paid": ..., "items": [{"barcode": ..., "quantity": ...}]}}
+    {"type": "ack", "client_id": ...}
+
+A sale is pending until an ack for its client_id follows it. Every append is
+flushed and fsynced before returning, so a recorded sale survives a crash or
+power cut; a torn last line from a crash mid-write is ignored on read.
+Batches from batch() are the request body of POST /api/checkout/sync, and
+acknowledge() takes its results.
+
+This runs on the till, not in the API server: nothing under terminal/ is
+imported by app.py, and the Docker image leaves it out. It lives in this
+tree as the reference client of the sync endpoint and so the tests can
+drive that endpoint end to end.
+"""
+import json
+import os
+import uuid
+from datetime import datetime
+
+
+class OfflineQueue:
+    """Durable queue of offline sales kept by one terminal"""
+
+    def __init__(self, path, terminal_id=None):
+        """
+        Args:
+            path: JSON Lines file holding the queue (created on first append)
+            terminal_id: Terminal name sent with each batch
+        """
+        self.path = path
+        self.terminal_id = terminal_id
+
+    def _ends_with_torn_line(self):
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return False
+        with open(self.path, 'rb') as queue_file:
+            queue_file.seek(-1, os.SEEK_END)
+            return queue_file.read(1) != b'\n'
+
+    def _append(self, records):
+        torn = self._ends_with_torn_line()
+        with open(self.path, 'a', encoding='utf-8') as queue_file:
+            if torn:
+                queue_file.write('\n')  # Keep the next record off the torn line
+            for record in records:
+                queue_file.write(json.dumps(record) + '\n')
+            queue_file.flush()
+            os.fsync(queue_file.fileno())
+
+    def _records(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, encoding='utf-8') as queue_file:
+            for line in queue_file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # Torn write
+        return records
+
+    def add_sale(self, items, payment_method, amount_paid=None, **fields):
+        """
+        Record a sale made at the till
+
+        Args:
+            items: List of {barcode or product_id, quantity, unit_price}
+            payment_method: 'cash', 'card' or 'upi'
+            amount_paid: Cash handed over (defaults to the total on sync)
+            fields: Optional payment_reference, discount, client_id, sold_at
+
+        Returns:
+            dict: The queued sale, including its client_id
+        """
+        sale = {
+            'client_id': fields.pop('client_id', None) or f'{self.terminal_id or "lane"}-{uuid.uuid4().hex}',
+            'sold_at': fields.pop('sold_at', None) or datetime.utcnow().isoformat(),
+            'payment_method': payment_method,
+            'amount_paid': amount_paid,
+            'items': items,
+            **fields
+        }
+        self._append([{'type': 'sale', 'sale': sale}])
+        return sale
+
+    def pending(self):
+        """Queued sales not yet acknowledged by the backend, oldest first"""
+        sales = {}
+        for record in self._records():
+            if record.get('type') == 'sale':
+                sales.setdefault(record['sale']['client_id'], record['sale'])
+            elif record.get('type') == 'ack':
+                sales.pop(record['client_id'], None)
+        return list(sales.values())
+
+    def batch(self, limit=500):
+        """Request body for POST /api/checkout/sync with up to limit pending sales"""
+        return {'terminal_id': self.terminal_id, 'sales': self.pending()[:limit]}
+
+    def acknowledge(self, results):
+        """
+        Mark sales the backend has stored (created or duplicate) as done
+
+        Rejected sales stay queued for a manager to fix or discard.
+
+        Returns:
+            int: Number of sales acknowledged
+        """
+        done = [result['client_id'] for result in results if result.get('status') in ('created', 'duplicate')]
+        if done:
+            self._append([{'type': 'ack', 'client_id': client_id} for client_id in done])
+        return len(done)
+
+    def discard(self, client_id):
+        """Drop a pending sale without syncing it (e.g. after manual correction)"""
+        self._append([{'type': 'ack', 'client_id': client_id}])
+
+    def compact(self):
+        """Rewrite the file with only pending sales, atomically"""
+        pending = self.pending()
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as queue_file:
+            for sale in pending:
+                queue_file.write(json.dumps({'type': 'sale', 'sale': sale}) + '\n')
+            queue_file.flush()
+            os.fsync(queue_file.fileno())
+        os.replace(temp_path, self.path)
+        return len(pending)
@@ -0,0 +1,109 @@
+"""
+Bulk Insert Benchmark
+Compares per-line cost of writing transaction items and inventory logs one
+ORM object at a time against utils.db.bulk_insert
+
+Usage: python tests/benchmark_bulk_insert.py [lines_per_basket] [baskets]
+"""
+
+import sys
+import os
+import tempfile
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from models.user import db, User
+from models.product import Product
+from models.transaction import Transaction, TransactionItem
+from models.inventory import InventoryLog
+from utils.db import bulk_insert
+
+
+def build_app(path):
+    """Flask app on a throwaway SQLite file"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', role='cashier', email='bench@pos.com', full_name='Bench')
+        user.set_password('bench')
+        db.session.add(user)
+        for i in range(1000):
+            db.session.add(Product(barcode=f'BENCH{i}', name=f'Bench {i}', price=1.99, stock_quantity=10 ** 6, tax_rate=0.18))
+        db.session.commit()
+    return app
+
+
+def basket_rows(transaction_id, lines):
+    """Item and inventory log rows for one basket"""
+    items = [{
+        'transaction_id': transaction_id,
+        'product_id': n % 1000 + 1,
+        'quantity': 1,
+        'unit_price_cents': 199,
+        'discount_cents': 0,
+        'tax_rate': 0.18,
+        'tax_cents': 36,
+        'line_total_cents': 235
+    } for n in range(lines)]
+    logs = [{
+        'product_id': n % 1000 + 1,
+        'user_id': 1,
+        'change_type': 'sale',
+        'quantity_before': 100,
+        'quantity_change': -1,
+        'quantity_after': 99,
+        'reference_type': 'transaction',
+        'reference_id': transaction_id
+    } for n in range(lines)]
+    return items, logs
+
+
+def write_orm(items, logs):
+    for row in items:
+        db.session.add(TransactionItem(**row))
+    for row in logs:
+        db.session.add(InventoryLog(**row))
+
+
+def write_bulk(items, logs):
+    bulk_insert(TransactionItem, items)
+    bulk_insert(InventoryLog, logs)
+
+
+def run(app, writer, lines, baskets):
+    """Seconds spent writing baskets (one commit each) with writer"""
+    elapsed = 0.0
+    with app.app_context():
+        for n in range(baskets):
+            transaction = Transaction(transaction_number=f'{writer.__name__}-{lines}-{n}', user_id=1, transaction_type='sale')
+            db.session.add(transaction)
+            db.session.flush()
+            items, logs = basket_rows(transaction.id, lines)
+            start = time.perf_counter()
+            writer(items, logs)
+            db.session.commit()
+            elapsed += time.perf_counter() - start
+    return elapsed
+
+
+if __name__ == '__main__':
+    sizes = [int(sys.argv[1])] if len(sys.argv) > 1 else [5, 50, 500]
+    baskets = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    
+    print("\n" + "="*60)
+    print("⏱  Transaction item / inventory log insert benchmark")
+    print("="*60)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'bench.db'))
+        for lines in sizes:
+            orm = run(app, write_orm, lines, baskets)
+            bulk = run(app, write_bulk, lines, baskets)
+            rows = lines * baskets
+            print(f"\n{lines} lines x {baskets} baskets")
+            print(f"  ORM add per row : {orm / rows * 1e6:8.1f} µs/line")
+            print(f"  bulk_insert     : {bulk / rows * 1e6:8.1f} µs/line  ({orm / bulk:.1f}x)")
+    print()
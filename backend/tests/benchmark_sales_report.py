@@ -0,0 +1,170 @@
+"""
+Sales Report Benchmark
+Times GET /api/reports/sales computed with GROUP BY queries (routes.reports.
+aggregate_sales_report) and from the hourly rollups (rollup_sales_report)
+against the previous approach of loading every transaction and walking
+items, products and cashiers in Python, on a generated dataset of a year of
+sales. Also times the rollup backfill of that year.
+
+The row-by-row approach is only timed on short ranges; on a month or more it
+issues hundreds of thousands of lazy-load queries.
+
+Usage: python tests/benchmark_sales_report.py [item_rows] [--legacy-month]
+"""
+
+import sys
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from models.user import db, User
+from models.product import Product
+from models.transaction import Transaction, TransactionItem
+from utils.db import bulk_insert
+from models.rollup import SalesRollup
+from routes.reports import sales_filters, aggregate_sales_report, rollup_range, rollup_sales_report
+
+ITEMS_PER_TRANSACTION = 4
+PRODUCTS = 2000
+CASHIERS = 5
+CATEGORIES = ['Snacks', 'Drinks', 'Dairy', 'Bakery', 'Produce', 'Frozen', 'Household', 'Personal Care', 'Pets', 'Baby']
+YEAR_START = datetime(2024, 1, 1)
+
+
+def build_app(path):
+    """Flask app on a throwaway SQLite file"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def generate(app, item_rows, seed=1):
+    """Insert a year of sales with item_rows transaction items in total"""
+    rng = random.Random(seed)
+    transactions = item_rows // ITEMS_PER_TRANSACTION
+    with app.app_context():
+        bulk_insert(User, [{
+            'username': f'cashier{n}', 'password_hash': '-', 'role': 'cashier',
+            'email': f'cashier{n}@pos.com', 'full_name': f'Cashier {n}'
+        } for n in range(CASHIERS)])
+        bulk_insert(Product, [{
+            'barcode': f'BENCH{n}', 'name': f'Product {n}', 'price': 1 + n % 50,
+            'stock_quantity': 10 ** 6, 'tax_rate': 0.18, 'category': CATEGORIES[n % len(CATEGORIES)]
+        } for n in range(PRODUCTS)])
+
+        chunk = 10000
+        seconds_per_transaction = 365 * 24 * 3600 / transactions
+        for first in range(0, transactions, chunk):
+            count = min(chunk, transactions - first)
+            rows = []
+            for n in range(first, first + count):
+                refund = rng.random() < 0.03
+                total = rng.randint(100, 20000)
+                rows.append({
+                    'id': n + 1,
+                    'transaction_number': f'TXN-{n}',
+                    'user_id': rng.randint(1, CASHIERS),
+                    'transaction_type': 'refund' if refund else 'sale',
+                    'status': 'voided' if rng.random() < 0.01 else 'completed',
+                    'subtotal_cents': -total if refund else total,
+                    'discount_cents': 0,
+                    'tax_cents': (-total if refund else total) // 6,
+                    'total_cents': -total if refund else total,
+                    'payment_method': rng.choice(['cash', 'card', 'upi']),
+                    'created_at': YEAR_START + timedelta(seconds=n * seconds_per_transaction)
+                })
+            bulk_insert(Transaction, rows)
+            bulk_insert(TransactionItem, [{
+                'transaction_id': row['id'],
+                'product_id': 1 + int(PRODUCTS * rng.random() ** 3),  # A few products sell most, like a real store
+                'quantity': 1,
+                'unit_price_cents': 199,
+                'discount_cents': 0,
+                'tax_rate': 0.18,
+                'tax_cents': 36,
+                'line_total_cents': 235
+            } for row in rows for _ in range(ITEMS_PER_TRANSACTION)])
+            db.session.commit()
+    return transactions
+
+
+def legacy_report(start, end):
+    """The previous implementation: every row loaded and aggregated in Python"""
+    transactions = Transaction.query.filter(Transaction.created_at >= start, Transaction.created_at <= end).all()
+    sales = [t for t in transactions if t.status == 'completed' and t.transaction_type == 'sale']
+    payment_methods, products, cashiers = {}, {}, {}
+    for t in sales:
+        method = payment_methods.setdefault(t.payment_method or 'unknown', {'count': 0, 'total': 0})
+        method['count'] += 1
+        method['total'] += t.total_cents
+        for item in t.items:
+            product = products.setdefault(item.product_id, {'name': item.product.name, 'quantity': 0, 'revenue': 0})
+            product['quantity'] += item.quantity
+            product['revenue'] += item.line_total_cents
+        cashier = cashiers.setdefault(t.user_id, {'name': t.user.full_name, 'count': 0, 'total': 0})
+        cashier['count'] += 1
+        cashier['total'] += t.total_cents
+    return sorted(products.values(), key=lambda p: p['revenue'], reverse=True)[:10]
+
+
+def timed(app, report, start, end):
+    with app.app_context():
+        begin = time.perf_counter()
+        report(start, end)
+        elapsed = time.perf_counter() - begin
+        db.session.remove()
+    return elapsed
+
+
+def sql_report(start, end):
+    return aggregate_sales_report(sales_filters(start, end))
+
+
+def rollups_report(start, end):
+    return rollup_sales_report(*rollup_range(start, end))
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    item_rows = int(args[0]) if args else 1_000_000
+    legacy_ranges = ('day', 'week', 'month') if '--legacy-month' in sys.argv else ('day', 'week')
+
+    print("\n" + "="*60)
+    print("⏱  Sales report benchmark")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'bench.db'))
+        begin = time.perf_counter()
+        transactions = generate(app, item_rows)
+        print(f"Generated {transactions:,} transactions / {item_rows:,} items in {time.perf_counter() - begin:.1f}s")
+        with app.app_context():
+            begin = time.perf_counter()
+            SalesRollup.rebuild()
+            rollup_count = SalesRollup.query.count()
+        print(f"Backfilled {rollup_count:,} rollup rows in {time.perf_counter() - begin:.1f}s")
+
+        ranges = {
+            'day': timedelta(days=1),
+            'week': timedelta(days=7),
+            'month': timedelta(days=31),
+            'year': timedelta(days=366)
+        }
+        for name, length in ranges.items():
+            start = YEAR_START + timedelta(days=100) if name != 'year' else YEAR_START
+            end = start + length - timedelta(seconds=1)
+            sql = timed(app, sql_report, start, end)
+            rollups = timed(app, rollups_report, start, end)
+            line = f"  {name:5}: rollups {rollups * 1000:8.1f} ms   GROUP BY {sql * 1000:9.1f} ms"
+            if name in legacy_ranges:
+                legacy = timed(app, legacy_report, start, end)
+                line += f"   row-by-row {legacy * 1000:9.1f} ms  ({legacy / sql:.0f}x)"
+            print(line)
+    print()
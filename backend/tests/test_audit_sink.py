@@ -0,0 +1,139 @@
+import threading
+from test_auth import client, get_auth_headers
+from app import app
+from models.user import db
+from models.inventory import AuditLog
+from utils.audit_sink import AuditSink
+from utils.logger import AuditLogger
+
+
+class RecordingWriter:
+    """Stand-in for the database write, recording each batch"""
+    def __init__(self):
+        self.batches = []
+        self.written = threading.Event()
+    
+    def __call__(self, rows):
+        self.batches.append(rows)
+        self.written.set()
+
+
+def test_flushes_on_batch_size():
+    """Test a full batch is written in one call without waiting for the interval"""
+    writer = RecordingWriter()
+    sink = AuditSink(writer, batch_size=3, flush_interval=60)
+    try:
+        for n in range(3):
+            sink.submit({'action': f'a{n}'})
+        assert writer.written.wait(2)
+        assert [row['action'] for row in writer.batches[0]] == ['a0', 'a1', 'a2']
+        assert sink.stats()['batches'] == 1
+    finally:
+        sink.shutdown()
+
+
+def test_flushes_on_interval_and_shutdown():
+    """Test a partial batch waits at most flush_interval and nothing is lost on shutdown"""
+    writer = RecordingWriter()
+    sink = AuditSink(writer, batch_size=100, flush_interval=0.05)
+    sink.submit({'action': 'early'})
+    assert writer.written.wait(2)
+    
+    slow = AuditSink(RecordingWriter(), batch_size=100, flush_interval=60)
+    slow.submit({'action': 'late'})
+    slow.shutdown()
+    assert slow.write.batches == [[{'action': 'late'}]]
+    sink.shutdown()
+
+
+def test_bounded_buffer_and_failed_writes():
+    """Test a full buffer drops entries and a failing write is counted, not raised"""
+    def failing(rows):
+        raise RuntimeError('database is down')
+    sink = AuditSink(failing, batch_size=100, flush_interval=60, max_pending=2)
+    assert sink.submit({}) and sink.submit({})
+    assert sink.submit({}) is False
+    sink.flush()
+    assert sink.stats() == {'pending': 0, 'written': 0, 'batches': 0, 'dropped': 1, 'failed': 2}
+    sink.shutdown()
+
+
+def test_flush_waits_for_the_batch_being_written():
+    """Test flush() returns only after a batch the flush thread already took is written"""
+    started, release = threading.Event(), threading.Event()
+    def slow(rows):
+        started.set()
+        release.wait(5)
+    sink = AuditSink(slow, batch_size=1, flush_interval=60)
+    try:
+        sink.submit({'action': 'taken'})
+        assert started.wait(2)
+        flusher = threading.Thread(target=sink.flush)
+        flusher.start()
+        flusher.join(0.2)
+        assert flusher.is_alive()
+        release.set()
+        flusher.join(2)
+        assert not flusher.is_alive()
+        assert sink.stats()['written'] == 1
+    finally:
+        release.set()
+        sink.shutdown()
+
+
+def test_async_logger_writes_batches(client, monkeypatch):
+    """Test AuditLogger buffers entries and a flush inserts them together"""
+    writer = RecordingWriter()
+    sink = AuditSink(writer, batch_size=100, flush_interval=60)
+    monkeypatch.setitem(app.extensions, 'audit_sink', sink)
+    try:
+        with app.app_context():
+            assert AuditLogger.log(1, 'first') is None
+            AuditLogger.log_login_attempt(1, 'testcashier', False)
+            assert AuditLog.query.count() == 0
+            AuditLogger.flush()
+        assert [[row['action'] for row in batch] for batch in writer.batches] == [['first', 'login']]
+        assert writer.batches[0][1]['status'] == 'failed'
+    finally:
+        sink.shutdown()
+
+
+def test_in_transaction_entry_follows_the_business_commit(client):
+    """Test in_transaction entries commit or roll back with the caller's changes"""
+    with app.app_context():
+        AuditLogger.log(1, 'rolled_back', in_transaction=True)
+        db.session.rollback()
+        AuditLogger.log(1, 'kept', in_transaction=True)
+        assert AuditLog.query.filter_by(action='kept').count() == 1  # autoflush, not yet committed
+        db.session.commit()
+        assert [log.action for log in AuditLog.query.all()] == ['kept']
+
+
+def test_void_records_commit_with_the_void_in_async_mode(client, monkeypatch):
+    """Test void and override entries skip the buffer and are committed with the void"""
+    from models.user import User
+    writer = RecordingWriter()
+    sink = AuditSink(writer, batch_size=100, flush_interval=60)
+    with app.app_context():
+        manager = User(username='testmanager', role='manager', pin='9999', email='m@pos.com', full_name='Test Manager')
+        manager.set_password('test123')
+        db.session.add(manager)
+        db.session.commit()
+        manager_id = manager.id
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    transaction_id = client.post('/api/checkout/process', headers=headers,
+        json={'payment_method': 'cash', 'amount_paid': 100}).get_json()['transaction']['id']
+    
+    monkeypatch.setitem(app.extensions, 'audit_sink', sink)
+    try:
+        response = client.post('/api/checkout/void', headers=headers,
+            json={'transaction_id': transaction_id, 'reason': 'Wrong basket', 'manager_pin': '9999'})
+        assert response.status_code == 200
+        with app.app_context():
+            actions = {log.action for log in AuditLog.query.filter_by(user_id=manager_id)}
+            assert actions == {'override_void'}
+            assert AuditLog.query.filter_by(action='void_transaction').count() == 1
+        assert sink.stats()['pending'] == 0
+    finally:
+        sink.shutdown()
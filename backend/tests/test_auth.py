@@ -5,23 +5,37 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Point the app at a throwaway database before it is imported (CI overrides this)
+os.environ.setdefault('MYSQL_URI', 'sqlite:///:memory:')
+# Render receipts inline: worker threads would share the in-memory database connection
+os.environ.setdefault('RECEIPT_WORKERS', '0')
+# Commit audit entries as they are logged, for the same reason
+os.environ.setdefault('AUDIT_LOG_MODE', 'sync')
+
 from app import app
 from models.user import db, User
 from models.product import Product
 
 
 @pytest.fixture
-def client():
+def client(tmp_path):
     """Create test client"""
     app.config['TESTING'] = True
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     app.config['JWT_SECRET_KEY'] = 'test-secret-key'
+    app.config['CART_VERIFY_TOTALS'] = True
+    app.config['RECEIPT_DIR'] = str(tmp_path / 'receipts')
     
     with app.test_client() as client:
         with app.app_context():
             db.create_all()
             seed_test_data()
         yield client
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+        app.extensions['cart_store'].clear()
+        app.extensions['product_cache'].clear()
 
 
 def seed_test_data():
@@ -1,5 +1,8 @@
 import pytest
 from test_auth import client, get_auth_headers
+from app import app
+from models.user import db
+from models.product import Product
 
 
 def test_add_to_cart(client):
@@ -106,3 +109,130 @@ def test_add_invalid_product(client):
     )
     
     assert response.status_code == 404
+
+
+def test_cart_item_ids_not_reused_after_remove(client):
+    """Test cart_item_id stays unique after a line is removed"""
+    headers = get_auth_headers(client)
+    
+    with app.app_context():
+        db.session.add(Product(barcode='TEST456', name='Second Product', price=5.00, stock_quantity=50))
+        db.session.add(Product(barcode='TEST789', name='Third Product', price=2.50, stock_quantity=50))
+        db.session.commit()
+    
+    first = client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123'}).get_json()
+    first_id = first['cart']['items'][0]['cart_item_id']
+    second = client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST456'}).get_json()
+    second_id = second['cart']['items'][1]['cart_item_id']
+    
+    client.delete(f'/api/cart/remove/{first_id}', headers=headers)
+    data = client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST789'}).get_json()
+    
+    ids = [item['cart_item_id'] for item in data['cart']['items']]
+    assert len(ids) == len(set(ids)) == 2
+    assert first_id not in ids
+    assert second_id in ids
+    
+    # Scanning an existing product merges into its line
+    data = client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST456', 'quantity': 2}).get_json()
+    assert data['cart']['item_count'] == 2
+    assert data['cart']['items'][0]['quantity'] == 3
+
+
+def test_running_totals_match_recompute(client):
+    """Test running totals stay equal to a full recompute across mutations"""
+    import random
+    from routes.cart import (get_user_cart, add_cart_item, price_cart_item, set_cart_item_quantity,
+                             remove_cart_item, get_cart_items, calculate_cart_totals, recalculate_cart_totals)
+    
+    rng = random.Random(42)
+    with app.app_context():
+        cart = get_user_cart(0)
+        for step in range(500):
+            items = get_cart_items(cart)
+            action = rng.random()
+            if action < 0.5 or not items:
+                item = {'product_id': step, 'unit_price': round(rng.uniform(0.5, 999), 2),
+                        'tax_rate': rng.choice([0, 0.05, 0.12, 0.18])}
+                add_cart_item(cart, price_cart_item(item, rng.randint(1, 20)))
+            elif action < 0.8:
+                set_cart_item_quantity(cart, rng.choice(items), rng.randint(1, 50))
+            else:
+                remove_cart_item(cart, rng.choice(items)['cart_item_id'])
+            cart['discount'] = rng.choice([{'type': None, 'amount': 0}, {'type': 'percentage', 'amount': 10},
+                                           {'type': 'fixed', 'amount': 25}])
+            assert calculate_cart_totals(cart) == recalculate_cart_totals(cart)
+
+
+def test_delta_responses(client):
+    """Test opt-in delta responses carry only changed lines, totals and version"""
+    headers = get_auth_headers(client)
+    
+    with app.app_context():
+        db.session.add(Product(barcode='TEST456', name='Second Product', price=5.00, stock_quantity=50))
+        db.session.commit()
+    
+    full = client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123'}).get_json()
+    version = full['cart']['version']
+    
+    delta_headers = {**headers, 'X-Cart-Delta': '1'}
+    data = client.post('/api/cart/add', headers=delta_headers, json={'barcode': 'TEST456', 'quantity': 2}).get_json()
+    delta = data['cart_delta']
+    assert 'cart' not in data
+    assert delta['version'] == version + 1
+    assert [item['barcode'] for item in delta['changed']] == ['TEST456']
+    assert delta['removed'] == []
+    assert delta['item_count'] == 2
+    
+    cart_item_id = delta['changed'][0]['cart_item_id']
+    delta = client.put('/api/cart/update', headers=delta_headers,
+        json={'cart_item_id': cart_item_id, 'quantity': 4}).get_json()['cart_delta']
+    assert delta['version'] == version + 2
+    assert delta['changed'][0]['quantity'] == 4
+    
+    delta = client.delete(f'/api/cart/remove/{cart_item_id}?delta=true', headers=headers).get_json()['cart_delta']
+    assert delta['version'] == version + 3
+    assert delta['changed'] == []
+    assert delta['removed'] == [cart_item_id]
+    
+    full = client.get('/api/cart', headers=headers).get_json()['cart']
+    assert full['version'] == delta['version']
+    assert full['total'] == delta['total']
+
+
+def test_add_batch(client):
+    """Test batch add resolves products together and aggregates quantities"""
+    headers = get_auth_headers(client)
+    
+    with app.app_context():
+        db.session.add(Product(barcode='TEST456', name='Second Product', price=5.00, stock_quantity=3))
+        db.session.commit()
+        second_id = Product.query.filter_by(barcode='TEST456').first().id
+    
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    
+    response = client.post('/api/cart/add-batch', headers=headers, json={'items': [
+        {'barcode': 'TEST123', 'quantity': 2},
+        {'product_id': second_id, 'quantity': 1},
+        {'barcode': 'TEST123'},
+        {'barcode': 'TEST456', 'quantity': 2}
+    ]})
+    
+    assert response.status_code == 200
+    items = {item['barcode']: item for item in response.get_json()['cart']['items']}
+    assert items['TEST123']['quantity'] == 4
+    assert items['TEST456']['quantity'] == 3
+    
+    # Aggregated quantity over stock rejects the whole batch
+    response = client.post('/api/cart/add-batch', headers=headers, json={'items': [
+        {'barcode': 'TEST123', 'quantity': 1},
+        {'barcode': 'TEST456', 'quantity': 1}
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()['items'][0]['product_id'] == second_id
+    
+    response = client.post('/api/cart/add-batch', headers=headers, json={'items': [{'barcode': 'INVALID'}]})
+    assert response.status_code == 404
+    
+    cart = client.get('/api/cart', headers=headers).get_json()['cart']
+    assert {item['barcode']: item['quantity'] for item in cart['items']} == {'TEST123': 4, 'TEST456': 3}
@@ -0,0 +1,205 @@
+import pytest
+import socketserver
+import threading
+import time
+from test_auth import client, get_auth_headers
+from app import app
+from models.user import db, User
+from utils.cart_store import MemoryCartStore, JournaledCartStore, SQLiteCartStore, RedisCartStore, create_cart_store
+
+
+class RedisStandInHandler(socketserver.StreamRequestHandler):
+    """Minimal RESP server supporting the commands RedisCartStore uses"""
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            command = args[0].upper()
+            if command == b'GET':
+                value = data.get(args[1])
+                reply = b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+            elif command == b'SET':
+                data[args[1]] = args[2]
+                reply = b'+OK\r\n'
+            elif command == b'DEL':
+                reply = b':%d\r\n' % (1 if data.pop(args[1], None) is not None else 0)
+            elif command == b'STRLEN':
+                reply = b':%d\r\n' % len(data.get(args[1], b''))
+            elif command == b'KEYS':
+                prefix = args[1].rstrip(b'*')
+                keys = [k for k in data if k.startswith(prefix)]
+                reply = b'*%d\r\n' % len(keys) + b''.join(b'$%d\r\n%s\r\n' % (len(k), k) for k in keys)
+            else:
+                reply = b'-ERR unknown command\r\n'
+            self.wfile.write(reply)
+
+
+@pytest.fixture
+def redis_url():
+    """Run a local Redis stand-in on a free port"""
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), RedisStandInHandler)
+    server.daemon_threads = True
+    server.data = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'redis://127.0.0.1:{server.server_address[1]}/0'
+    server.shutdown()
+    server.server_close()
+
+
+def check_roundtrip(store):
+    cart = {'items': [{'product_id': 1, 'quantity': 2}], 'discount': {'type': None, 'amount': 0}}
+    assert store.get('cart_1') is None
+    store.set('cart_1', cart)
+    assert store.get('cart_1') == cart
+    assert 'cart_1' in store
+    assert store.keys() == ['cart_1']
+    store.delete('cart_1')
+    assert store.get('cart_1') is None
+    store.delete('cart_1')
+
+
+def test_memory_store():
+    check_roundtrip(MemoryCartStore())
+
+
+def test_sqlite_store_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'carts.db')
+    check_roundtrip(SQLiteCartStore(path))
+
+    worker_a = create_cart_store('sqlite', path)
+    worker_b = create_cart_store('sqlite', f'sqlite:///{path}')
+    worker_a.set('cart_7', {'items': []})
+    assert worker_b.get('cart_7') == {'items': []}
+
+
+def test_redis_store(redis_url):
+    check_roundtrip(RedisCartStore(redis_url))
+
+    worker_a = create_cart_store('redis', redis_url)
+    worker_b = create_cart_store('redis', redis_url)
+    worker_a.set('cart_3', {'items': [1]})
+    assert worker_b.get('cart_3') == {'items': [1]}
+    worker_b.clear()
+    assert worker_a.keys() == []
+
+
+def test_cart_survives_switching_worker(client, tmp_path):
+    """A cart written through one store instance is visible to another"""
+    headers = get_auth_headers(client)
+    path = str(tmp_path / 'carts.db')
+    original = app.extensions['cart_store']
+    try:
+        app.extensions['cart_store'] = SQLiteCartStore(path)
+        client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 3})
+
+        app.extensions['cart_store'] = SQLiteCartStore(path)
+        response = client.get('/api/cart', headers=headers)
+        assert response.get_json()['cart']['items'][0]['quantity'] == 3
+
+        client.delete('/api/cart/clear', headers=headers)
+        assert SQLiteCartStore(path).keys() == []
+    finally:
+        app.extensions['cart_store'] = original
+
+
+def test_memory_store_expiry_and_cap():
+    store = MemoryCartStore(idle_ttl=0.05, max_carts=2)
+    discarded = []
+    store.on_discard = discarded.extend
+    store.set('cart_1', {'items': []})
+    store.set('cart_2', {'items': []})
+    store.set('cart_3', {'items': []})
+    assert store.keys() == ['cart_2', 'cart_3']
+    assert store.stats()['evicted'] == 1
+    assert discarded == ['cart_1']
+    
+    time.sleep(0.1)
+    store.set('cart_4', {'items': []})
+    assert store.get('cart_2') is None
+    stats = store.stats()
+    assert stats['cart_count'] == 1
+    assert sorted(discarded) == ['cart_1', 'cart_2', 'cart_3']
+    assert stats['approx_bytes'] > 0
+
+
+def test_sqlite_store_expiry_and_cap(tmp_path):
+    store = SQLiteCartStore(str(tmp_path / 'carts.db'), idle_ttl=0.05, max_carts=2)
+    discarded = []
+    store.on_discard = discarded.extend
+    for i in range(3):
+        store.set(f'cart_{i}', {'items': []})
+        time.sleep(0.001)
+    assert store.stats()['cart_count'] == 2
+    assert 'cart_0' not in store
+    assert discarded == ['cart_0']
+    
+    time.sleep(0.1)
+    assert store.get('cart_2') is None
+    assert store.stats()['cart_count'] == 0
+    assert sorted(discarded) == ['cart_0', 'cart_1', 'cart_2']
+
+
+def test_redis_store_stats(redis_url):
+    store = RedisCartStore(redis_url, idle_ttl=60)
+    store.set('cart_1', {'items': []})
+    stats = store.stats()
+    assert stats['cart_count'] == 1
+    assert stats['approx_bytes'] == len('{"items": []}')
+
+
+def test_cart_max_age_and_stats_endpoint(client):
+    """Test carts older than CART_MAX_AGE are dropped and stats need a manager"""
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    
+    assert client.get('/api/cart/stats', headers=headers).status_code == 403
+    
+    with app.app_context():
+        manager = User(username='testmanager', role='manager', email='manager@pos.com')
+        manager.set_password('test123')
+        db.session.add(manager)
+        db.session.commit()
+    token = client.post('/api/auth/login', json={'username': 'testmanager', 'password': 'test123'}).get_json()['access_token']
+    stats = client.get('/api/cart/stats', headers={'Authorization': f'Bearer {token}'}).get_json()['stats']
+    assert stats['cart_count'] == 1
+    
+    max_age = app.config['CART_MAX_AGE']
+    try:
+        app.config['CART_MAX_AGE'] = 0.01
+        time.sleep(0.02)
+        assert client.get('/api/cart', headers=headers).get_json()['cart']['item_count'] == 0
+    finally:
+        app.config['CART_MAX_AGE'] = max_age
+
+
+def test_journaled_store_recovers_after_crash(tmp_path):
+    path = str(tmp_path / 'carts.journal')
+    check_roundtrip(JournaledCartStore(path))
+    
+    store = JournaledCartStore(path, compact_bytes=600)
+    for i in range(20):
+        store.set(f'cart_{i % 5}', {'items': [i], 'created_at': 'x'})
+    store.delete('cart_4')
+    assert store.stats()['journal_bytes'] < 600  # compacted along the way
+    
+    # Simulate a crash mid-write: a torn record at the end of the journal
+    with open(path, 'a') as f:
+        f.write('{"op":"set","key":"cart_9","ts":1,"ca')
+    
+    recovered = create_cart_store('memory', journal=path)
+    assert recovered.recovered == 4
+    assert sorted(recovered.keys()) == ['cart_0', 'cart_1', 'cart_2', 'cart_3']
+    assert recovered.get('cart_3') == {'items': [18], 'created_at': 'x'}
+    assert recovered.get('cart_4') is None
+    
+    # Carts that went idle while the worker was down are not brought back
+    time.sleep(0.05)
+    assert JournaledCartStore(path, idle_ttl=0.01).keys() == []
@@ -0,0 +1,326 @@
+import pytest
+from sqlalchemy import event
+from test_auth import client, get_auth_headers
+from app import app
+from models.user import db, User
+from models.product import Product
+
+
+def add_manager():
+    """Add a manager whose PIN authorizes refunds and voids"""
+    manager = User(username='testmanager', role='manager', pin='9999', email='m@pos.com', full_name='Test Manager')
+    manager.set_password('test123')
+    db.session.add(manager)
+    db.session.commit()
+
+
+def sell(client, headers, quantity):
+    """Check out quantity units of TEST123, returning the transaction"""
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': quantity})
+    response = client.post('/api/checkout/process', headers=headers,
+        json={'payment_method': 'cash', 'amount_paid': 1000})
+    assert response.status_code == 200
+    return response.get_json()['transaction']
+
+
+def stock_of(barcode):
+    with app.app_context():
+        return Product.query.filter_by(barcode=barcode).first().stock_quantity
+
+
+def test_checkout_loads_products_once_and_void_restores_stock(client):
+    """Test checkout fetches all cart products in one query and void puts stock back"""
+    with app.app_context():
+        add_manager()
+        for n in range(5):
+            db.session.add(Product(barcode=f'BULK{n}', name=f'Bulk {n}', price=1.5, stock_quantity=10, tax_rate=0.05))
+        db.session.commit()
+    
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add-batch', headers=headers,
+        json={'items': [{'barcode': f'BULK{n}', 'quantity': 2} for n in range(5)]})
+    
+    # Product SELECTs issued inside the checkout's write transaction (the unlocked
+    # pre-check runs in a read transaction rolled back before payment; the receipt
+    # reloads after commit)
+    statements = []
+    committed = []
+    def record(conn, cursor, statement, *args):
+        if not committed and statement.lstrip().upper().startswith('SELECT') and 'FROM products' in statement:
+            statements.append(statement)
+    def on_commit(conn):
+        committed.append(True)
+    def on_rollback(conn):
+        if not committed:
+            statements.clear()
+    
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    event.listen(engine, 'commit', on_commit)
+    event.listen(engine, 'rollback', on_rollback)
+    try:
+        response = client.post('/api/checkout/process', headers=headers,
+            json={'payment_method': 'cash', 'amount_paid': 100})
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+        event.remove(engine, 'commit', on_commit)
+        event.remove(engine, 'rollback', on_rollback)
+    
+    assert response.status_code == 200
+    assert len(statements) == 1
+    assert 'IN' in statements[0]
+    transaction_id = response.get_json()['transaction']['id']
+    
+    with app.app_context():
+        assert Product.query.filter_by(barcode='BULK0').first().stock_quantity == 8
+    
+    response = client.post('/api/checkout/void', headers=headers,
+        json={'transaction_id': transaction_id, 'reason': 'Wrong basket', 'manager_pin': '9999'})
+    assert response.status_code == 200
+    
+    with app.app_context():
+        assert all(p.stock_quantity == 10 for p in Product.query.filter(Product.barcode.like('BULK%')))
+
+
+def test_refunded_sale_cannot_be_voided(client):
+    """Test refund followed by void does not restock twice"""
+    with app.app_context():
+        add_manager()
+    headers = get_auth_headers(client)
+    transaction_id = sell(client, headers, 4)['id']
+    
+    response = client.post('/api/checkout/refund', headers=headers,
+        json={'transaction_id': transaction_id, 'reason': 'Returned', 'manager_pin': '9999'})
+    assert response.status_code == 200
+    assert stock_of('TEST123') == 100
+    
+    response = client.post('/api/checkout/void', headers=headers,
+        json={'transaction_id': transaction_id, 'reason': 'Oops', 'manager_pin': '9999'})
+    assert response.status_code == 400
+    assert stock_of('TEST123') == 100
+
+
+def test_partly_refunded_sale_cannot_be_voided_or_fully_refunded(client):
+    """Test a sale with a partial refund keeps its remaining units sold"""
+    with app.app_context():
+        add_manager()
+    headers = get_auth_headers(client)
+    transaction = sell(client, headers, 4)
+    transaction_id = transaction['id']
+    item_id = transaction['items'][0]['id']
+    
+    login = client.post('/api/auth/login', json={'username': 'testmanager', 'password': 'test123'}).get_json()
+    manager_headers = {'Authorization': f"Bearer {login['access_token']}"}
+    response = client.post(f'/api/refunds/transaction/{transaction_id}', headers=manager_headers,
+        json={'amount_cents': 1000, 'items': [{'item_id': item_id, 'quantity': 1}]})
+    assert response.status_code == 201
+    assert stock_of('TEST123') == 97
+    
+    for path in ('/api/checkout/void', '/api/checkout/refund'):
+        response = client.post(path, headers=headers,
+            json={'transaction_id': transaction_id, 'reason': 'Oops', 'manager_pin': '9999'})
+        assert response.status_code == 400
+    assert stock_of('TEST123') == 97
+
+
+def test_checkout_writes_items_and_inventory_logs_in_bulk(client):
+    """Test bulk-inserted items and logs carry the right amounts and ids"""
+    from models.inventory import InventoryLog
+    from utils.db import bulk_insert
+    
+    headers = get_auth_headers(client)
+    transaction = sell(client, headers, 3)
+    assert transaction['items'][0]['line_total'] == 38.9
+    
+    with app.app_context():
+        log = InventoryLog.query.filter_by(reference_id=transaction['id'], change_type='sale').one()
+        assert (log.quantity_before, log.quantity_after) == (100, 97)
+        assert log.timestamp is not None
+        
+        ids = bulk_insert(InventoryLog, [
+            {'product_id': log.product_id, 'change_type': 'adjustment', 'quantity_before': 97,
+             'quantity_change': n, 'quantity_after': 97 + n} for n in range(1, 4)
+        ], return_ids=True)
+        db.session.commit()
+        assert [db.session.get(InventoryLog, i).quantity_change for i in ids] == [1, 2, 3]
+
+
+def test_bulk_insert_returns_ids_without_returning_support(client, monkeypatch):
+    """Test return_ids falls back to one INSERT per row on dialects without RETURNING (MySQL)"""
+    from models.inventory import InventoryLog
+    from utils.db import bulk_insert
+    
+    with app.app_context():
+        dialect = db.session.get_bind().dialect
+        monkeypatch.setattr(dialect, 'insert_executemany_returning_sort_by_parameter_order', False)
+        product_id = Product.query.first().id
+        ids = bulk_insert(InventoryLog, [
+            {'product_id': product_id, 'change_type': 'adjustment', 'quantity_before': 100,
+             'quantity_change': n, 'quantity_after': 100 + n} for n in range(1, 4)
+        ], return_ids=True)
+        db.session.commit()
+        assert [db.session.get(InventoryLog, i).quantity_change for i in ids] == [1, 2, 3]
+
+
+def test_card_authorized_before_db_writes_and_voided_on_failure(client, monkeypatch):
+    """Test payment runs outside the DB transaction and a failed capture voids it"""
+    from utils.payment_simulator import PaymentSimulator
+    gateway = app.extensions['payment_gateway']
+    monkeypatch.setattr(gateway, 'latency_scale', 0)
+    monkeypatch.setitem(PaymentSimulator.SUCCESS_RATES, 'card', 1.0)
+    
+    writes = []
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith(('INSERT', 'UPDATE')):
+            writes.append(statement)
+    authorize = gateway.submit_payment
+    def checked_authorize(*args):
+        assert not writes, 'payment authorized inside the write transaction'
+        # Another lane sells the stock while this payment is being authorized
+        with engine.begin() as conn:
+            conn.execute(Product.__table__.update().values(stock_quantity=2))
+        writes.clear()
+        return authorize(*args)
+    monkeypatch.setattr(gateway, 'submit_payment', checked_authorize)
+    
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 5})
+    
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.post('/api/checkout/process', headers=headers, json={'payment_method': 'card'})
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    
+    assert response.status_code == 400
+    data = response.get_json()
+    assert data['error'] == 'Insufficient stock for Test Product'
+    assert data['payment_voided']['status'] == 'voided'
+    assert stock_of('TEST123') == 2
+    
+    with app.app_context():
+        from models.transaction import Transaction
+        assert Transaction.query.count() == 0
+
+
+def test_short_cart_is_rejected_before_authorizing(client, monkeypatch):
+    """Test the unlocked pre-check turns a short cart away without a gateway call"""
+    gateway = app.extensions['payment_gateway']
+    calls = []
+    monkeypatch.setattr(gateway, 'submit_payment', lambda *args: calls.append(args))
+    
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 5})
+    with app.app_context():
+        Product.query.filter_by(barcode='TEST123').update({'stock_quantity': 2})
+        db.session.commit()
+    
+    response = client.post('/api/checkout/process', headers=headers, json={'payment_method': 'card'})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Insufficient stock for Test Product', 'available': 2}
+    assert calls == []
+
+
+def test_failed_void_still_returns_the_stock_error(client, monkeypatch):
+    """Test a void that raises reports payment_voided False instead of a 500"""
+    from utils.payment_simulator import PaymentSimulator
+    gateway = app.extensions['payment_gateway']
+    monkeypatch.setattr(gateway, 'latency_scale', 0)
+    monkeypatch.setitem(PaymentSimulator.SUCCESS_RATES, 'card', 1.0)
+    
+    authorize = gateway.submit_payment
+    def authorize_then_sell_out(*args):
+        with app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(Product.__table__.update().values(stock_quantity=2))
+        return authorize(*args)
+    def failing_void(*args):
+        raise ConnectionError('gateway unreachable')
+    monkeypatch.setattr(gateway, 'submit_payment', authorize_then_sell_out)
+    monkeypatch.setattr(gateway, 'process_void', failing_void)
+    
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 5})
+    response = client.post('/api/checkout/process', headers=headers, json={'payment_method': 'card'})
+    
+    assert response.status_code == 400
+    assert response.get_json()['payment_voided'] is False
+
+
+def test_refund_paid_before_db_writes_and_voided_on_failure(client, monkeypatch):
+    """Test the refund payment runs outside the write transaction and is voided if recording fails"""
+    from models.transaction import Transaction
+    with app.app_context():
+        add_manager()
+    headers = get_auth_headers(client)
+    transaction_id = sell(client, headers, 4)['id']
+    
+    gateway = app.extensions['payment_gateway']
+    monkeypatch.setattr(gateway, 'latency_scale', 0)
+    with app.app_context():
+        engine = db.engine
+        # Card refunds go back through the gateway; cash ones are handed over at the till
+        db.session.get(Transaction, transaction_id).payment_method = 'card'
+        db.session.commit()
+    writes = []
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith(('INSERT', 'UPDATE')):
+            writes.append(statement)
+    voids = []
+    monkeypatch.setattr(gateway, 'process_void', lambda *args: voids.append(args) or {'status': 'voided'})
+    refund = gateway.process_refund
+    def checked_refund(*args):
+        assert not writes, 'refund paid inside the write transaction'
+        result = refund(*args)
+        # Another lane voids the sale while the refund is being paid, so recording it fails
+        with engine.begin() as conn:
+            conn.execute(Transaction.__table__.update().values(status='voided'))
+        return result
+    monkeypatch.setattr(gateway, 'process_refund', checked_refund)
+    
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.post('/api/checkout/refund', headers=headers,
+            json={'transaction_id': transaction_id, 'reason': 'Returned', 'manager_pin': '9999'})
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    
+    assert response.status_code == 409
+    assert response.get_json()['refund_voided'] == {'status': 'voided'}
+    assert voids and voids[0][2].startswith('REF-')
+    assert stock_of('TEST123') == 96
+
+
+def test_sale_is_priced_while_the_authorization_is_in_flight(client, monkeypatch):
+    """Test checkout submits the authorization and only waits for it once the lines are built"""
+    from concurrent.futures import Future
+    import routes.checkout as checkout
+    from utils.payment_simulator import PaymentSimulator
+    gateway = app.extensions['payment_gateway']
+    monkeypatch.setattr(gateway, 'latency_scale', 0)
+    monkeypatch.setitem(PaymentSimulator.SUCCESS_RATES, 'card', 1.0)
+    
+    pending = Future()
+    authorize = gateway.submit_payment
+    def held_authorization(*args):
+        pending.args = args
+        return pending
+    seen = []
+    sale_lines = checkout.sale_lines
+    def watching(cart_items):
+        seen.append(pending.done())
+        pending.set_result(authorize(*pending.args).result())
+        return sale_lines(cart_items)
+    monkeypatch.setattr(gateway, 'submit_payment', held_authorization)
+    monkeypatch.setattr(checkout, 'sale_lines', watching)
+    
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 2})
+    response = client.post('/api/checkout/process', headers=headers, json={'payment_method': 'card'})
+    
+    assert response.status_code == 200
+    assert seen == [False]
+    assert response.get_json()['transaction']['items'][0]['quantity'] == 2
@@ -0,0 +1,61 @@
+import threading
+import pytest
+from test_auth import client, get_auth_headers
+from test_checkout import sell
+from utils.id_generator import SnowflakeGenerator, MAX_SEQUENCE
+
+
+def test_ids_unique_and_ordered_under_concurrency():
+    """Stress test: many threads on many workers never produce the same id"""
+    generators = [SnowflakeGenerator(worker_id) for worker_id in range(4)]
+    per_thread = 5000
+    results = {}
+    
+    def run(name, generator):
+        results[name] = [generator.next_id() for _ in range(per_thread)]
+    
+    threads = [
+        threading.Thread(target=run, args=((w, t), generator))
+        for w, generator in enumerate(generators) for t in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    all_ids = [i for ids in results.values() for i in ids]
+    assert len(all_ids) == 16 * per_thread
+    assert len(set(all_ids)) == len(all_ids)
+    
+    # Each thread sees its generator's ids strictly increasing
+    for ids in results.values():
+        assert all(a < b for a, b in zip(ids, ids[1:]))
+
+
+def test_sequence_overflow_and_clock_step_back(monkeypatch):
+    """Test the generator waits out a full millisecond and survives the clock going back"""
+    clock = [1_800_000_000_000]
+    monkeypatch.setattr(SnowflakeGenerator, '_now_ms', staticmethod(lambda: clock[0]))
+    generator = SnowflakeGenerator(worker_id=7)
+    
+    ids = [generator.next_id() for _ in range(MAX_SEQUENCE + 1)]
+    assert SnowflakeGenerator.parse(ids[-1]) == (clock[0], 7, MAX_SEQUENCE)
+    
+    clock[0] -= 5
+    def tick(_):
+        clock[0] += 10
+    monkeypatch.setattr('time.sleep', tick)
+    next_id = generator.next_id()
+    assert next_id > ids[-1]
+    assert SnowflakeGenerator.parse(next_id)[2] == 0
+    
+    with pytest.raises(ValueError):
+        SnowflakeGenerator(worker_id=1024)
+
+
+def test_sales_in_the_same_second_get_distinct_numbers(client):
+    """Test back-to-back checkouts no longer collide on the transaction number"""
+    headers = get_auth_headers(client)
+    numbers = {sell(client, headers, 1)['transaction_number'] for _ in range(5)}
+    assert len(numbers) == 5
+    assert all(number.startswith('TXN-') for number in numbers)
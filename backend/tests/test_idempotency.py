@@ -0,0 +1,101 @@
+import pytest
+from test_auth import client, get_auth_headers
+from test_checkout import add_manager, sell, stock_of
+from app import app
+from models.transaction import Transaction
+from models.idempotency import IdempotencyKey
+
+
+def checkout(client, headers, key, amount_paid=1000):
+    return client.post('/api/checkout/process', headers={**headers, 'Idempotency-Key': key},
+        json={'payment_method': 'cash', 'amount_paid': amount_paid})
+
+
+def test_checkout_retry_replays_original_result(client):
+    """Test a retried checkout returns the first response without selling twice"""
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 2})
+    
+    first = checkout(client, headers, 'lane1-sale-1')
+    assert first.status_code == 200
+    
+    retry = checkout(client, headers, 'lane1-sale-1')
+    assert retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    
+    assert stock_of('TEST123') == 98
+    with app.app_context():
+        assert Transaction.query.count() == 1
+    
+    # Same key with a different body is refused
+    assert checkout(client, headers, 'lane1-sale-1', amount_paid=500).status_code == 422
+
+
+def test_failed_request_releases_key(client):
+    """Test a failed keyed request can be retried with the same key once fixed"""
+    headers = get_auth_headers(client)
+    
+    assert checkout(client, headers, 'lane1-sale-2').status_code == 400  # empty cart
+    with app.app_context():
+        assert IdempotencyKey.query.count() == 0
+    
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    response = checkout(client, headers, 'lane1-sale-2')
+    assert response.status_code == 200
+    assert 'Idempotent-Replayed' not in response.headers
+
+
+def test_in_progress_key_conflicts(client):
+    """Test a retry arriving while the first attempt still runs gets 409"""
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    body = b'{"payment_method": "cash", "amount_paid": 1000}'
+    
+    with app.app_context():
+        import hashlib
+        IdempotencyKey.claim(1, '/api/checkout/process', 'lane1-sale-3', hashlib.sha256(body).hexdigest(), 60)
+    
+    response = client.post('/api/checkout/process', data=body, content_type='application/json',
+        headers={**headers, 'Idempotency-Key': 'lane1-sale-3'})
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert stock_of('TEST123') == 100
+
+
+def test_void_retry_runs_once(client):
+    """Test a retried void restores stock once"""
+    with app.app_context():
+        add_manager()
+    headers = get_auth_headers(client)
+    transaction = sell(client, headers, 1)
+    headers['Idempotency-Key'] = 'void-1'
+    
+    body = {'transaction_id': transaction['id'], 'reason': 'Wrong basket', 'manager_pin': '9999'}
+    first = client.post('/api/checkout/void', headers=headers, json=body)
+    assert first.status_code == 200
+    retry = client.post('/api/checkout/void', headers=headers, json=body)
+    assert retry.status_code == 200
+    assert retry.get_json() == first.get_json()
+    assert stock_of('TEST123') == 100
+
+
+def test_refund_retry_runs_once(client):
+    """Test a retried /api/refunds request creates one refund"""
+    with app.app_context():
+        add_manager()
+    transaction = sell(client, get_auth_headers(client), 3)
+    
+    login = client.post('/api/auth/login', json={'username': 'testmanager', 'password': 'test123'}).get_json()
+    headers = {'Authorization': f"Bearer {login['access_token']}", 'Idempotency-Key': 'refund-1'}
+    first = client.post(f"/api/refunds/transaction/{transaction['id']}", headers=headers, json={'reason': 'Damaged'})
+    assert first.status_code == 201
+    retry = client.post(f"/api/refunds/transaction/{transaction['id']}", headers=headers, json={'reason': 'Damaged'})
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    
+    with app.app_context():
+        from models.refund import Refund
+        assert Refund.query.count() == 1
+    assert stock_of('TEST123') == 100
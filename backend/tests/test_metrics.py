@@ -0,0 +1,73 @@
+import pytest
+from test_auth import client, get_auth_headers
+from test_checkout import add_manager
+from app import app
+from utils.metrics import StageHistogram
+
+
+@pytest.fixture
+def metrics():
+    stage_metrics = app.extensions['stage_metrics']
+    stage_metrics.reset()
+    yield stage_metrics
+    stage_metrics.reset()
+    app.config['SERVER_TIMING'] = False
+
+
+def test_histogram_buckets_and_quantiles():
+    """Test observations land in cumulative buckets with bucket-bound quantiles"""
+    histogram = StageHistogram(bounds=(1, 10, 100))
+    for ms in (0.5, 3, 4, 5, 50, 500):
+        histogram.observe(ms)
+    
+    data = histogram.to_dict()
+    assert data['count'] == 6
+    assert [bucket['count'] for bucket in data['buckets']] == [1, 4, 5, 6]
+    assert data['buckets'][-1]['le'] == '+Inf'
+    assert data['p50_ms'] == 10
+    assert data['p99_ms'] == 500
+    assert data['max_ms'] == 500
+
+
+def test_checkout_refund_void_stages_recorded(client, metrics):
+    """Test every pipeline stage shows up on the metrics endpoint"""
+    with app.app_context():
+        add_manager()
+    headers = get_auth_headers(client)
+    app.config['SERVER_TIMING'] = True
+    
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    response = client.post('/api/checkout/process', headers=headers,
+        json={'payment_method': 'cash', 'amount_paid': 100})
+    assert response.status_code == 200
+    server_timing = response.headers['Server-Timing']
+    assert 'checkout.payment;dur=' in server_timing
+    assert 'checkout.total;dur=' in server_timing
+    
+    transaction_id = response.get_json()['transaction']['id']
+    response = client.post('/api/checkout/void', headers=headers,
+        json={'transaction_id': transaction_id, 'reason': 'Oops', 'manager_pin': '9999'})
+    assert response.status_code == 200
+    
+    response = client.get('/api/reports/metrics', headers=headers)
+    assert response.status_code == 200
+    stages = response.get_json()['stages']
+    for stage in ('cart', 'payment', 'stock_check', 'inventory_update', 'commit', 'audit_log', 'receipt', 'total'):
+        assert stages[f'checkout.{stage}']['count'] == 1
+    for stage in ('validate', 'inventory_update', 'commit', 'audit_log', 'total'):
+        assert stages[f'void.{stage}']['count'] == 1
+    assert stages['receipt.render']['count'] == 1
+    
+    only_void = client.get('/api/reports/metrics?stage=void', headers=headers).get_json()['stages']
+    assert all(name.startswith('void.') for name in only_void)
+
+
+def test_server_timing_off_by_default(client, metrics):
+    """Test the Server-Timing header is opt-in"""
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    response = client.post('/api/checkout/process', headers=headers,
+        json={'payment_method': 'cash', 'amount_paid': 100})
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response.headers
+    assert metrics.snapshot()['checkout.total']['count'] == 1
@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import text
+from test_auth import client, get_auth_headers
+from app import app
+from models.user import db
+from models.transaction import Transaction, TransactionItem
+from utils.db import migrate_money_columns, migrate_added_columns, migrate_added_indexes
+from utils.money import to_cents, to_amount, apply_rate, line_amounts, discount_cents
+
+
+def test_money_helpers_round_half_up():
+    """Test conversions and rates round to the nearest cent, half up"""
+    assert to_cents(0.285) == 29
+    assert to_cents('19.99') == 1999
+    assert to_cents(5) == 500
+    assert to_cents(None) == 0
+    assert to_amount(1999) == 19.99
+    assert apply_rate(125, 0.18) == 23  # 22.5 rounds up
+    assert line_amounts(1999, 3, 0.18) == (5997, 1079, 7076)
+    assert discount_cents(1000, 'percentage', 12.5) == 125
+    assert discount_cents(1000, 'fixed', 50) == 1000
+
+
+def test_checkout_stores_exact_cents(client):
+    """Test a sale is recorded in cents matching the cart"""
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 3})
+    cart = client.get('/api/cart', headers=headers).get_json()['cart']
+    
+    response = client.post('/api/checkout/process', headers=headers,
+        json={'payment_method': 'cash', 'amount_paid': 100})
+    assert response.status_code == 200
+    assert response.get_json()['payment_result']['change'] == to_amount(10000 - cart['total_cents'])
+    
+    with app.app_context():
+        transaction = Transaction.query.one()
+        assert transaction.total_cents == cart['total_cents']
+        assert transaction.total_amount == cart['total']
+        assert sum(item.line_total_cents for item in transaction.items) == to_cents(cart['subtotal'])
+        assert db.session.query(db.func.sum(Transaction.total_amount)).scalar() == cart['total']
+
+
+def test_migrate_float_columns_to_cents(client):
+    """Test databases with Float dollar columns are converted in place"""
+    with app.app_context():
+        TransactionItem.__table__.drop(db.engine)
+        Transaction.__table__.drop(db.engine)
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE transactions (id INTEGER PRIMARY KEY, transaction_number VARCHAR(50), '
+                'user_id INTEGER, transaction_type VARCHAR(20), status VARCHAR(20), subtotal FLOAT, '
+                'discount_amount FLOAT, discount_type VARCHAR(20), tax_amount FLOAT, total_amount FLOAT, '
+                'payment_method VARCHAR(20), payment_reference VARCHAR(100), amount_paid FLOAT, '
+                'change_given FLOAT, created_at DATETIME, completed_at DATETIME, refund_reason TEXT, '
+                'authorized_by INTEGER)'
+            ))
+            conn.execute(text(
+                'CREATE TABLE transaction_items (id INTEGER PRIMARY KEY, transaction_id INTEGER, '
+                'product_id INTEGER, quantity INTEGER NOT NULL, unit_price FLOAT NOT NULL, '
+                'discount_amount FLOAT, tax_rate FLOAT, tax_amount FLOAT, line_total FLOAT NOT NULL)'
+            ))
+            conn.execute(text(
+                "INSERT INTO transactions VALUES (1, 'TXN-OLD', 1, 'sale', 'completed', 23.59, 0, NULL, "
+                "4.25, 27.84, 'cash', 'CASH-1', 30, 2.16, NULL, NULL, NULL, NULL)"
+            ))
+            conn.execute(text('INSERT INTO transaction_items VALUES (1, 1, 1, 1, 19.99, 0, 0.18, 3.6, 23.59)'))
+        
+        assert migrate_money_columns() == 10
+        assert migrate_money_columns() == 0
+        assert migrate_added_columns() == 1
+        assert migrate_added_columns() == 0
+        assert migrate_added_indexes() == 2
+        assert migrate_added_indexes() == 0
+        
+        db.session.expire_all()
+        transaction = db.session.get(Transaction, 1)
+        assert (transaction.total_cents, transaction.change_cents) == (2784, 216)
+        assert transaction.items.one().line_total_cents == 2359
+        assert transaction.to_dict()['total_amount'] == 27.84
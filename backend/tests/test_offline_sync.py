@@ -0,0 +1,106 @@
+import pytest
+from test_auth import client, get_auth_headers
+from test_checkout import stock_of
+from app import app
+from models.user import db
+from models.product import Product
+from models.transaction import Transaction
+from models.inventory import InventoryLog
+from terminal.offline_queue import OfflineQueue
+
+
+def sync(client, headers, body):
+    response = client.post('/api/checkout/sync', headers=headers, json=body)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_queue_replays_in_order_and_dedupes(client, tmp_path):
+    """Test queued sales sync once, oldest first, with one stock update per product"""
+    with app.app_context():
+        db.session.add(Product(barcode='OFF1', name='Offline 1', price=2.0, stock_quantity=3, tax_rate=0.0))
+        db.session.commit()
+    queue = OfflineQueue(str(tmp_path / 'lane1.jsonl'), terminal_id='lane1')
+    
+    # Queued out of order; the 10:00 sale gets the last units
+    late = queue.add_sale([{'barcode': 'OFF1', 'quantity': 2}], 'cash', 10, sold_at='2025-10-14T11:00:00')
+    early = queue.add_sale([{'barcode': 'OFF1', 'quantity': 2, 'unit_price': 1.5}, {'barcode': 'TEST123', 'quantity': 1}],
+        'card', sold_at='2025-10-14T10:00:00')
+    assert len(queue.pending()) == 2
+    
+    headers = get_auth_headers(client)
+    data = sync(client, headers, queue.batch())
+    results = {result['client_id']: result for result in data['results']}
+    assert data['summary'] == {'created': 2, 'duplicate': 0, 'rejected': 0, 'conflicts': 1}
+    assert results[early['client_id']]['conflicts'] == []
+    conflict = results[late['client_id']]['conflicts'][0]
+    assert (conflict['type'], conflict['available'], conflict['shortfall']) == ('oversold', 1, 1)
+    
+    assert stock_of('OFF1') == 0
+    assert stock_of('TEST123') == 99
+    with app.app_context():
+        transaction = Transaction.query.filter_by(client_id=early['client_id']).one()
+        assert transaction.created_at.isoformat() == '2025-10-14T10:00:00'
+        # 2 x 1.50 at the offline price, priced like an online checkout of the same lines
+        assert (transaction.subtotal_cents, transaction.tax_cents) == (300 + 1099 + 198, 198)
+        assert transaction.total_cents == 1795
+        assert transaction.payment_reference == f"OFFLINE-{early['client_id']}"
+        late_transaction = Transaction.query.filter_by(client_id=late['client_id']).one()
+        assert late_transaction.change_cents == 600
+        logs = InventoryLog.query.filter_by(reference_id=late_transaction.id).all()
+        assert [(log.quantity_before, log.quantity_change) for log in logs] == [(1, -1)]
+    
+    assert queue.acknowledge(data['results']) == 2
+    assert queue.pending() == []
+    
+    # A lost response means the terminal resends; nothing is sold twice
+    data = sync(client, headers, {'terminal_id': 'lane1', 'sales': [early, early]})
+    assert [result['status'] for result in data['results']] == ['duplicate', 'duplicate']
+    assert stock_of('TEST123') == 99
+
+
+def test_invalid_and_unknown_sales_are_rejected(client, tmp_path):
+    """Test bad sales are reported without blocking the rest of the batch"""
+    queue = OfflineQueue(str(tmp_path / 'lane2.jsonl'), terminal_id='lane2')
+    queue.add_sale([{'barcode': 'TEST123', 'quantity': 1}], 'cash', 20)
+    unknown = queue.add_sale([{'barcode': 'NOPE', 'quantity': 1}], 'cash', 20)
+    body = queue.batch()
+    body['sales'].append({'client_id': 'bad', 'sold_at': 'yesterday', 'payment_method': 'cash', 'items': []})
+    
+    data = sync(client, get_auth_headers(client), body)
+    statuses = [result['status'] for result in data['results']]
+    assert statuses == ['created', 'rejected', 'rejected']
+    assert data['conflicts'][0] == {'type': 'unknown_product', 'client_id': unknown['client_id'], 'products': ['NOPE']}
+    assert data['results'][2]['error'] == 'sold_at must be an ISO timestamp'
+    
+    queue.acknowledge(data['results'])
+    assert [sale['client_id'] for sale in queue.pending()] == [unknown['client_id']]
+    assert queue.compact() == 1
+
+
+def test_bad_amounts_are_rejected_per_sale_and_null_price_uses_current(client):
+    """Test a malformed amount rejects only its sale and a null unit_price is not priced at zero"""
+    sale = {'sold_at': '2025-10-14T10:00:00', 'payment_method': 'cash'}
+    data = sync(client, get_auth_headers(client), {'sales': [
+        {**sale, 'client_id': 'paid-abc', 'amount_paid': 'abc', 'items': [{'barcode': 'TEST123', 'quantity': 1}]},
+        {**sale, 'client_id': 'qty-true', 'items': [{'barcode': 'TEST123', 'quantity': True}]},
+        {**sale, 'client_id': 'price-neg', 'items': [{'barcode': 'TEST123', 'quantity': 1, 'unit_price': -5}]},
+        {**sale, 'client_id': 'price-null', 'items': [{'barcode': 'TEST123', 'quantity': 1, 'unit_price': None}]}
+    ]})
+    assert [result['status'] for result in data['results']] == ['rejected', 'rejected', 'rejected', 'created']
+    assert data['results'][0]['error'] == 'amount_paid must be a non-negative number'
+    assert stock_of('TEST123') == 99
+    with app.app_context():
+        transaction = Transaction.query.filter_by(client_id='price-null').first()
+        assert transaction.total_cents > 1099
+
+def test_queue_survives_torn_write(tmp_path):
+    """Test a half-written last line is skipped and does not swallow the next sale"""
+    path = tmp_path / 'lane3.jsonl'
+    queue = OfflineQueue(str(path), terminal_id='lane3')
+    queue.add_sale([{'barcode': 'TEST123', 'quantity': 1}], 'cash', 20, client_id='a')
+    with open(path, 'a') as queue_file:
+        queue_file.write('{"type": "sale", "sale": {"client_')
+    queue.add_sale([{'barcode': 'TEST123', 'quantity': 1}], 'cash', 20, client_id='b')
+    
+    assert [sale['client_id'] for sale in queue.pending()] == ['a', 'b']
@@ -0,0 +1,58 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.payment_gateway import PaymentGateway
+from utils.payment_simulator import PaymentSimulator
+
+
+def test_authorizations_overlap_without_blocking_threads():
+    """Many authorizations share one loop thread and finish in about one processing time"""
+    gateway = PaymentGateway(latency_scale=0.2)
+    try:
+        start = time.perf_counter()
+        futures = [gateway.submit_payment('card', 10.0) for _ in range(50)]
+        results = [future.result(timeout=5) for future in futures]
+        elapsed = time.perf_counter() - start
+        
+        # 50 card payments of 0.1s each would take 5s one after another
+        assert elapsed < 1.0
+        assert all(result['status'] in ('approved', 'declined') for result in results)
+        assert gateway.stats()['peak_in_flight'] == 50
+        assert gateway.stats()['in_flight'] == 0
+    finally:
+        gateway.shutdown()
+
+
+def test_sync_adapter_matches_simulator():
+    """The blocking adapter keeps PaymentSimulator's results and validation"""
+    gateway = PaymentGateway(latency_scale=0)
+    try:
+        result = gateway.process_payment('cash', 5.0, 'REF-1')
+        assert result['success'] is True
+        assert result['reference'] == 'REF-1'
+        
+        assert gateway.process_payment('cheque', 5.0)['message'] == 'Invalid payment method: cheque'
+        assert gateway.process_payment('card', 0)['message'] == 'Invalid payment amount'
+        
+        refund = gateway.process_refund('card', 5.0, 'CARD-1')
+        assert refund['success'] is True
+        assert refund['original_reference'] == 'CARD-1'
+        
+        # Callers on several request threads can share the adapter
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: gateway.process_payment('cash', 1.0), range(32)))
+        assert all(result['success'] for result in results)
+        assert gateway.stats()['completed'] == 1 + 1 + 32
+    finally:
+        gateway.shutdown()
+
+
+def test_declines_follow_success_rate(monkeypatch):
+    """Outcomes still come from PaymentSimulator's success rates"""
+    monkeypatch.setitem(PaymentSimulator.SUCCESS_RATES, 'upi', 0.0)
+    gateway = PaymentGateway(latency_scale=0)
+    try:
+        result = gateway.process_payment('upi', 5.0)
+        assert result['success'] is False
+        assert result['status'] == 'declined'
+    finally:
+        gateway.shutdown()
@@ -0,0 +1,55 @@
+import pytest
+from test_auth import client, get_auth_headers
+from app import app
+from models.user import db
+from models.product import Product
+from utils.product_cache import ProductCache
+
+
+def test_lru_eviction_and_counters(client):
+    """Test size-bounded eviction and hit/miss counting"""
+    with app.app_context():
+        for i in range(3):
+            db.session.add(Product(barcode=f'LRU{i}', name=f'LRU {i}', price=1.0, stock_quantity=5))
+        db.session.commit()
+        
+        cache = ProductCache(max_size=2)
+        assert cache.get_by_barcode('LRU0').name == 'LRU 0'
+        assert cache.get_by_barcode('LRU0').name == 'LRU 0'
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+        
+        cache.get_by_barcode('LRU1')
+        cache.get_by_barcode('LRU0')  # refresh LRU0
+        cache.get_by_barcode('LRU2')  # evicts LRU1
+        assert cache.stats()['size'] == 2
+        assert cache.stats()['evictions'] == 1
+        assert set(cache._barcodes) == {'LRU0', 'LRU2'}
+        
+        misses = cache.stats()['misses']
+        cache.get_by_barcode('LRU0')
+        cache.get_by_barcode('LRU1')
+        assert cache.stats()['misses'] == misses + 1
+        
+        cache.invalidate(product_id=cache.get_by_barcode('LRU2').id)
+        assert 'LRU2' not in cache._barcodes
+        assert cache.get_by_barcode('MISSING') is None
+
+
+def test_scans_hit_cache_and_checkout_invalidates(client):
+    """Test repeat scans skip the DB and checkout drops stale stock"""
+    headers = get_auth_headers(client)
+    cache = app.extensions['product_cache']
+    
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    hits = cache.stats()['hits']
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    assert cache.stats()['hits'] == hits + 1
+    
+    total = client.get('/api/cart', headers=headers).get_json()['cart']['total']
+    response = client.post('/api/checkout/process', headers=headers,
+        json={'payment_method': 'cash', 'amount_paid': total + 10})
+    assert response.status_code == 200
+    
+    product = client.get('/api/products/TEST123', headers=headers).get_json()['product']
+    assert product['stock_quantity'] == 98
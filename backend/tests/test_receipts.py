@@ -0,0 +1,58 @@
+import threading
+import time
+import pytest
+from test_auth import client, get_auth_headers
+from utils.receipt_queue import ReceiptQueue, ReceiptQueueFull
+
+
+def test_receipt_queue_renders_in_background_with_backpressure():
+    """Test jobs run on worker threads and submit refuses work beyond max_pending"""
+    release = threading.Event()
+    rendered = []
+    
+    def render(transaction_id):
+        release.wait(5)
+        if transaction_id == 'bad':
+            raise IOError('disk full')
+        rendered.append(transaction_id)
+        return f'receipts/receipt_{transaction_id}.pdf'
+    
+    receipt_queue = ReceiptQueue(render, workers=1, max_pending=2)
+    first = receipt_queue.submit(1)
+    # Wait for the worker to pick up the first job so the queue holds exactly max_pending
+    while receipt_queue.get(first['job_id'])['status'] == 'queued':
+        time.sleep(0.001)
+    second = receipt_queue.submit(2)
+    third = receipt_queue.submit('bad')
+    with pytest.raises(ReceiptQueueFull):
+        receipt_queue.submit(4)
+    assert receipt_queue.get(second['job_id'])['status'] == 'queued'
+    
+    release.set()
+    receipt_queue.join()
+    assert receipt_queue.get(second['job_id'])['path'] == 'receipts/receipt_2.pdf'
+    assert receipt_queue.get(third['job_id'])['error'] == 'disk full'
+    stats = receipt_queue.stats()
+    assert (stats['done'], stats['failed'], stats['rejected']) == (2, 1, 1)
+    receipt_queue.shutdown()
+
+
+def test_checkout_returns_receipt_job(client):
+    """Test checkout hands back a receipt job that can be polled and downloaded"""
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1})
+    response = client.post('/api/checkout/process', headers=headers,
+        json={'payment_method': 'cash', 'amount_paid': 100})
+    assert response.status_code == 200
+    receipt = response.get_json()['receipt']
+    
+    response = client.get(f"/api/checkout/receipts/{receipt['job_id']}", headers=headers)
+    assert response.get_json()['receipt']['status'] == 'done'
+    
+    response = client.get(f"/api/checkout/receipts/{receipt['job_id']}?download=true", headers=headers)
+    assert response.status_code == 200
+    assert response.data.startswith(b'%PDF')
+    
+    response = client.post('/api/checkout/receipts', headers=headers, json={'transaction_id': receipt['transaction_id']})
+    assert response.status_code == 202
+    assert client.get('/api/checkout/receipts/unknown', headers=headers).status_code == 404
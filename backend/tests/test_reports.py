@@ -0,0 +1,360 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from test_auth import client, get_auth_headers
+from test_checkout import add_manager, sell
+from app import app
+from models.user import db, User
+from models.product import Product
+from models.transaction import Transaction, TransactionItem
+from models.rollup import SalesRollup, MEASURES, KEY, bucket_ranges
+from routes.reports import sales_filters, aggregate_sales_report, rollup_sales_report
+from utils.money import to_amount
+
+
+def seed_sales(days=3, per_day=20, seed=7):
+    """Random sales, refunds and voids over the last few days across two cashiers"""
+    rng = random.Random(seed)
+    manager = User(username='reportmanager', role='manager', email='r@pos.com', full_name='Report Manager')
+    manager.set_password('test123')
+    db.session.add(manager)
+    products = [Product(barcode=f'RPT{n}', name=f'Report {n}', price=1 + n, stock_quantity=1000,
+                        tax_rate=0.1, category=('Snacks', 'Drinks', 'Dairy')[n % 3]) for n in range(6)]
+    db.session.add_all(products)
+    db.session.flush()
+    cashiers = [1, manager.id]
+    
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    number = 0
+    for day in range(days):
+        for _ in range(per_day):
+            number += 1
+            kind = rng.choice(['sale'] * 6 + ['refund', 'void'])
+            transaction = Transaction(
+                transaction_number=f'RPT-{number}',
+                user_id=rng.choice(cashiers),
+                transaction_type='refund' if kind == 'refund' else 'sale',
+                status='voided' if kind == 'void' else 'completed',
+                payment_method=rng.choice(['cash', 'card', 'upi', None]),
+                created_at=start + timedelta(days=day, minutes=rng.randrange(24 * 60 - 1))
+            )
+            db.session.add(transaction)
+            db.session.flush()
+            subtotal = tax = 0
+            for product in rng.sample(products, rng.randint(1, 3)):
+                quantity = rng.randint(1, 4)
+                line_tax = round(product.price * 10) * quantity
+                line_total = round(product.price * 100) * quantity + line_tax
+                db.session.add(TransactionItem(
+                    transaction_id=transaction.id, product_id=product.id, quantity=quantity,
+                    unit_price_cents=round(product.price * 100), tax_rate=0.1, tax_cents=line_tax,
+                    line_total_cents=line_total
+                ))
+                subtotal += line_total
+                tax += line_tax
+            sign = -1 if kind == 'refund' else 1
+            transaction.subtotal_cents = sign * subtotal
+            transaction.tax_cents = sign * tax
+            transaction.discount_cents = rng.choice([0, 0, 50])
+            transaction.total_cents = sign * (subtotal - transaction.discount_cents + tax)
+    db.session.commit()
+    return start
+
+
+def python_sales_report(transactions):
+    """Reference: the report computed row by row in Python over ORM objects"""
+    sales = [t for t in transactions if t.status == 'completed' and t.transaction_type == 'sale']
+    refunds = [t for t in transactions if t.status == 'completed' and t.transaction_type == 'refund']
+    total_sales = sum(t.total_cents for t in sales)
+    total_refunds = sum(abs(t.total_cents) for t in refunds)
+    
+    payment_methods = {}
+    products = {}
+    cashiers = {}
+    for t in sales:
+        method = payment_methods.setdefault(t.payment_method or 'unknown', {'count': 0, 'total': 0})
+        method['count'] += 1
+        method['total'] += t.total_cents
+        cashier = cashiers.setdefault(t.user_id, {'cashier_id': t.user_id, 'name': t.user.full_name,
+                                                  'transaction_count': 0, 'total_sales': 0})
+        cashier['transaction_count'] += 1
+        cashier['total_sales'] += t.total_cents
+        for item in t.items:
+            product = products.setdefault(item.product_id, {'product_id': item.product_id, 'name': item.product.name,
+                                                            'quantity': 0, 'revenue': 0})
+            product['quantity'] += item.quantity
+            product['revenue'] += item.line_total_cents
+    
+    top_products = sorted(products.values(), key=lambda p: (-p['revenue'], p['product_id']))[:10]
+    return {
+        'summary': {
+            'total_transactions': len(transactions),
+            'completed_transactions': sum(1 for t in transactions if t.status == 'completed'),
+            'sales_count': len(sales),
+            'refunds_count': len(refunds),
+            'total_sales': to_amount(total_sales),
+            'total_refunds': to_amount(total_refunds),
+            'net_sales': to_amount(total_sales - total_refunds),
+            'total_tax': to_amount(sum(t.tax_cents for t in sales)),
+            'total_discounts': to_amount(sum(t.discount_cents for t in sales)),
+            'average_transaction': to_amount(round(total_sales / len(sales))) if sales else 0
+        },
+        'payment_methods': {name: {'count': m['count'], 'total': to_amount(m['total'])} for name, m in payment_methods.items()},
+        'top_products': [{**p, 'revenue': to_amount(p['revenue'])} for p in top_products],
+        'cashier_performance': [{**c, 'total_sales': to_amount(c['total_sales'])} for _, c in sorted(cashiers.items())]
+    }
+
+
+def test_sales_report_matches_python_reference_in_four_queries(client, monkeypatch):
+    """Test the GROUP BY report equals the row-by-row computation"""
+    monkeypatch.setitem(app.config, 'REPORTS_FROM_ROLLUPS', False)
+    with app.app_context():
+        start = seed_sales()
+        engine = db.engine
+    headers = get_auth_headers(client)
+    start_date = start.strftime('%Y-%m-%d')
+    end_date = datetime.utcnow().strftime('%Y-%m-%d')
+    
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(f'/api/reports/sales?start_date={start_date}&end_date={end_date}', headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    report = response.get_json()['report']
+    assert report['source'] == 'transactions'
+    assert len([s for s in statements if 'transactions.created_at >=' in s]) == 4
+    
+    with app.app_context():
+        end = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        transactions = Transaction.query.filter(Transaction.created_at >= start, Transaction.created_at <= end).all()
+        expected = python_sales_report(transactions)
+    
+    assert report['summary'] == expected['summary']
+    assert report['payment_methods'] == expected['payment_methods']
+    assert report['top_products'] == expected['top_products']
+    assert report['cashier_performance'] == expected['cashier_performance']
+    assert report['summary']['sales_count'] > 0
+
+
+def test_sales_report_cashier_filter_and_empty_range(client):
+    """Test the cashier filter and a range with no sales"""
+    with app.app_context():
+        seed_sales(days=1)
+        SalesRollup.rebuild()
+    headers = get_auth_headers(client)
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    
+    report = client.get(f'/api/reports/sales?start_date={today}&end_date={today}&cashier_id=1',
+        headers=headers).get_json()['report']
+    assert [c['cashier_id'] for c in report['cashier_performance']] == [1]
+    
+    report = client.get('/api/reports/sales?start_date=2001-01-01&end_date=2001-01-02', headers=headers).get_json()['report']
+    assert report['summary']['total_transactions'] == 0
+    assert report['summary']['average_transaction'] == 0
+    assert report['payment_methods'] == {} and report['top_products'] == [] and report['cashier_performance'] == []
+
+
+def test_sales_report_category_filter_uses_exists(client):
+    """Test one or several categories keep transactions with an item in any of them"""
+    with app.app_context():
+        start = seed_sales()
+        engine = db.engine
+    headers = get_auth_headers(client)
+    period = f"start_date={start.strftime('%Y-%m-%d')}&end_date={datetime.utcnow().strftime('%Y-%m-%d')}"
+    
+    for query, categories in (('category=Drinks', {'Drinks'}),
+                              ('category=Drinks,Dairy', {'Drinks', 'Dairy'}),
+                              ('category=Drinks&category=%20Dairy', {'Drinks', 'Dairy'})):
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            report = sales_report(client, headers, f'{period}&{query}', rollups=True)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        assert report['source'] == 'transactions'
+        assert len([s for s in statements if 'EXISTS (SELECT' in s]) == 4
+        
+        with app.app_context():
+            end = datetime.utcnow().replace(hour=23, minute=59, second=59, microsecond=0)
+            transactions = [
+                t for t in Transaction.query.filter(Transaction.created_at >= start, Transaction.created_at <= end)
+                if any(item.product.category in categories for item in t.items)
+            ]
+            expected = python_sales_report(transactions)
+        assert {key: report[key] for key in expected} == expected
+        assert expected['summary']['sales_count'] > 0
+
+
+def sales_report(client, headers, query, rollups):
+    app.config['REPORTS_FROM_ROLLUPS'] = rollups
+    try:
+        response = client.get(f'/api/reports/sales?{query}', headers=headers)
+    finally:
+        app.config['REPORTS_FROM_ROLLUPS'] = True
+    assert response.status_code == 200
+    return response.get_json()['report']
+
+
+def rollup_rows():
+    """Rollup rows with a non-zero counter, as comparable tuples"""
+    rows = SalesRollup.query.all()
+    return sorted(
+        tuple(getattr(row, column) for column in KEY + MEASURES)
+        for row in rows if any(getattr(row, measure) for measure in MEASURES)
+    )
+
+
+def test_rollup_report_matches_transactions_report(client):
+    """Test whole-day reports read from rollups give the same answer as the transactions"""
+    with app.app_context():
+        start = seed_sales()
+        assert SalesRollup.rebuild() == 60
+        engine = db.engine
+    headers = get_auth_headers(client)
+    period = f"start_date={start.strftime('%Y-%m-%d')}&end_date={datetime.utcnow().strftime('%Y-%m-%d')}"
+    
+    for query in (period, f'{period}&cashier_id=1'):
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            from_rollups = sales_report(client, headers, query, rollups=True)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        from_transactions = sales_report(client, headers, query, rollups=False)
+        
+        assert from_rollups['source'] == 'rollups'
+        assert not [s for s in statements if 'FROM transactions' in s or 'JOIN transactions' in s]
+        assert {**from_rollups, 'source': None} == {**from_transactions, 'source': None}
+    assert from_rollups['summary']['sales_count'] > 0
+    assert sales_report(client, headers, f'{period}&category=Drinks', rollups=True)['source'] == 'transactions'
+    
+    # Partial days at both ends come from hourly rows, the day between from daily rows
+    with app.app_context():
+        first, last = start + timedelta(hours=7), start + timedelta(days=2, hours=15)
+        assert rollup_sales_report(first, last) == aggregate_sales_report(sales_filters(first, last - timedelta(seconds=1)))
+
+
+def test_rollups_follow_checkout_refund_void_and_sync(client):
+    """Test rollups kept by each write path equal a rebuild from the transactions"""
+    with app.app_context():
+        add_manager()
+        Product.query.filter_by(barcode='TEST123').first().category = 'Tests'
+        db.session.commit()
+        assert SalesRollup.query.count() == 0
+    headers = get_auth_headers(client)
+    login = client.post('/api/auth/login', json={'username': 'testmanager', 'password': 'test123'}).get_json()
+    manager_headers = {'Authorization': f"Bearer {login['access_token']}"}
+    
+    sales = [sell(client, headers, quantity) for quantity in (1, 2, 3, 4)]
+    assert client.post('/api/checkout/void', headers=headers,
+        json={'transaction_id': sales[0]['id'], 'reason': 'Wrong basket', 'manager_pin': '9999'}).status_code == 200
+    assert client.post('/api/checkout/refund', headers=headers,
+        json={'transaction_id': sales[1]['id'], 'reason': 'Returned', 'manager_pin': '9999'}).status_code == 200
+    assert client.post(f'/api/refunds/transaction/{sales[2]["id"]}', headers=manager_headers,
+        json={'reason': 'Returned'}).status_code == 201
+    assert client.post('/api/checkout/sync', headers=headers, json={'sales': [{
+        'client_id': 'lane1-1', 'sold_at': '2025-10-14T10:00:00', 'payment_method': 'card',
+        'items': [{'barcode': 'TEST123', 'quantity': 2}]
+    }]}).status_code == 200
+    
+    with app.app_context():
+        live = rollup_rows()
+        SalesRollup.rebuild()
+        assert rollup_rows() == live
+    
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    for query in (f'start_date={today}&end_date={today}', f'start_date={today}&end_date={today}&cashier_id=1'):
+        report = sales_report(client, headers, query, rollups=True)
+        assert report['source'] == 'rollups'
+        assert report['summary']['sales_count'] == 1
+        assert report['summary']['refunds_count'] == 1
+        assert report['summary']['total_transactions'] == 5
+        assert report['top_products'][0]['quantity'] == 4
+        assert {**report, 'source': None} == {**sales_report(client, headers, query, rollups=False), 'source': None}
+
+
+def test_bucket_ranges_use_coarsest_whole_buckets():
+    """Test a period is covered by whole months, then days, then hours"""
+    assert bucket_ranges(datetime(2025, 1, 30, 22), datetime(2025, 3, 2, 3)) == [
+        ('hour', datetime(2025, 1, 30, 22), datetime(2025, 1, 31)),
+        ('day', datetime(2025, 1, 31), datetime(2025, 2, 1)),
+        ('month', datetime(2025, 2, 1), datetime(2025, 3, 1)),
+        ('day', datetime(2025, 3, 1), datetime(2025, 3, 2)),
+        ('hour', datetime(2025, 3, 2), datetime(2025, 3, 2, 3))
+    ]
+    assert bucket_ranges(datetime(2025, 12, 1), datetime(2026, 1, 1)) == [('month', datetime(2025, 12, 1), datetime(2026, 1, 1))]
+    assert bucket_ranges(datetime(2025, 5, 5, 9), datetime(2025, 5, 5, 17)) == [('hour', datetime(2025, 5, 5, 9), datetime(2025, 5, 5, 17))]
+
+
+def test_history_pages_by_cursor_with_items_in_three_queries(client):
+    """Test cursor pages walk the whole history in order without N+1 item/product/cashier queries"""
+    with app.app_context():
+        seed_sales()
+        # Ten transactions at the same instant straddle page boundaries
+        tied = Transaction.query.order_by(Transaction.id).limit(10).all()
+        for transaction in tied:
+            transaction.created_at = tied[0].created_at
+        db.session.commit()
+        expected = [t.id for t in Transaction.query.order_by(Transaction.created_at.desc(), Transaction.id.desc())]
+        engine = db.engine
+    headers = get_auth_headers(client)
+    
+    seen = []
+    cursor = None
+    first = True
+    while True:
+        statements = []
+        def record(conn, cursor_, statement, *args):
+            statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            params = {'limit': 7, **({'cursor': cursor} if cursor else {})}
+            response = client.get('/api/reports/history', headers=headers, query_string=params)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        assert response.status_code == 200
+        data = response.get_json()
+        page = data['transactions']
+        assert all(t['items'] and t['items'][0]['product_name'] for t in page)
+        assert all(t['cashier'] for t in page)
+        
+        # transactions, cashiers, items with products (+ the total on the first page only)
+        assert len(statements) == (4 if first else 3)
+        assert data['pagination']['total'] == (len(expected) if first else None)
+        first = False
+        
+        seen.extend(t['id'] for t in page)
+        cursor = data['pagination']['next_cursor']
+        assert data['pagination']['has_more'] == (cursor is not None)
+        if not cursor:
+            break
+    assert seen == expected
+
+
+def test_history_count_modes_and_bad_cursor(client, monkeypatch):
+    """Test estimated and skipped totals and rejection of a forged cursor"""
+    with app.app_context():
+        seed_sales(days=1)
+    headers = get_auth_headers(client)
+    
+    data = client.get('/api/reports/history?count=none&limit=5', headers=headers).get_json()
+    assert data['pagination']['total'] is None and data['pagination']['has_more']
+    
+    monkeypatch.setattr('routes.reports.HISTORY_COUNT_CAP', 12)
+    data = client.get('/api/reports/history?count=estimate', headers=headers).get_json()
+    assert data['pagination']['total'] == 12 and data['pagination']['total_exact'] is False
+    data = client.get('/api/reports/history?count=estimate&status=voided', headers=headers).get_json()
+    assert data['pagination']['total_exact'] is True
+    assert data['pagination']['total'] == len(data['transactions'])
+    
+    assert client.get('/api/reports/history?cursor=bm9wZQ', headers=headers).status_code == 400
+    assert client.get('/api/reports/history?count=maybe', headers=headers).status_code == 400
@@ -0,0 +1,115 @@
+import pytest
+from test_auth import client, get_auth_headers
+from app import app
+from models.user import db, User
+from models.product import Product
+from models.reservation import StockReservation
+
+
+@pytest.fixture(autouse=True)
+def reservations_enabled():
+    """Reservations are opt-in; turn them on for this module"""
+    app.config['STOCK_RESERVATION_TTL'] = 900
+    yield
+    app.config['STOCK_RESERVATION_TTL'] = 0
+
+
+def login_second_cashier(client):
+    """Create and log in a second cashier working another lane"""
+    with app.app_context():
+        user = User(username='testcashier2', role='cashier', email='test2@pos.com', full_name='Second Cashier')
+        user.set_password('test123')
+        db.session.add(user)
+        db.session.commit()
+    response = client.post('/api/auth/login', json={'username': 'testcashier2', 'password': 'test123'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def test_reservation_blocks_other_lane_until_cleared(client):
+    """Test stock held by one cart is not available to another"""
+    lane_a = get_auth_headers(client)
+    lane_b = login_second_cashier(client)
+    
+    response = client.post('/api/cart/add', headers=lane_a, json={'barcode': 'TEST123', 'quantity': 95})
+    assert response.status_code == 200
+    
+    response = client.post('/api/cart/add', headers=lane_b, json={'barcode': 'TEST123', 'quantity': 10})
+    assert response.status_code == 400
+    assert response.get_json()['available'] == 5
+    
+    # Lowering the held quantity frees stock
+    cart_item_id = client.get('/api/cart', headers=lane_a).get_json()['cart']['items'][0]['cart_item_id']
+    client.put('/api/cart/update', headers=lane_a, json={'cart_item_id': cart_item_id, 'quantity': 90})
+    assert client.post('/api/cart/add', headers=lane_b, json={'barcode': 'TEST123', 'quantity': 10}).status_code == 200
+    
+    client.delete('/api/cart/clear', headers=lane_a)
+    with app.app_context():
+        assert StockReservation.query.count() == 1
+
+
+def test_checkout_converts_reservations(client):
+    """Test checkout decrements held stock and drops the reservations"""
+    headers = get_auth_headers(client)
+    client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 3})
+    
+    with app.app_context():
+        assert StockReservation.query.count() == 1
+    
+    total = client.get('/api/cart', headers=headers).get_json()['cart']['total']
+    response = client.post('/api/checkout/process', headers=headers,
+        json={'payment_method': 'cash', 'amount_paid': total + 10})
+    assert response.status_code == 200
+    
+    with app.app_context():
+        assert StockReservation.query.count() == 0
+        assert Product.query.filter_by(barcode='TEST123').first().stock_quantity == 97
+
+
+def test_expired_reservation_is_not_held(client):
+    """Test an expired hold no longer blocks other carts"""
+    lane_a = get_auth_headers(client)
+    lane_b = login_second_cashier(client)
+    client.post('/api/cart/add', headers=lane_a, json={'barcode': 'TEST123', 'quantity': 100})
+    
+    with app.app_context():
+        from datetime import datetime, timedelta
+        StockReservation.query.update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+    
+    assert client.post('/api/cart/add', headers=lane_b, json={'barcode': 'TEST123', 'quantity': 100}).status_code == 200
+
+
+def test_evicted_cart_releases_its_holds(client):
+    """Test a cart dropped by the cart count cap gives its stock back"""
+    lane_a = get_auth_headers(client)
+    lane_b = login_second_cashier(client)
+    store = app.extensions['cart_store']
+    max_carts = store.max_carts
+    store.max_carts = 1
+    try:
+        client.post('/api/cart/add', headers=lane_a, json={'barcode': 'TEST123', 'quantity': 10})
+        client.post('/api/cart/add', headers=lane_b, json={'barcode': 'TEST123', 'quantity': 5})
+    finally:
+        store.max_carts = max_carts
+    
+    with app.app_context():
+        assert [(r.cart_key, r.quantity) for r in StockReservation.query.all()] == [('cart_2', 5)]
+
+
+def test_stale_cached_stock_does_not_block_a_reservation(client):
+    """Test add-to-cart lets the locked reservation decide, not the cached stock level"""
+    headers = get_auth_headers(client)
+    with app.app_context():
+        Product.query.filter_by(barcode='TEST123').update({'stock_quantity': 3})
+        db.session.commit()
+    assert client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 1}).status_code == 200
+    
+    # Restocked behind the cache's back
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(Product.__table__.update().values(stock_quantity=50))
+    
+    response = client.post('/api/cart/add', headers=headers, json={'barcode': 'TEST123', 'quantity': 10})
+    assert response.status_code == 200
+    with app.app_context():
+        assert StockReservation.query.one().quantity == 11
@@ -0,0 +1,64 @@
+import threading
+import pytest
+from flask import Flask
+from sqlalchemy.pool import NullPool
+from models.user import db
+from models.product import Product
+import utils.db  # registers every model so the mappers configure
+
+
+@pytest.fixture
+def file_db_app(tmp_path):
+    """App on a file database so each thread gets its own connection"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'stock.db'}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': NullPool, 'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Product(barcode='LAST10', name='Last Units', price=5.0, stock_quantity=10))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_change_stock_never_oversells(file_db_app):
+    """Test many lanes selling one SKU at once sell exactly the stock on hand"""
+    sold = []
+    refused = []
+    start = threading.Barrier(16, timeout=30)
+    
+    def lane():
+        with file_db_app.app_context():
+            product_id = Product.query.filter_by(barcode='LAST10').first().id
+            db.session.close()
+            start.wait()
+            for _ in range(5):
+                new_quantity = Product.change_stock(product_id, -1)
+                db.session.commit()
+                (sold if new_quantity is not None else refused).append(new_quantity)
+    
+    threads = [threading.Thread(target=lane) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(sold) == 10
+    assert sorted(sold) == list(range(10))
+    assert len(refused) == 16 * 5 - 10
+    with file_db_app.app_context():
+        assert Product.query.filter_by(barcode='LAST10').first().stock_quantity == 0
+
+
+def test_change_stock_refuses_oversized_decrement(file_db_app):
+    """Test a decrement larger than the stock changes nothing"""
+    with file_db_app.app_context():
+        product = Product.query.filter_by(barcode='LAST10').first()
+        assert Product.change_stock(product.id, -11, product) is None
+        assert Product.change_stock(product.id, -4, product) == 6
+        assert product.stock_quantity == 6
+        db.session.commit()
+        assert Product.change_stock(product.id, 3) == 9
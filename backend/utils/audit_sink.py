@@ -0,0 +1,153 @@
+import atexit
+import threading
+from flask import current_app
+from models.user import db
+from models.inventory import AuditLog
+from utils.db import bulk_insert
+
+
+class AuditSink:
+    """
+    Buffer of audit log rows written in batches by a background thread
+
+    submit() only appends to an in-memory buffer. The flush thread writes the
+    buffer with one multi-row INSERT and one commit as soon as batch_size rows
+    are waiting or flush_interval seconds have passed, and shutdown() writes
+    whatever is left. If more than max_pending rows pile up (e.g. the database
+    is down) further rows are dropped and counted rather than growing without
+    bound. Rows buffered when the process dies are lost.
+    """
+
+    def __init__(self, write, batch_size=100, flush_interval=1.0, max_pending=10000):
+        """
+        Args:
+            write: Callable persisting a list of AuditLog row dicts
+            batch_size: Rows that trigger a flush without waiting for the interval
+            flush_interval: Longest time in seconds a row waits in the buffer
+            max_pending: Rows buffered before new ones are dropped
+        """
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # One batch written at a time
+        self._in_flight = 0  # Batches taken off the buffer but not yet written
+        self._stopping = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._work, name='audit-flush', daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        """Buffer one row, returning False if it was dropped"""
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _take(self):
+        """Empty the buffer (caller holds _cond); the rows count as in flight until _write"""
+        rows, self._pending = self._pending, []
+        if rows:
+            self._in_flight += 1
+        return rows
+
+    def _write(self, rows):
+        with self._write_lock:
+            try:
+                self.write(rows)
+                self.written += len(rows)
+                self.batches += 1
+            except Exception as e:
+                print(f"Error writing {len(rows)} audit logs: {str(e)}")
+                self.failed += len(rows)
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                rows = self._take()
+                stopping = self._stopping
+            if rows:
+                self._write(rows)
+            if stopping:
+                break
+
+    def flush(self):
+        """Write every buffered row now, on the calling thread"""
+        with self._cond:
+            rows = self._take()
+        if rows:
+            self._write(rows)
+        # Wait for batches the flush thread took before us and is still writing
+        with self._cond:
+            while self._in_flight:
+                self._cond.wait()
+
+    def shutdown(self):
+        """Stop the flush thread after writing what is buffered"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def stats(self):
+        """Buffer depth and write counters"""
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+
+def init_audit_sink(app):
+    """
+    Attach a buffered audit writer when AUDIT_LOG_MODE is 'async'
+
+    In 'sync' mode no sink is created and AuditLogger commits each entry as
+    it is logged (simplest to reason about in tests).
+    """
+    if app.config.get('AUDIT_LOG_MODE', 'async') != 'async':
+        return None
+
+    def write(rows):
+        with app.app_context():
+            try:
+                bulk_insert(AuditLog, rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    sink = AuditSink(
+        write,
+        batch_size=app.config.get('AUDIT_BATCH_SIZE', 100),
+        flush_interval=app.config.get('AUDIT_FLUSH_INTERVAL', 1.0)
+    )
+    atexit.register(sink.shutdown)
+    app.extensions['audit_sink'] = sink
+    return sink
+
+
+def get_audit_sink():
+    """Get the audit writer of the current app, or None in sync mode"""
+    return current_app.extensions.get('audit_sink')
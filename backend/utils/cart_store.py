@@ -0,0 +1,546 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+from flask import current_app
+
+
+class CartStore:
+    """
+    Base class for cart storage backends
+
+    Carts untouched (not saved) for idle_ttl seconds expire. Backends that
+    hold carts locally also cap the number of carts at max_carts, evicting
+    the least recently saved one.
+    """
+
+    backend = None
+    idle_ttl = None
+    max_carts = None
+    on_discard = None  # called with the keys of carts dropped by expiry or the max_carts cap
+
+    def _discarded(self, keys):
+        """Report carts removed without a delete() call"""
+        if keys and self.on_discard:
+            self.on_discard(keys)
+
+    def get(self, key):
+        """Return the cart stored under key, or None"""
+        raise NotImplementedError
+
+    def set(self, key, cart):
+        """Store cart under key"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove the cart stored under key (no error if missing)"""
+        raise NotImplementedError
+
+    def keys(self):
+        """Return all cart keys currently stored"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove every cart"""
+        for key in list(self.keys()):
+            self.delete(key)
+
+    def stats(self):
+        """Live cart count and approximate memory use"""
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+class MemoryCartStore(CartStore):
+    """In-process cart storage (single worker only)"""
+
+    backend = 'memory'
+    SWEEP_INTERVAL = 60  # seconds between scans for expired carts
+
+    def __init__(self, idle_ttl=None, max_carts=None):
+        self.idle_ttl = idle_ttl
+        self.max_carts = max_carts
+        self._carts = OrderedDict()  # key -> (touched_at, cart), least recently saved first
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.expired = 0
+        self.evicted = 0
+
+    def _is_expired(self, touched_at, now):
+        return self.idle_ttl is not None and now - touched_at > self.idle_ttl
+
+    def _sweep(self, now):
+        """Drop expired carts; oldest are at the front so stop at the first live one"""
+        removed = []
+        while self._carts:
+            key, (touched_at, _) = next(iter(self._carts.items()))
+            if not self._is_expired(touched_at, now):
+                break
+            del self._carts[key]
+            removed.append(key)
+            self.expired += 1
+        self._last_sweep = now
+        return removed
+
+    def get(self, key):
+        entry = self._carts.get(key)
+        if entry is None:
+            return None
+        if self._is_expired(entry[0], time.monotonic()):
+            self.delete(key)
+            self.expired += 1
+            self._discarded([key])
+            return None
+        return entry[1]
+
+    def _put(self, key, cart):
+        """Store a cart, returning the keys swept or evicted to make room"""
+        now = time.monotonic()
+        removed = []
+        with self._lock:
+            self._carts[key] = (now, cart)
+            self._carts.move_to_end(key)
+            if now - self._last_sweep > self.SWEEP_INTERVAL:
+                removed += self._sweep(now)
+            while self.max_carts and len(self._carts) > self.max_carts:
+                removed.append(self._carts.popitem(last=False)[0])
+                self.evicted += 1
+        return removed
+
+    def set(self, key, cart):
+        self._discarded(self._put(key, cart))
+
+    def delete(self, key):
+        with self._lock:
+            self._carts.pop(key, None)
+
+    def keys(self):
+        now = time.monotonic()
+        return [key for key, (touched_at, _) in list(self._carts.items())
+                if not self._is_expired(touched_at, now)]
+
+    def clear(self):
+        with self._lock:
+            self._carts.clear()
+
+    def stats(self):
+        with self._lock:
+            removed = self._sweep(time.monotonic())
+            carts = [cart for _, cart in self._carts.values()]
+        self._discarded(removed)
+        return {
+            'backend': self.backend,
+            'cart_count': len(carts),
+            'approx_bytes': sum(len(json.dumps(cart)) for cart in carts),
+            'max_carts': self.max_carts,
+            'idle_ttl_seconds': self.idle_ttl,
+            'expired': self.expired,
+            'evicted': self.evicted
+        }
+
+
+class JournaledCartStore(MemoryCartStore):
+    """
+    In-process cart storage that survives worker restarts
+
+    Every save/delete is appended as one JSON line to a write-ahead journal
+    and flushed to the OS, so a crashed or restarted worker loses nothing.
+    When the journal grows past compact_bytes the live carts are written to
+    a snapshot file (atomically, via rename) and the journal is truncated.
+    On startup the snapshot is loaded and the journal replayed; a torn last
+    line from a crash mid-write is ignored.
+    """
+
+    backend = 'memory+journal'
+
+    def __init__(self, path, idle_ttl=None, max_carts=None, compact_bytes=8 * 1024 * 1024, fsync=False):
+        super().__init__(idle_ttl=idle_ttl, max_carts=max_carts)
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync  # also survive power loss, at the cost of a disk flush per save
+        self._journal_lock = threading.Lock()
+        self._journal = None
+        self._cart_json = {}  # key -> JSON of the cart as last saved
+        self.recovered = self._recover()
+        self.compact()
+
+    def _wall_time(self, touched_at):
+        """Convert a monotonic touch time to wall-clock seconds for the journal"""
+        return time.time() - (time.monotonic() - touched_at)
+
+    def _read_records(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Torn write from a crash; nothing after it was acknowledged
+                    return
+
+    def _recover(self):
+        """Rebuild carts from snapshot + journal, returning how many were recovered"""
+        started = time.perf_counter()
+        carts = OrderedDict()
+        for path in (self.snapshot_path, self.path):
+            for record in self._read_records(path):
+                carts.pop(record['key'], None)
+                if record['op'] == 'set':
+                    carts[record['key']] = (record['ts'], record['cart'])
+
+        offset = time.monotonic() - time.time()
+        for key, (ts, cart) in carts.items():
+            touched_at = ts + offset
+            if not self._is_expired(touched_at, time.monotonic()):
+                self._carts[key] = (touched_at, cart)
+                self._cart_json[key] = json.dumps(cart, separators=(',', ':'))
+        while self.max_carts and len(self._carts) > self.max_carts:
+            self._carts.popitem(last=False)
+
+        if self._carts:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"✓ Recovered {len(self._carts)} carts from journal in {elapsed_ms:.1f} ms")
+        return len(self._carts)
+
+    def _record(self, op, key, ts=None, cart_json=None):
+        line = json.dumps({'op': op, 'key': key, 'ts': ts}, separators=(',', ':'))
+        if cart_json is not None:
+            line = line[:-1] + ',"cart":' + cart_json + '}'
+        return line + '\n'
+
+    def _append(self, line):
+        self._journal.write(line)
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        if self._journal.tell() > self.compact_bytes:
+            self._compact()
+
+    def _compact(self):
+        """Write live carts to the snapshot and start an empty journal (journal lock held)"""
+        # Carts are dicts that requests mutate in place, so the snapshot is built
+        # from the JSON captured at save time rather than by re-serializing them
+        with self._lock:
+            entries = [(key, touched_at) for key, (touched_at, _) in self._carts.items()]
+        live = {key for key, _ in entries}
+        for key in list(self._cart_json):
+            if key not in live:
+                del self._cart_json[key]
+
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, touched_at in entries:
+                if key in self._cart_json:
+                    f.write(self._record('set', key, self._wall_time(touched_at), self._cart_json[key]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        if self._journal:
+            self._journal.close()
+        self._journal = open(self.path, 'w', encoding='utf-8')
+
+    def compact(self):
+        """Snapshot live carts and truncate the journal"""
+        with self._journal_lock:
+            self._compact()
+
+    def set(self, key, cart):
+        cart_json = json.dumps(cart, separators=(',', ':'))
+        with self._journal_lock:
+            removed = self._put(key, cart)
+            self._cart_json[key] = cart_json
+            self._append(self._record('set', key, time.time(), cart_json))
+        self._discarded(removed)
+
+    def delete(self, key):
+        with self._journal_lock:
+            super().delete(key)
+            self._cart_json.pop(key, None)
+            self._append(self._record('del', key))
+
+    def clear(self):
+        with self._journal_lock:
+            super().clear()
+            self._cart_json.clear()
+            self._compact()
+
+    def close(self):
+        """Compact and release the journal file"""
+        with self._journal_lock:
+            self._compact()
+            self._journal.close()
+            self._journal = None
+
+    def stats(self):
+        stats = super().stats()
+        with self._journal_lock:
+            stats['journal_bytes'] = self._journal.tell() if self._journal else 0
+        return stats
+
+
+class SQLiteCartStore(CartStore):
+    """Cart storage in a SQLite file shared by all workers on one host"""
+
+    backend = 'sqlite'
+    PRUNE_INTERVAL = 60  # seconds between expiry/cap passes
+
+    def __init__(self, path, idle_ttl=None, max_carts=None):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.max_carts = max_carts
+        self._last_prune = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS carts ('
+            'cart_key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_carts_updated_at ON carts (updated_at)')
+
+    def _cutoff(self):
+        return time.time() - self.idle_ttl if self.idle_ttl is not None else None
+
+    def _prune(self):
+        """Delete expired carts and the least recently saved ones over max_carts, returning their keys"""
+        removed = []
+        cutoff = self._cutoff()
+        if cutoff is not None:
+            removed += self._conn.execute(
+                'DELETE FROM carts WHERE updated_at < ? RETURNING cart_key', (cutoff,)
+            ).fetchall()
+        if self.max_carts:
+            removed += self._conn.execute(
+                'DELETE FROM carts WHERE cart_key IN ('
+                'SELECT cart_key FROM carts ORDER BY updated_at DESC LIMIT -1 OFFSET ?) RETURNING cart_key',
+                (self.max_carts,)
+            ).fetchall()
+        self._last_prune = time.time()
+        return [row[0] for row in removed]
+
+    def get(self, key):
+        cutoff = self._cutoff()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM carts WHERE cart_key = ? AND updated_at >= ?',
+                (key, cutoff if cutoff is not None else float('-inf'))
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, cart):
+        data = json.dumps(cart)
+        now = time.time()
+        removed = []
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO carts (cart_key, data, updated_at) VALUES (?, ?, ?)',
+                (key, data, now)
+            )
+            if now - self._last_prune > self.PRUNE_INTERVAL:
+                removed = self._prune()
+        self._discarded(removed)
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM carts WHERE cart_key = ?', (key,))
+
+    def keys(self):
+        cutoff = self._cutoff()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT cart_key FROM carts WHERE updated_at >= ?',
+                (cutoff if cutoff is not None else float('-inf'),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM carts')
+
+    def stats(self):
+        with self._lock:
+            removed = self._prune()
+            count, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM carts').fetchone()
+        self._discarded(removed)
+        return {
+            'backend': self.backend,
+            'cart_count': count,
+            'approx_bytes': size,
+            'max_carts': self.max_carts,
+            'idle_ttl_seconds': self.idle_ttl
+        }
+
+
+class RedisCartStore(CartStore):
+    """
+    Cart storage on any server speaking the Redis protocol (RESP)
+
+    Only GET, SET, DEL, KEYS and STRLEN are used, so Redis, KeyDB, Dragonfly
+    or a local stand-in all work. Carts are namespaced with a key prefix.
+    Idle expiry uses the server's own key TTL (SET ... EX); the cart count
+    cap is left to the server's maxmemory eviction policy. The server drops
+    those keys on its own, so on_discard is never called and stock held by
+    such carts is freed by STOCK_RESERVATION_TTL instead.
+    """
+
+    backend = 'redis'
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='pos:', timeout=5.0, idle_ttl=None):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile('rb')
+        if self.password:
+            self._send('AUTH', self.password)
+        if self.db:
+            self._send('SELECT', self.db)
+
+    def _close(self):
+        try:
+            if self._sock:
+                self._sock.close()
+        finally:
+            self._sock = None
+            self._reader = None
+
+    def _send(self, *args):
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            value = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f'${len(value)}\r\n'.encode() + value + b'\r\n')
+        self._sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError('Cart store connection closed')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RuntimeError(f'Cart store error: {payload.decode()}')
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(payload)
+            if count == -1:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise RuntimeError(f'Unexpected reply from cart store: {line!r}')
+
+    def command(self, *args):
+        """Send one command, reconnecting once if the connection dropped"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send(*args)
+                except (ConnectionError, OSError):
+                    self._close()
+                    if attempt:
+                        raise
+
+    def get(self, key):
+        data = self.command('GET', self.prefix + key)
+        return json.loads(data) if data is not None else None
+
+    def set(self, key, cart):
+        if self.idle_ttl:
+            self.command('SET', self.prefix + key, json.dumps(cart), 'EX', int(self.idle_ttl))
+        else:
+            self.command('SET', self.prefix + key, json.dumps(cart))
+
+    def delete(self, key):
+        self.command('DEL', self.prefix + key)
+
+    def keys(self):
+        keys = self.command('KEYS', self.prefix + '*') or []
+        return [key.decode()[len(self.prefix):] for key in keys]
+
+    def stats(self):
+        keys = self.keys()
+        return {
+            'backend': self.backend,
+            'cart_count': len(keys),
+            'approx_bytes': sum(self.command('STRLEN', self.prefix + key) for key in keys),
+            'max_carts': None,
+            'idle_ttl_seconds': self.idle_ttl
+        }
+
+
+def create_cart_store(backend='memory', url=None, idle_ttl=None, max_carts=None, journal=None):
+    """
+    Build a cart store
+
+    Args:
+        backend: 'memory', 'sqlite' or 'redis'
+        url: SQLite file path or redis:// URL (ignored for memory)
+        idle_ttl: Seconds after the last save before a cart expires (None = never)
+        max_carts: Maximum number of carts kept (memory/sqlite only, None = unbounded)
+        journal: Write-ahead journal path making the memory backend restart-safe
+    """
+    if backend == 'memory' and journal:
+        return JournaledCartStore(journal, idle_ttl=idle_ttl, max_carts=max_carts)
+    if backend == 'memory':
+        return MemoryCartStore(idle_ttl=idle_ttl, max_carts=max_carts)
+    if backend == 'sqlite':
+        path = url[len('sqlite:///'):] if url and url.startswith('sqlite:///') else url
+        return SQLiteCartStore(path or ':memory:', idle_ttl=idle_ttl, max_carts=max_carts)
+    if backend == 'redis':
+        return RedisCartStore(url or 'redis://localhost:6379/0', idle_ttl=idle_ttl)
+    raise ValueError(f'Unknown cart store backend: {backend}')
+
+
+def init_cart_store(app, on_discard=None):
+    """
+    Attach the configured cart store to the app
+
+    Args:
+        app: Flask app
+        on_discard: Callback given the keys of carts the store expires or evicts
+    """
+    store = create_cart_store(
+        app.config.get('CART_STORE', 'memory'),
+        app.config.get('CART_STORE_URL'),
+        idle_ttl=app.config.get('CART_IDLE_TTL'),
+        max_carts=app.config.get('CART_MAX_COUNT'),
+        journal=app.config.get('CART_JOURNAL')
+    )
+    store.on_discard = on_discard
+    app.extensions['cart_store'] = store
+    return store
+
+
+def get_cart_store():
+    """Get the cart store of the current app"""
+    return current_app.extensions['cart_store']
@@ -1,12 +1,16 @@
 import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
 from models.user import db, User
 from models.product import Product
 from models.transaction import Transaction, TransactionItem
 from models.inventory import AuditLog, InventoryLog
 from models.refund import Refund
 from models.refresh_token import RefreshToken
+from models.reservation import StockReservation
+from models.idempotency import IdempotencyKey
+from models.rollup import SalesRollup
 from models.settings import Setting, DEFAULT_SETTINGS
 
 
@@ -15,11 +19,171 @@ def init_db(app):
     db.init_app(app)
     
     with app.app_context():
+        had_rollups = db.inspect(db.engine).has_table(SalesRollup.__tablename__)
+        
         # Create all tables
         db.create_all()
+        migrate_money_columns()
+        migrate_added_columns()
+        migrate_added_indexes()
+        
+        # Sales recorded before the rollup table existed
+        if not had_rollups:
+            counted = SalesRollup.rebuild()
+            if counted:
+                print(f"✓ Rolled up {counted} existing transactions")
         print("✓ Database tables created successfully")
 
 
+# Float dollar columns replaced by integer cents: table -> {old column: new column}
+MONEY_COLUMNS = {
+    'transactions': {
+        'subtotal': 'subtotal_cents',
+        'discount_amount': 'discount_cents',
+        'tax_amount': 'tax_cents',
+        'total_amount': 'total_cents',
+        'amount_paid': 'amount_paid_cents',
+        'change_given': 'change_cents'
+    },
+    'transaction_items': {
+        'unit_price': 'unit_price_cents',
+        'discount_amount': 'discount_cents',
+        'tax_amount': 'tax_cents',
+        'line_total': 'line_total_cents'
+    }
+}
+
+
+def migrate_money_columns():
+    """
+    Convert Float dollar columns of databases created before amounts were
+    stored in cents. Safe to run repeatedly: tables already migrated are skipped.
+    
+    Returns:
+        int: Number of columns converted
+    """
+    inspector = db.inspect(db.engine)
+    converted = 0
+    
+    for table, columns in MONEY_COLUMNS.items():
+        if not inspector.has_table(table):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        
+        for old_column, new_column in columns.items():
+            if old_column not in existing:
+                continue
+            with db.engine.begin() as conn:
+                if new_column not in existing:
+                    conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {new_column} INTEGER DEFAULT 0'))
+                conn.execute(text(
+                    f'UPDATE {table} SET {new_column} = ROUND({old_column} * 100) WHERE {old_column} IS NOT NULL'
+                ))
+                conn.execute(text(f'ALTER TABLE {table} DROP COLUMN {old_column}'))
+            converted += 1
+    
+    if converted:
+        print(f"✓ Converted {converted} money columns to cents")
+    return converted
+
+
+# Columns added to existing tables after release: table -> {column: (DDL type, unique)}
+ADDED_COLUMNS = {
+    'transactions': {'client_id': ('VARCHAR(64)', True)}
+}
+
+
+def migrate_added_columns():
+    """
+    Add columns introduced after a database was created (create_all only
+    creates missing tables). Safe to run repeatedly.
+    
+    Returns:
+        int: Number of columns added
+    """
+    inspector = db.inspect(db.engine)
+    added = 0
+    
+    for table, columns in ADDED_COLUMNS.items():
+        if not inspector.has_table(table):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        
+        for column, (ddl_type, unique) in columns.items():
+            if column in existing:
+                continue
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+                unique_sql = 'UNIQUE ' if unique else ''
+                conn.execute(text(f'CREATE {unique_sql}INDEX ix_{table}_{column} ON {table} ({column})'))
+            added += 1
+    
+    if added:
+        print(f"✓ Added {added} new columns")
+    return added
+
+
+# Indexes added to existing tables after release: index name -> (table, columns)
+ADDED_INDEXES = {
+    'ix_transactions_created_at': ('transactions', ['created_at']),
+    'ix_transaction_items_transaction_id': ('transaction_items', ['transaction_id'])
+}
+
+
+def migrate_added_indexes():
+    """
+    Create indexes introduced after a database was created. Safe to run repeatedly.
+    
+    Returns:
+        int: Number of indexes created
+    """
+    inspector = db.inspect(db.engine)
+    created = 0
+    
+    for name, (table, columns) in ADDED_INDEXES.items():
+        if not inspector.has_table(table):
+            continue
+        if name in {index['name'] for index in inspector.get_indexes(table)}:
+            continue
+        with db.engine.begin() as conn:
+            conn.execute(text(f'CREATE INDEX {name} ON {table} ({", ".join(columns)})'))
+        created += 1
+    
+    if created:
+        print(f"✓ Created {created} new indexes")
+    return created
+
+
+def bulk_insert(model, rows, return_ids=False):
+    """
+    Insert many rows of a model in one executemany INSERT
+    
+    Skips building ORM objects and the unit-of-work flush, which costs more
+    than the INSERT itself for large baskets. Python-side column defaults
+    (e.g. timestamps) are still applied.
+    
+    Args:
+        model: Mapped class, e.g. TransactionItem
+        rows: List of dicts keyed by column attribute name
+        return_ids: Return the new primary keys, in row order. One INSERT ... RETURNING
+            where the database supports it (SQLite 3.35+, PostgreSQL, MariaDB 10.5+);
+            elsewhere (MySQL) one INSERT per row, reading each new id
+    
+    Returns:
+        list: New ids when return_ids is set, otherwise None
+    """
+    if not rows:
+        return [] if return_ids else None
+    if return_ids:
+        dialect = db.session.get_bind().dialect
+        if dialect.insert_executemany_returning_sort_by_parameter_order:
+            return list(db.session.scalars(db.insert(model).returning(model.id, sort_by_parameter_order=True), rows))
+        connection = db.session.connection()
+        return [connection.execute(model.__table__.insert(), row).inserted_primary_key[0] for row in rows]
+    db.session.execute(db.insert(model), rows)
+    return None
+
+
 def seed_database(app):
     """Populate database with initial data"""
     with app.app_context():
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from flask import current_app
+
+# 2024-01-01T00:00:00Z in milliseconds; 41 bits of milliseconds from here last until 2093
+EPOCH_MS = 1704067200000
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class SnowflakeGenerator:
+    """
+    Unique, time-ordered 63-bit ids for transaction and refund numbers
+
+    Each id is (milliseconds since EPOCH_MS, worker id, sequence). Ids from
+    one worker never repeat and always increase; ids from workers with
+    different worker ids can never collide. Up to 4096 ids per millisecond
+    per worker; beyond that next_id() waits for the next millisecond.
+    """
+
+    def __init__(self, worker_id=None):
+        """
+        Args:
+            worker_id: 0-1023, unique per terminal/process (None derives one from the process id)
+        """
+        if worker_id is not None and not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'worker_id must be between 0 and {MAX_WORKER_ID}')
+        self._configured_worker_id = worker_id
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        # A forked worker must not continue its parent's sequence under the same worker id
+        self._pid = os.getpid()
+        self.worker_id = self._configured_worker_id
+        if self.worker_id is None:
+            self.worker_id = self._pid & MAX_WORKER_ID
+        self._last_ms = -1
+        self._sequence = 0
+
+    @staticmethod
+    def _now_ms():
+        return int(time.time() * 1000)
+
+    def next_id(self):
+        """Return the next id"""
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._reset()
+            now = self._now_ms()
+            if now < self._last_ms:
+                # Clock stepped back: keep counting in the last millisecond we issued
+                now = self._last_ms
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    while now <= self._last_ms:
+                        time.sleep(0.0001)
+                        now = self._now_ms()
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return ((now - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+    def next_number(self, prefix):
+        """Return the next id formatted as a document number, e.g. TXN-123456789"""
+        return f'{prefix}-{self.next_id()}'
+
+    @staticmethod
+    def parse(snowflake_id):
+        """Split an id into (unix milliseconds, worker id, sequence)"""
+        return (
+            (snowflake_id >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS,
+            (snowflake_id >> SEQUENCE_BITS) & MAX_WORKER_ID,
+            snowflake_id & MAX_SEQUENCE
+        )
+
+
+def init_id_generator(app):
+    """Attach a number generator using the WORKER_ID from app config"""
+    worker_id = app.config.get('WORKER_ID')
+    generator = SnowflakeGenerator(worker_id)
+    app.extensions['id_generator'] = generator
+    return generator
+
+
+def next_number(prefix):
+    """Next unique document number of the current app, e.g. next_number('TXN')"""
+    return current_app.extensions['id_generator'].next_number(prefix)
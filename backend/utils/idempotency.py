@@ -0,0 +1,71 @@
+import hashlib
+from functools import wraps
+from flask import request, jsonify, current_app
+from flask_jwt_extended import get_jwt_identity
+from models.user import db
+from models.idempotency import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def idempotent(view):
+    """
+    Make a write endpoint safe to retry with an Idempotency-Key header
+
+    The first request with a key runs normally; a successful (2xx) response
+    is stored and returned as-is to any retry with the same key from the same
+    user on the same path, without running the view again. Failed requests
+    release the key so the client can fix the problem and retry with it.
+    Requests without the header are not affected. Apply below @jwt_required().
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'}), 400
+
+        user_id = int(get_jwt_identity())
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        record, is_new = IdempotencyKey.claim(
+            user_id, request.path, key, request_hash,
+            current_app.config.get('IDEMPOTENCY_TTL', 24 * 60 * 60)
+        )
+
+        if not is_new:
+            if record.request_hash != request_hash:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+            if record.status != 'done':
+                response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            response = current_app.response_class(
+                record.response_body, status=record.status_code, mimetype='application/json'
+            )
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        record_id = record.id
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            IdempotencyKey.query.filter_by(id=record_id).delete(synchronize_session=False)
+            db.session.commit()
+            raise
+
+        # Anything the view left uncommitted belongs to a request that did not succeed
+        db.session.rollback()
+        if 200 <= response.status_code < 300:
+            IdempotencyKey.query.filter_by(id=record_id).update({
+                'status': 'done',
+                'status_code': response.status_code,
+                'response_body': response.get_data(as_text=True)
+            }, synchronize_session=False)
+        else:
+            IdempotencyKey.query.filter_by(id=record_id).delete(synchronize_session=False)
+        db.session.commit()
+        return response
+
+    return wrapper
@@ -1,6 +1,8 @@
 from datetime import datetime
+from flask import has_app_context
 from models.user import db
 from models.inventory import AuditLog
+from utils.audit_sink import get_audit_sink
 
 
 class AuditLogger:
@@ -8,10 +10,13 @@ class AuditLogger:
     
     @staticmethod
     def log(user_id, action, resource_type=None, resource_id=None, 
-            details=None, ip_address=None, status='success'):
+            details=None, ip_address=None, status='success', in_transaction=False):
         """
         Create an audit log entry
         
+        With AUDIT_LOG_MODE=async the entry is buffered and written in a batch
+        by a background thread; in sync mode it is committed right away.
+        
         Args:
             user_id: ID of the user performing the action
             action: Action being performed (e.g., 'login', 'create_product', 'process_sale')
@@ -20,26 +25,50 @@ class AuditLogger:
             details: Additional details about the action
             ip_address: IP address of the request
             status: Status of the action ('success' or 'failed')
+            in_transaction: Add the entry to the current session instead, so it is
+                committed (or rolled back) together with the caller's changes
+        
+        Returns:
+            AuditLog: The entry, or None when it was buffered or could not be written
         """
+        row = {
+            'user_id': user_id,
+            'action': action,
+            'resource_type': resource_type,
+            'resource_id': resource_id,
+            'details': details,
+            'ip_address': ip_address,
+            'status': status,
+            'timestamp': datetime.utcnow()
+        }
         try:
-            log_entry = AuditLog(
-                user_id=user_id,
-                action=action,
-                resource_type=resource_type,
-                resource_id=resource_id,
-                details=details,
-                ip_address=ip_address,
-                status=status,
-                timestamp=datetime.utcnow()
-            )
+            if in_transaction:
+                log_entry = AuditLog(**row)
+                db.session.add(log_entry)
+                return log_entry
+            
+            sink = get_audit_sink() if has_app_context() else None
+            if sink is not None:
+                sink.submit(row)
+                return None
+            
+            log_entry = AuditLog(**row)
             db.session.add(log_entry)
             db.session.commit()
             return log_entry
         except Exception as e:
             print(f"Error creating audit log: {str(e)}")
-            db.session.rollback()
+            if not in_transaction:
+                db.session.rollback()
             return None
     
+    @staticmethod
+    def flush():
+        """Write buffered entries now, so a following query sees them"""
+        sink = get_audit_sink() if has_app_context() else None
+        if sink is not None:
+            sink.flush()
+    
     @staticmethod
     def log_login_attempt(user_id, username, success, ip_address=None):
         """Log login attempt"""
@@ -67,26 +96,29 @@ class AuditLogger:
         )
     
     @staticmethod
-    def log_transaction_action(user_id, action, transaction_id, details=None, ip_address=None):
-        """Log transaction-related actions"""
+    def log_transaction_action(user_id, action, transaction_id, details=None, ip_address=None,
+                               in_transaction=False):
+        """Log transaction-related actions (in_transaction: see log())"""
         return AuditLogger.log(
             user_id=user_id,
             action=action,
             resource_type='transaction',
             resource_id=transaction_id,
             details=details,
-            ip_address=ip_address
+            ip_address=ip_address,
+            in_transaction=in_transaction
         )
     
     @staticmethod
-    def log_manager_override(manager_id, action, details=None, ip_address=None):
-        """Log manager override actions"""
+    def log_manager_override(manager_id, action, details=None, ip_address=None, in_transaction=False):
+        """Log manager override actions (in_transaction: see log())"""
         return AuditLogger.log(
             user_id=manager_id,
             action=f'override_{action}',
             resource_type='authorization',
             details=details,
-            ip_address=ip_address
+            ip_address=ip_address,
+            in_transaction=in_transaction
         )
     
     @staticmethod
@@ -99,6 +131,7 @@ class AuditLogger:
             user_id: Filter by user ID
             action: Filter by action type
         """
+        AuditLogger.flush()
         query = AuditLog.query.order_by(AuditLog.timestamp.desc())
         
         if user_id:
@@ -114,6 +147,7 @@ class AuditLogger:
         """Get failed login attempts for a user within specified hours"""
         from datetime import timedelta
         cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+        AuditLogger.flush()
         
         logs = AuditLog.query.filter(
             AuditLog.action == 'login',
@@ -0,0 +1,138 @@
+import bisect
+import threading
+import time
+from flask import current_app, g, has_app_context, has_request_context
+
+# Histogram bucket upper bounds in milliseconds; slower observations land in the overflow bucket
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class StageHistogram:
+    """Latency histogram of one pipeline stage"""
+
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        """Upper bucket bound below which a fraction q of observations fall"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self):
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            buckets.append({'le': bound, 'count': cumulative})
+        return {
+            'count': self.count,
+            'sum_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else None,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'buckets': buckets
+        }
+
+
+class StageMetrics:
+    """Thread-safe set of per-stage latency histograms, keyed like 'checkout.payment'"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, ms):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = StageHistogram()
+            histogram.observe(ms)
+
+    def snapshot(self):
+        """Histograms of every stage seen so far, by stage name"""
+        with self._lock:
+            return {stage: histogram.to_dict() for stage, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+def record(stage, ms):
+    """
+    Record one stage duration in the app's histograms
+
+    During a request it is also kept for the Server-Timing header, which is
+    sent when SERVER_TIMING is enabled. Outside an app context it is dropped.
+    """
+    if not has_app_context():
+        return
+    metrics = current_app.extensions.get('stage_metrics')
+    if metrics is not None:
+        metrics.observe(stage, ms)
+    if has_request_context():
+        g.setdefault('server_timing', []).append((stage, ms))
+
+
+class StageTimer:
+    """
+    Lap timer splitting one request into consecutive stages
+
+    Each lap(name) records the time since the previous lap (or since the timer
+    started) as '<operation>.<name>'; finish() records '<operation>.total'.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        record(f'{self.operation}.{stage}', (now - self._last) * 1000)
+        self._last = now
+
+    def finish(self):
+        now = time.perf_counter()
+        record(f'{self.operation}.total', (now - self.started) * 1000)
+        self._last = now
+
+
+def init_metrics(app):
+    """Attach stage histograms and the optional Server-Timing response header"""
+    metrics = StageMetrics()
+    app.extensions['stage_metrics'] = metrics
+
+    @app.after_request
+    def add_server_timing(response):
+        timings = g.get('server_timing')
+        if timings and app.config.get('SERVER_TIMING'):
+            response.headers['Server-Timing'] = ', '.join(
+                f'{stage};dur={ms:.1f}' for stage, ms in timings
+            )
+        return response
+
+    return metrics
+
+
+def get_metrics():
+    """Get the stage histograms of the current app"""
+    return current_app.extensions['stage_metrics']
@@ -0,0 +1,113 @@
+"""
+Fixed-point money helpers
+
+Amounts are carried as integer cents. Dollar floats only appear at the edges
+(request bodies, JSON responses, receipts) and are converted with to_cents()
+and to_amount(). Rates and percentages are applied with half-up rounding to
+the nearest cent, once per line.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy.ext.hybrid import hybrid_property
+
+
+def to_cents(amount):
+    """
+    Convert a dollar amount to integer cents, rounding half up
+
+    Args:
+        amount: int, float, str or Decimal dollar amount (None counts as 0)
+
+    Returns:
+        int: Amount in cents
+    """
+    if amount is None:
+        return 0
+    if isinstance(amount, int):
+        return amount * 100
+    # str() keeps 0.285 as written instead of its binary approximation
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_amount(cents):
+    """Convert integer cents to a dollar float for JSON and display"""
+    return (cents or 0) / 100
+
+
+def apply_rate(cents, rate):
+    """
+    Multiply an amount in cents by a rate, rounding half up to whole cents
+
+    Args:
+        cents: Amount in cents
+        rate: Decimal rate (e.g. 0.18 for 18%)
+
+    Returns:
+        int: Rounded amount in cents
+    """
+    if not rate:
+        return 0
+    return int((Decimal(cents) * Decimal(str(rate))).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def apply_percentage(cents, percent):
+    """Take percent (e.g. 10 for 10%) of an amount in cents"""
+    return apply_rate(cents, Decimal(str(percent or 0)) / 100)
+
+
+def line_amounts(unit_price_cents, quantity, tax_rate, discount_cents=0):
+    """
+    Price a sale line in cents
+
+    Args:
+        unit_price_cents: Unit price in cents
+        quantity: Units sold
+        tax_rate: Tax rate as decimal
+        discount_cents: Line discount in cents, taken before tax
+
+    Returns:
+        tuple: (subtotal_cents, tax_cents, line_total_cents)
+    """
+    subtotal = unit_price_cents * quantity - discount_cents
+    tax = apply_rate(subtotal, tax_rate)
+    return subtotal, tax, subtotal + tax
+
+
+def discount_cents(subtotal_cents, discount_type, amount):
+    """
+    Resolve an order discount to cents
+
+    Args:
+        subtotal_cents: Amount the discount applies to
+        discount_type: 'percentage', 'fixed' or None
+        amount: Percent for 'percentage', dollars for 'fixed'
+
+    Returns:
+        int: Discount in cents, never more than the subtotal
+    """
+    if discount_type == 'percentage':
+        return min(apply_percentage(subtotal_cents, amount), subtotal_cents)
+    if discount_type == 'fixed':
+        return min(to_cents(amount), subtotal_cents)
+    return 0
+
+
+def dollars_of(cents_attr):
+    """
+    Dollar view of an integer-cents model column
+
+    Reads and writes convert through to_amount()/to_cents(), and in queries it
+    compiles to cents / 100.0 so filters and sums on the dollar name keep working.
+
+    Args:
+        cents_attr: Name of the integer-cents column attribute
+    """
+    def fget(self):
+        return to_amount(getattr(self, cents_attr))
+
+    def fset(self, value):
+        setattr(self, cents_attr, to_cents(value))
+
+    def expr(cls):
+        return getattr(cls, cents_attr) / 100.0
+
+    return hybrid_property(fget, fset, expr=expr)
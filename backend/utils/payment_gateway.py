@@ -0,0 +1,124 @@
+import asyncio
+import atexit
+import threading
+from flask import current_app
+from utils.payment_simulator import PaymentSimulator
+
+
+class PaymentGateway:
+    """
+    Non-blocking front end to the simulated payment processor
+
+    Authorizations, voids and refunds are coroutines on one event loop
+    running in a background thread, so the simulated processing time is an
+    asyncio.sleep rather than a blocked worker: any number of them can be in
+    flight at once. Outcomes follow PaymentSimulator's success rates and
+    processing times.
+
+    The submit_*() methods return a concurrent.futures.Future that request
+    code can start early and collect later; checkout submits the
+    authorization and prices the sale while it is in flight.
+    process_payment(), process_void() and process_refund() are blocking
+    adapters with PaymentSimulator's signatures, kept for call sites with
+    nothing to overlap. The app runs on a synchronous WSGI server, so a
+    request still holds its worker until it collects a result; only under an
+    async server (awaiting authorize()/refund()/void() directly) would a
+    waiting request free its worker, and the adapters would then go away.
+    """
+
+    def __init__(self, latency_scale=1.0):
+        """
+        Args:
+            latency_scale: Multiplier on the simulated processing times (0 answers at once)
+        """
+        self.latency_scale = latency_scale
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='payment-gateway', daemon=True)
+        self._thread.start()
+
+    async def _processing(self, seconds):
+        # Counters are only touched on the loop thread, so they need no lock
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(seconds * self.latency_scale)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def authorize(self, payment_method, amount, reference=None):
+        """Coroutine form of PaymentSimulator.process_payment"""
+        failure = PaymentSimulator._check_request(payment_method, amount)
+        if failure:
+            return failure
+        await self._processing(PaymentSimulator.PROCESSING_TIMES[payment_method])
+        return PaymentSimulator._settle_payment(payment_method, amount, reference)
+
+    async def refund(self, original_payment_method, amount, original_reference=None):
+        """Coroutine form of PaymentSimulator.process_refund"""
+        await self._processing(PaymentSimulator.REFUND_PROCESSING_TIME)
+        return PaymentSimulator._settle_refund(original_payment_method, amount, original_reference)
+
+    async def void(self, payment_method, amount, reference):
+        """Coroutine form of PaymentSimulator.process_void"""
+        await self._processing(PaymentSimulator.VOID_PROCESSING_TIME)
+        return PaymentSimulator._settle_void(payment_method, amount, reference)
+
+    def submit_payment(self, payment_method, amount, reference=None):
+        """Start an authorization and return a Future for its result dict"""
+        return asyncio.run_coroutine_threadsafe(
+            self.authorize(payment_method, amount, reference), self.loop
+        )
+
+    def submit_refund(self, original_payment_method, amount, original_reference=None):
+        """Start a refund and return a Future for its result dict"""
+        return asyncio.run_coroutine_threadsafe(
+            self.refund(original_payment_method, amount, original_reference), self.loop
+        )
+
+    def submit_void(self, payment_method, amount, reference):
+        """Start voiding an authorization and return a Future for its result dict"""
+        return asyncio.run_coroutine_threadsafe(self.void(payment_method, amount, reference), self.loop)
+
+    def process_payment(self, payment_method, amount, reference=None):
+        """Blocking adapter: authorize and wait for the result"""
+        return self.submit_payment(payment_method, amount, reference).result()
+
+    def process_refund(self, original_payment_method, amount, original_reference=None):
+        """Blocking adapter: refund and wait for the result"""
+        return self.submit_refund(original_payment_method, amount, original_reference).result()
+
+    def process_void(self, payment_method, amount, reference):
+        """Blocking adapter: void an authorization and wait for the result"""
+        return self.submit_void(payment_method, amount, reference).result()
+
+    def shutdown(self):
+        """Stop the event loop; authorizations still in flight are abandoned"""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+
+    def stats(self):
+        """In-flight and completed request counters"""
+        return {
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'completed': self.completed,
+            'latency_scale': self.latency_scale
+        }
+
+
+def init_payment_gateway(app):
+    """Attach a payment gateway configured from app config"""
+    gateway = PaymentGateway(latency_scale=app.config.get('PAYMENT_LATENCY_SCALE', 1.0))
+    atexit.register(gateway.shutdown)
+    app.extensions['payment_gateway'] = gateway
+    return gateway
+
+
+def get_payment_gateway():
+    """Get the payment gateway of the current app"""
+    return current_app.extensions['payment_gateway']
@@ -1,6 +1,7 @@
 import random
 import time
 from datetime import datetime
+from utils.money import to_cents, to_amount
 
 
 class PaymentSimulator:
@@ -19,6 +20,8 @@ class PaymentSimulator:
         'card': 0.5,
         'upi': 0.7
     }
+    REFUND_PROCESSING_TIME = 0.3
+    VOID_PROCESSING_TIME = 0.2
     
     @staticmethod
     def process_payment(payment_method, amount, reference=None):
@@ -33,6 +36,18 @@ class PaymentSimulator:
         Returns:
             dict: Payment result with status, reference, and details
         """
+        failure = PaymentSimulator._check_request(payment_method, amount)
+        if failure:
+            return failure
+        
+        # Simulate processing time
+        time.sleep(PaymentSimulator.PROCESSING_TIMES[payment_method])
+        
+        return PaymentSimulator._settle_payment(payment_method, amount, reference)
+    
+    @staticmethod
+    def _check_request(payment_method, amount):
+        """Return a failed result for an unusable payment request, else None"""
         # Validate payment method
         if payment_method not in PaymentSimulator.SUCCESS_RATES:
             return {
@@ -52,11 +67,11 @@ class PaymentSimulator:
                 'reference': None,
                 'timestamp': datetime.utcnow().isoformat()
             }
-        
-        # Simulate processing time
-        processing_time = PaymentSimulator.PROCESSING_TIMES[payment_method]
-        time.sleep(processing_time)
-        
+        return None
+    
+    @staticmethod
+    def _settle_payment(payment_method, amount, reference=None):
+        """Decide the outcome of a validated payment once its processing time has passed"""
         # Determine success based on success rate
         success_rate = PaymentSimulator.SUCCESS_RATES[payment_method]
         is_successful = random.random() < success_rate
@@ -98,7 +113,10 @@ class PaymentSimulator:
         Returns:
             dict: Payment result with change calculation
         """
-        if amount_paid < total_amount:
+        paid_cents = to_cents(amount_paid)
+        due_cents = to_cents(total_amount)
+        
+        if paid_cents < due_cents:
             return {
                 'success': False,
                 'status': 'failed',
@@ -107,7 +125,7 @@ class PaymentSimulator:
                 'timestamp': datetime.utcnow().isoformat()
             }
         
-        change = amount_paid - total_amount
+        change = to_amount(paid_cents - due_cents)
         reference = PaymentSimulator._generate_reference('cash')
         
         return {
@@ -117,7 +135,7 @@ class PaymentSimulator:
             'reference': reference,
             'amount': total_amount,
             'amount_paid': amount_paid,
-            'change': round(change, 2),
+            'change': change,
             'timestamp': datetime.utcnow().isoformat()
         }
     
@@ -135,8 +153,13 @@ class PaymentSimulator:
             dict: Refund result
         """
         # Refunds have higher success rate
-        time.sleep(0.3)
+        time.sleep(PaymentSimulator.REFUND_PROCESSING_TIME)
         
+        return PaymentSimulator._settle_refund(original_payment_method, amount, original_reference)
+    
+    @staticmethod
+    def _settle_refund(original_payment_method, amount, original_reference=None):
+        """Build the result of a refund once its processing time has passed"""
         # Generate refund reference
         refund_reference = f"REF-{PaymentSimulator._generate_reference(original_payment_method)}"
         
@@ -150,6 +173,34 @@ class PaymentSimulator:
             'timestamp': datetime.utcnow().isoformat()
         }
     
+    @staticmethod
+    def process_void(payment_method, amount, reference):
+        """
+        Simulate voiding an approved authorization before it is captured
+        
+        Args:
+            payment_method: Payment method of the authorization
+            amount: Authorized amount
+            reference: Reference of the authorization
+        
+        Returns:
+            dict: Void result
+        """
+        time.sleep(PaymentSimulator.VOID_PROCESSING_TIME)
+        return PaymentSimulator._settle_void(payment_method, amount, reference)
+    
+    @staticmethod
+    def _settle_void(payment_method, amount, reference):
+        """Build the result of a void once its processing time has passed"""
+        return {
+            'success': True,
+            'status': 'voided',
+            'message': f'{payment_method.upper()} authorization voided',
+            'reference': reference,
+            'amount': amount,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+    
     @staticmethod
     def _generate_reference(payment_method):
         """Generate a unique payment reference"""
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from models.user import db
+from models.product import Product
+
+
+class ProductSnapshot:
+    """Read-only copy of a product row that can be shared between requests"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, product):
+        self.data = product.to_dict()
+
+    def __getattr__(self, name):
+        try:
+            return self.data[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def is_in_stock(self, quantity=1):
+        """Check if product had sufficient stock when it was cached"""
+        return self.stock_quantity >= quantity
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+class ProductCache:
+    """
+    Read-through LRU cache of products, looked up by barcode or by id
+
+    Entries expire after ttl seconds so stock read by one worker does not go
+    stale forever when another worker sells; writes in this worker should call
+    invalidate() right after commit. Checkout still re-checks stock in the
+    database, so a stale entry can only let an add-to-cart through early.
+    """
+
+    def __init__(self, max_size=5000, ttl=60):
+        self.max_size = max_size  # products, not keys
+        self.ttl = ttl
+        self._entries = OrderedDict()  # product id -> (expires_at, snapshot), in LRU order
+        self._barcodes = {}  # barcode -> product id of a cached entry
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _drop(self, product_id):
+        """Remove one product and its barcode alias (lock held)"""
+        entry = self._entries.pop(product_id, None)
+        if entry and self._barcodes.get(entry[1].barcode) == product_id:
+            del self._barcodes[entry[1].barcode]
+        return entry
+
+    def _lookup(self, product_id=None, barcode=None):
+        with self._lock:
+            if product_id is None:
+                product_id = self._barcodes.get(barcode)
+            entry = self._entries.get(product_id)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(product_id)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                self._drop(product_id)
+            self.misses += 1
+            return None
+
+    def _store(self, product):
+        snapshot = ProductSnapshot(product)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._drop(snapshot.id)
+            self._entries[snapshot.id] = (expires_at, snapshot)
+            self._barcodes[snapshot.barcode] = snapshot.id
+            while len(self._entries) > self.max_size:
+                # Evicts the product together with its barcode alias
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return snapshot
+
+    def get_by_barcode(self, barcode):
+        """Get product snapshot by barcode (active or not), or None"""
+        snapshot = self._lookup(barcode=barcode)
+        if snapshot is None:
+            product = Product.query.filter_by(barcode=barcode).first()
+            snapshot = self._store(product) if product else None
+        return snapshot
+
+    def get_by_id(self, product_id):
+        """Get product snapshot by id (active or not), or None"""
+        snapshot = self._lookup(int(product_id))
+        if snapshot is None:
+            product = db.session.get(Product, int(product_id))
+            snapshot = self._store(product) if product else None
+        return snapshot
+
+    def invalidate(self, product_id=None, barcode=None):
+        """Drop a product (and its barcode alias) from the cache"""
+        with self._lock:
+            if product_id:
+                self._drop(int(product_id))
+            if barcode in self._barcodes:
+                self._drop(self._barcodes[barcode])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._barcodes.clear()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0
+        }
+
+
+def init_product_cache(app):
+    """Attach a product cache sized from app config"""
+    cache = ProductCache(
+        max_size=app.config.get('PRODUCT_CACHE_SIZE', 5000),
+        ttl=app.config.get('PRODUCT_CACHE_TTL', 60)
+    )
+    app.extensions['product_cache'] = cache
+    return cache
+
+
+def get_product_cache():
+    """Get the product cache of the current app"""
+    return current_app.extensions['product_cache']
+
+
+def invalidate_products(product_ids):
+    """Drop several products from the current app's cache"""
+    cache = get_product_cache()
+    for product_id in product_ids:
+        cache.invalidate(product_id=product_id)
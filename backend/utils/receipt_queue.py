@@ -0,0 +1,160 @@
+import atexit
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app
+from models.user import db
+from models.transaction import Transaction
+from utils.pdf_generator import PDFGenerator
+from utils.metrics import record
+
+
+class ReceiptQueueFull(Exception):
+    """Raised when no more receipt jobs can be queued"""
+
+
+class ReceiptQueue:
+    """
+    Bounded pool of worker threads rendering receipt PDFs off the request path
+
+    Jobs are tracked by id so the client can poll for the finished file. At
+    most max_pending jobs wait at once; submit() raises ReceiptQueueFull
+    beyond that. With workers=0 receipts render inline in submit().
+    """
+
+    def __init__(self, render, workers=2, max_pending=100, keep_jobs=1000):
+        """
+        Args:
+            render: Callable taking a transaction id and returning the PDF path
+            workers: Number of worker threads (0 renders synchronously)
+            max_pending: Jobs allowed to wait for a worker
+            keep_jobs: Finished jobs remembered for polling
+        """
+        self.render = render
+        self.workers = workers
+        self.max_pending = max_pending
+        self.keep_jobs = keep_jobs
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = OrderedDict()  # job id -> job dict, oldest first
+        self._lock = threading.Lock()
+        self._threads = []
+        self.rejected = 0
+        for n in range(workers):
+            thread = threading.Thread(target=self._work, name=f'receipt-worker-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _remember(self, job):
+        with self._lock:
+            self._jobs[job['job_id']] = job
+            while len(self._jobs) > self.keep_jobs:
+                self._jobs.popitem(last=False)
+
+    def _run(self, job):
+        job['status'] = 'running'
+        start = time.perf_counter()
+        try:
+            job['path'] = self.render(job['transaction_id'])
+            job['status'] = 'done'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        job['render_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            self._run(job)
+            self._queue.task_done()
+
+    def submit(self, transaction_id):
+        """
+        Queue a receipt for a committed transaction
+
+        Returns:
+            dict: The job (job_id, status, transaction_id, path, error)
+
+        Raises:
+            ReceiptQueueFull: When max_pending jobs are already waiting
+        """
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'transaction_id': transaction_id,
+            'status': 'queued',
+            'path': None,
+            'error': None
+        }
+        if not self.workers:
+            self._run(job)
+            self._remember(job)
+            return job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise ReceiptQueueFull(f'{self.max_pending} receipts already waiting')
+        self._remember(job)
+        return job
+
+    def get(self, job_id):
+        """Return a copy of a job, or None if unknown or forgotten"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def join(self):
+        """Wait until every queued job has finished"""
+        if self.workers:
+            self._queue.join()
+
+    def shutdown(self):
+        """Finish queued jobs and stop the workers"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self):
+        """Queue depth and job counters"""
+        with self._lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+        return {
+            'workers': self.workers,
+            'pending': self._queue.qsize(),
+            'max_pending': self.max_pending,
+            'rejected': self.rejected,
+            **{status: statuses.count(status) for status in ('queued', 'running', 'done', 'failed')}
+        }
+
+
+def init_receipt_queue(app):
+    """Attach a receipt worker pool sized from app config"""
+    def render(transaction_id):
+        with app.app_context():
+            start = time.perf_counter()
+            try:
+                transaction = db.session.get(Transaction, transaction_id)
+                return PDFGenerator.generate_receipt(transaction, app.config['RECEIPT_DIR'])
+            finally:
+                db.session.remove()
+                record('receipt.render', (time.perf_counter() - start) * 1000)
+
+    receipt_queue = ReceiptQueue(
+        render,
+        workers=app.config.get('RECEIPT_WORKERS', 2),
+        max_pending=app.config.get('RECEIPT_QUEUE_SIZE', 100)
+    )
+    atexit.register(receipt_queue.shutdown)
+    app.extensions['receipt_queue'] = receipt_queue
+    return receipt_queue
+
+
+def get_receipt_queue():
+    """Get the receipt worker pool of the current app"""
+    return current_app.extensions['receipt_queue']
@@ -8,7 +8,41 @@ export const getCart = async () => {
   return response.data
 }
 
-export const addToCart = async (productId, barcode, quantity = 1) => {
+// Apply a cart_delta response to a locally held cart.
+// Returns null if the delta does not follow the local version (caller should refetch).
+export const applyCartDelta = (cart, delta) => {
+  if (!cart || cart.version === undefined || delta.version !== cart.version + 1) {
+    return null
+  }
+
+  const { changed, removed, ...totals } = delta
+  const removedIds = new Set(removed)
+  const changedById = new Map(changed.map(item => [item.cart_item_id, item]))
+
+  const items = cart.items
+    .filter(item => !removedIds.has(item.cart_item_id))
+    .map(item => changedById.get(item.cart_item_id) || item)
+  const existingIds = new Set(items.map(item => item.cart_item_id))
+  changed.forEach(item => {
+    if (!existingIds.has(item.cart_item_id)) items.push(item)
+  })
+
+  return { ...cart, ...totals, items }
+}
+
+// Mutation helpers: pass the current cart to receive a small delta instead of the whole cart.
+// The returned data always has a full `cart`, rebuilt locally or refetched if out of sync.
+const deltaHeaders = (currentCart) => (
+  currentCart ? { ...getAuthHeader(), 'X-Cart-Delta': '1' } : getAuthHeader()
+)
+
+const resolveCart = async (data, currentCart) => {
+  if (!data.cart_delta) return data
+  const cart = applyCartDelta(currentCart, data.cart_delta) || (await getCart()).cart
+  return { ...data, cart }
+}
+
+export const addToCart = async (productId, barcode, quantity = 1, currentCart = null) => {
   const body = {}
   if (productId) body.product_id = productId
   if (barcode) body.barcode = barcode
@@ -17,25 +51,35 @@ export const addToCart = async (productId, barcode, quantity = 1) => {
   const response = await axios.post(
     `${API_BASE_URL}/cart/add`,
     body,
-    { headers: getAuthHeader() }
+    { headers: deltaHeaders(currentCart) }
   )
-  return response.data
+  return resolveCart(response.data, currentCart)
+}
+
+// items: [{ barcode or product_id, quantity }]
+export const addBatchToCart = async (items, currentCart = null) => {
+  const response = await axios.post(
+    `${API_BASE_URL}/cart/add-batch`,
+    { items },
+    { headers: deltaHeaders(currentCart) }
+  )
+  return resolveCart(response.data, currentCart)
 }
 
-export const updateCartItem = async (cartItemId, quantity) => {
+export const updateCartItem = async (cartItemId, quantity, currentCart = null) => {
   const response = await axios.put(
     `${API_BASE_URL}/cart/update`,
     { cart_item_id: cartItemId, quantity },
-    { headers: getAuthHeader() }
+    { headers: deltaHeaders(currentCart) }
   )
-  return response.data
+  return resolveCart(response.data, currentCart)
 }
 
-export const removeFromCart = async (cartItemId) => {
+export const removeFromCart = async (cartItemId, currentCart = null) => {
   const response = await axios.delete(`${API_BASE_URL}/cart/remove/${cartItemId}`, {
-    headers: getAuthHeader()
+    headers: deltaHeaders(currentCart)
   })
-  return response.data
+  return resolveCart(response.data, currentCart)
 }
 
 export const clearCart = async () => {
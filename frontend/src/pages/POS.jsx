@@ -51,7 +51,7 @@ function POS({ user, onLogout }) {
 
   const handleAddToCart = async (product) => {
     try {
-      const data = await addToCart(product.id, null, 1)
+      const data = await addToCart(product.id, null, 1, cart)
       setCart(data.cart)
       setError('')
     } catch (err) {
@@ -62,7 +62,7 @@ function POS({ user, onLogout }) {
   const handleUpdateQuantity = async (cartItemId, quantity) => {
     if (quantity < 0) return
     try {
-      const data = await updateCartItem(cartItemId, quantity)
+      const data = await updateCartItem(cartItemId, quantity, cart)
       setCart(data.cart)
       setError('')
     } catch (err) {
@@ -72,7 +72,7 @@ function POS({ user, onLogout }) {
 
   const handleRemoveItem = async (cartItemId) => {
     try {
-      const data = await removeFromCart(cartItemId)
+      const data = await removeFromCart(cartItemId, cart)
       setCart(data.cart)
       setError('')
     } catch (err) {